@@ -0,0 +1,28 @@
+"""add index ordens_servico.created_at
+
+Revision ID: 20261018_idx_ordens_created_at
+Revises: 20261018_dashboard_stats
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261018_idx_ordens_created_at'
+down_revision = '20261018_dashboard_stats'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filtro de "mês atual" de /ordens/estatisticas (intervalo em created_at)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_ordens_servico_created_at
+        ON ordens_servico (created_at)
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_ordens_servico_created_at")
@@ -0,0 +1,47 @@
+"""add versao_calculo_financeiro to ordens_servico
+
+Revision ID: 20261018_snapshot_financeiro
+Revises: 20260415_enviar_relatorio
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261018_snapshot_financeiro'
+down_revision = '20260415_enviar_relatorio'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Versão da regra usada ao gravar valor_faturado (NULL = recalcular na leitura)
+    op.execute("""
+        ALTER TABLE ordens_servico
+        ADD COLUMN IF NOT EXISTS versao_calculo_financeiro INTEGER
+    """)
+
+    # Backfill das ordens cujo valor não depende de recalcular a taxa:
+    # taxa já gravada ou OS não concluída. As concluídas sem taxa gravada
+    # ficam para scripts/recalcular_valor_faturado_snapshot.py.
+    op.execute("""
+        UPDATE ordens_servico
+        SET valor_faturado = COALESCE(valor_total, 0)
+                - COALESCE(taxa_pagamento_aplicada, 0)
+                - COALESCE(valor_mao_obra_avulso, 0)
+                - COALESCE(valor_custo_pecas, 0),
+            taxa_pagamento_aplicada = COALESCE(taxa_pagamento_aplicada, 0),
+            versao_calculo_financeiro = 1
+        WHERE COALESCE(taxa_pagamento_aplicada, 0) > 0
+           OR UPPER(COALESCE(status, '')) NOT LIKE 'CONCLU%'
+           OR (forma_pagamento IS NULL AND formas_pagamento IS NULL)
+    """)
+
+
+def downgrade():
+    op.execute("""
+        ALTER TABLE ordens_servico
+        DROP COLUMN IF EXISTS versao_calculo_financeiro
+    """)
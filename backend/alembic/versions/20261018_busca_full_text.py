@@ -0,0 +1,103 @@
+"""colunas tsvector (portugues sem acento) para a busca global
+
+Revision ID: 20261018_busca_full_text
+Revises: 20261018_busca_trigram
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261018_busca_full_text'
+down_revision = '20261018_busca_trigram'
+branch_labels = None
+depends_on = None
+
+
+CONFIGURACAO = 'portugues_sem_acento'
+
+# tabela -> documento ponderado (A = identificação, B = descrição, C = observações).
+# Deve seguir os mesmos pesos documentados em services/busca_texto_service.py
+DOCUMENTOS = {
+    'ordens_servico': (
+        ('A', 'numero'),
+        ('B', 'descricao_servico'),
+        ('B', 'descricao_problema'),
+        ('C', 'observacoes'),
+    ),
+    'itens_ordem': (
+        ('B', 'descricao'),
+        ('C', 'observacoes'),
+    ),
+    'clientes': (
+        ('A', 'nome'),
+        ('A', 'nome_fantasia'),
+        ('A', 'razao_social'),
+        ('C', 'observacoes'),
+    ),
+    'veiculos': (
+        ('A', 'placa'),
+        ('B', 'marca'),
+        ('B', 'modelo'),
+        ('C', 'observacoes'),
+    ),
+    'produtos': (
+        ('A', 'codigo'),
+        ('A', 'nome'),
+        ('B', 'descricao'),
+        ('B', 'categoria'),
+    ),
+}
+
+
+def _documento(campos):
+    return ' || '.join(
+        f"setweight(to_tsvector('{CONFIGURACAO}', coalesce({coluna}, '')), '{peso}')"
+        for peso, coluna in campos
+    )
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS unaccent')
+
+    # Configuração portuguesa que remove acentos antes do stemming
+    op.execute(f"""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{CONFIGURACAO}') THEN
+                CREATE TEXT SEARCH CONFIGURATION {CONFIGURACAO} (COPY = pg_catalog.portuguese);
+                ALTER TEXT SEARCH CONFIGURATION {CONFIGURACAO}
+                    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+            END IF;
+        END
+        $$
+    """)
+
+    # Colunas geradas: preenchidas agora e mantidas pelo banco em cada escrita.
+    # Não são mapeadas no ORM para não trafegar o tsvector nas consultas comuns.
+    for tabela, campos in DOCUMENTOS.items():
+        op.execute(f"""
+            ALTER TABLE {tabela}
+            ADD COLUMN IF NOT EXISTS busca_tsv tsvector
+            GENERATED ALWAYS AS ({_documento(campos)}) STORED
+        """)
+        op.execute(f"""
+            CREATE INDEX IF NOT EXISTS ix_{tabela}_busca_tsv
+            ON {tabela} USING gin (busca_tsv)
+        """)
+
+    # Itens encontrados são agrupados por ordem
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_itens_ordem_ordem_id
+        ON itens_ordem (ordem_id)
+    """)
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_itens_ordem_ordem_id')
+    for tabela in reversed(list(DOCUMENTOS)):
+        op.execute(f'DROP INDEX IF EXISTS ix_{tabela}_busca_tsv')
+        op.execute(f'ALTER TABLE {tabela} DROP COLUMN IF EXISTS busca_tsv')
+    op.execute(f'DROP TEXT SEARCH CONFIGURATION IF EXISTS {CONFIGURACAO}')
@@ -0,0 +1,77 @@
+"""pg_trgm/unaccent e indices de trigramas para as buscas textuais
+
+Revision ID: 20261018_busca_trigram
+Revises: 20261018_placa_normalizada
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261018_busca_trigram'
+down_revision = '20261018_placa_normalizada'
+branch_labels = None
+depends_on = None
+
+
+# (índice, tabela, expressão) — as expressões precisam ser idênticas às de
+# services/busca_texto_service.py para que o planner use os índices
+INDICES_TRIGRAMA = (
+    ('ix_clientes_nome_trgm', 'clientes', 'f_unaccent(nome)'),
+    ('ix_clientes_nome_fantasia_trgm', 'clientes', 'f_unaccent(nome_fantasia)'),
+    ('ix_clientes_cpf_cnpj_trgm', 'clientes', 'cpf_cnpj'),
+    ('ix_clientes_email_trgm', 'clientes', 'email'),
+    ('ix_clientes_telefone_trgm', 'clientes', 'telefone'),
+    ('ix_clientes_telefone2_trgm', 'clientes', 'telefone2'),
+    ('ix_clientes_whatsapp_trgm', 'clientes', 'whatsapp'),
+    ('ix_veiculos_marca_trgm', 'veiculos', 'f_unaccent(marca)'),
+    ('ix_veiculos_modelo_trgm', 'veiculos', 'f_unaccent(modelo)'),
+    ('ix_veiculos_placa_normalizada_trgm', 'veiculos', 'placa_normalizada'),
+    ('ix_produtos_codigo_trgm', 'produtos', 'codigo'),
+    ('ix_produtos_nome_trgm', 'produtos', 'f_unaccent(nome)'),
+    ('ix_produtos_descricao_trgm', 'produtos', 'f_unaccent(descricao)'),
+    ('ix_fornecedores_nome_trgm', 'fornecedores', 'f_unaccent(nome)'),
+    ('ix_fornecedores_cnpj_trgm', 'fornecedores', 'cnpj'),
+    ('ix_fornecedores_email_trgm', 'fornecedores', 'email'),
+    ('ix_ordens_servico_numero_trgm', 'ordens_servico', 'numero'),
+)
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE EXTENSION IF NOT EXISTS unaccent')
+
+    # unaccent() é STABLE (depende do dicionário configurado); o wrapper com
+    # dicionário explícito pode ser IMMUTABLE e, portanto, indexado
+    op.execute("""
+        CREATE OR REPLACE FUNCTION f_unaccent(text)
+        RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+    """)
+
+    for nome, tabela, expressao in INDICES_TRIGRAMA:
+        op.execute(f"""
+            CREATE INDEX IF NOT EXISTS {nome}
+            ON {tabela} USING gin ({expressao} gin_trgm_ops)
+        """)
+
+    # Joins da busca de OS por nome do cliente e placa
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_ordens_servico_cliente_id
+        ON ordens_servico (cliente_id)
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_ordens_servico_veiculo_id
+        ON ordens_servico (veiculo_id)
+    """)
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_ordens_servico_veiculo_id')
+    op.execute('DROP INDEX IF EXISTS ix_ordens_servico_cliente_id')
+    for nome, _tabela, _expressao in reversed(INDICES_TRIGRAMA):
+        op.execute(f'DROP INDEX IF EXISTS {nome}')
+    op.execute('DROP FUNCTION IF EXISTS f_unaccent(text)')
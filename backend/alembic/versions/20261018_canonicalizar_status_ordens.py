@@ -0,0 +1,108 @@
+"""canonicalizar status de ordens_servico
+
+Revision ID: 20261018_status_canonico
+Revises: 20261018_idx_ordens_created_at
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from difflib import get_close_matches
+import re
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261018_status_canonico'
+down_revision = '20261018_idx_ordens_created_at'
+branch_labels = None
+depends_on = None
+
+
+STATUS_CANONICOS = (
+    'PENDENTE',
+    'EM_ANDAMENTO',
+    'AGUARDANDO_PECA',
+    'AGUARDANDO_APROVACAO',
+    'CONCLUIDA',
+    'CANCELADA',
+)
+
+# Variantes encontradas no banco (inclui valores legados e com acentuação corrompida)
+VARIANTES_LEGADAS = {
+    'ABERTA': 'PENDENTE',
+    'EMANDAMENTO': 'EM_ANDAMENTO',
+    'AGUARDANDOPEA': 'AGUARDANDO_PECA',
+    'AGUARDANDOAPROVAAO': 'AGUARDANDO_APROVACAO',
+    'CONCLUDA': 'CONCLUIDA',
+    'CONCLUADA': 'CONCLUIDA',
+}
+
+
+def _chave(valor):
+    valor_ascii = unicodedata.normalize('NFKD', valor)
+    valor_ascii = valor_ascii.encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^A-Z]+', '', valor_ascii.upper())
+
+
+def _status_canonico(valor):
+    if valor is None or not valor.strip():
+        return 'PENDENTE'
+
+    aliases = {_chave(status): status for status in STATUS_CANONICOS}
+    aliases.update(VARIANTES_LEGADAS)
+
+    chave = _chave(valor)
+    if chave in aliases:
+        return aliases[chave]
+
+    aproximado = get_close_matches(chave, aliases.keys(), n=1, cutoff=0.75)
+    if aproximado:
+        return aliases[aproximado[0]]
+    return None
+
+
+def upgrade():
+    conn = op.get_bind()
+
+    valores = [linha[0] for linha in conn.execute(sa.text('SELECT DISTINCT status FROM ordens_servico'))]
+    desconhecidos = []
+    for valor in valores:
+        canonico = _status_canonico(valor)
+        if canonico is None:
+            desconhecidos.append(valor)
+            continue
+        if valor == canonico:
+            continue
+        if valor is None:
+            conn.execute(sa.text("UPDATE ordens_servico SET status = :novo WHERE status IS NULL"), {'novo': canonico})
+        else:
+            conn.execute(
+                sa.text('UPDATE ordens_servico SET status = :novo WHERE status = :antigo'),
+                {'novo': canonico, 'antigo': valor},
+            )
+
+    if desconhecidos:
+        raise RuntimeError(
+            f'Status de OS sem correspondência canônica: {desconhecidos}. '
+            'Corrija esses registros manualmente e rode a migração novamente.'
+        )
+
+    op.execute("ALTER TABLE ordens_servico ALTER COLUMN status SET DEFAULT 'PENDENTE'")
+    op.execute('ALTER TABLE ordens_servico ALTER COLUMN status SET NOT NULL')
+    op.execute("""
+        ALTER TABLE ordens_servico
+        ADD CONSTRAINT ck_ordens_servico_status
+        CHECK (status IN ('PENDENTE', 'EM_ANDAMENTO', 'AGUARDANDO_PECA', 'AGUARDANDO_APROVACAO', 'CONCLUIDA', 'CANCELADA'))
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_ordens_servico_status
+        ON ordens_servico (status)
+    """)
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_ordens_servico_status')
+    op.execute('ALTER TABLE ordens_servico DROP CONSTRAINT IF EXISTS ck_ordens_servico_status')
+    op.execute('ALTER TABLE ordens_servico ALTER COLUMN status DROP NOT NULL')
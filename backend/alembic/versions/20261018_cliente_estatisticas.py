@@ -0,0 +1,42 @@
+"""projecao cliente_estatisticas para a ficha do cliente
+
+Revision ID: 20261018_cliente_estatisticas
+Revises: 20261018_veiculos_cliente_id
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261018_cliente_estatisticas'
+down_revision = '20261018_veiculos_cliente_id'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Uma linha por cliente, regravada quando uma OS dele é concluída, editada
+    # ou cancelada. Backfill: python scripts/reconstruir_estatisticas_clientes.py
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS cliente_estatisticas (
+            cliente_id INTEGER PRIMARY KEY REFERENCES clientes (id) ON DELETE CASCADE,
+            total_gasto NUMERIC(12, 2) DEFAULT 0,
+            total_servicos INTEGER DEFAULT 0,
+            total_visitas INTEGER DEFAULT 0,
+            ticket_medio NUMERIC(12, 2) DEFAULT 0,
+            frequencia_dias NUMERIC(8, 1),
+            primeira_visita TIMESTAMP WITH TIME ZONE,
+            ultima_visita TIMESTAMP WITH TIME ZONE,
+            ultima_ordem_id INTEGER REFERENCES ordens_servico (id) ON DELETE SET NULL,
+            ultima_ordem_numero VARCHAR(20),
+            top_servicos TEXT,
+            top_pecas TEXT,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+        )
+    """)
+
+
+def downgrade():
+    op.execute('DROP TABLE IF EXISTS cliente_estatisticas')
@@ -0,0 +1,40 @@
+"""colunas somente digitos para cpf_cnpj e telefones de clientes
+
+Revision ID: 20261018_clientes_digitos
+Revises: 20261018_idx_keyset
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261018_clientes_digitos'
+down_revision = '20261018_idx_keyset'
+branch_labels = None
+depends_on = None
+
+
+COLUNAS = ('cpf_cnpj', 'telefone', 'telefone2', 'whatsapp')
+
+
+def upgrade():
+    # Colunas geradas (STORED): o PostgreSQL preenche as linhas existentes ao
+    # adicioná-las e as mantém em sincronia em todo INSERT/UPDATE
+    for coluna in COLUNAS:
+        op.execute(f"""
+            ALTER TABLE clientes
+            ADD COLUMN IF NOT EXISTS {coluna}_digitos VARCHAR(20)
+            GENERATED ALWAYS AS (regexp_replace({coluna}, '[^0-9]', '', 'g')) STORED
+        """)
+        op.execute(f"""
+            CREATE INDEX IF NOT EXISTS ix_clientes_{coluna}_digitos
+            ON clientes ({coluna}_digitos)
+        """)
+
+
+def downgrade():
+    for coluna in reversed(COLUNAS):
+        op.execute(f"DROP INDEX IF EXISTS ix_clientes_{coluna}_digitos")
+        op.execute(f"ALTER TABLE clientes DROP COLUMN IF EXISTS {coluna}_digitos")
@@ -0,0 +1,73 @@
+"""consolidacao diaria em dashboard_stats
+
+Revision ID: 20261018_dashboard_stats
+Revises: 20261018_snapshot_financeiro
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261018_dashboard_stats'
+down_revision = '20261018_snapshot_financeiro'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Totais financeiros por dia usados pelo dashboard
+    op.execute("""
+        ALTER TABLE dashboard_stats
+        ADD COLUMN IF NOT EXISTS valor_total_vendas NUMERIC(12, 2) DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS vendas_servicos NUMERIC(12, 2) DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS vendas_pecas NUMERIC(12, 2) DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS descontos NUMERIC(12, 2) DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS custo_pecas NUMERIC(12, 2) DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS mao_obra_avulsa NUMERIC(12, 2) DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS receita_liquida NUMERIC(12, 2) DEFAULT 0
+    """)
+
+    # Itens de OS aceitam quantidade fracionada
+    op.execute("""
+        ALTER TABLE dashboard_stats
+        ALTER COLUMN pecas_vendidas TYPE NUMERIC(12, 3)
+    """)
+
+    # Um registro por dia (necessário para o upsert da consolidação)
+    op.execute("""
+        DELETE FROM dashboard_stats a
+        USING dashboard_stats b
+        WHERE a.data_referencia = b.data_referencia
+          AND a.id < b.id
+    """)
+    op.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS dashboard_stats_data_referencia_key
+        ON dashboard_stats (data_referencia)
+    """)
+
+    # Apoio ao filtro por data de conclusão usado na consolidação
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_ordens_servico_data_conclusao
+        ON ordens_servico (data_conclusao)
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_ordens_servico_data_conclusao")
+    op.execute("DROP INDEX IF EXISTS dashboard_stats_data_referencia_key")
+    op.execute("""
+        ALTER TABLE dashboard_stats
+        ALTER COLUMN pecas_vendidas TYPE INTEGER USING ROUND(pecas_vendidas)::INTEGER
+    """)
+    op.execute("""
+        ALTER TABLE dashboard_stats
+        DROP COLUMN IF EXISTS valor_total_vendas,
+        DROP COLUMN IF EXISTS vendas_servicos,
+        DROP COLUMN IF EXISTS vendas_pecas,
+        DROP COLUMN IF EXISTS descontos,
+        DROP COLUMN IF EXISTS custo_pecas,
+        DROP COLUMN IF EXISTS mao_obra_avulsa,
+        DROP COLUMN IF EXISTS receita_liquida
+    """)
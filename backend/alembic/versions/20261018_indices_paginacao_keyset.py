@@ -0,0 +1,44 @@
+"""indices para paginacao por cursor (keyset)
+
+Revision ID: 20261018_idx_keyset
+Revises: 20261018_seq_numero_ordem
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261018_idx_keyset'
+down_revision = '20261018_seq_numero_ordem'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Mesma ordem (chave, id) usada por services.paginacao_service: a página
+    # seguinte ao cursor é lida direto do índice, sem OFFSET nem sort
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_ordens_servico_data_abertura_id
+        ON ordens_servico (data_abertura DESC, id DESC)
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_movimentos_estoque_data_movimentacao_id
+        ON movimentos_estoque (data_movimentacao DESC, id DESC)
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_lotes_estoque_data_entrada_id
+        ON lotes_estoque (data_entrada DESC, id DESC)
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_compras_fornecedor_data_compra_id
+        ON compras_fornecedor (data_compra DESC, id DESC)
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_compras_fornecedor_data_compra_id")
+    op.execute("DROP INDEX IF EXISTS ix_lotes_estoque_data_entrada_id")
+    op.execute("DROP INDEX IF EXISTS ix_movimentos_estoque_data_movimentacao_id")
+    op.execute("DROP INDEX IF EXISTS ix_ordens_servico_data_abertura_id")
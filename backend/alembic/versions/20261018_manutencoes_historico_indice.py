@@ -0,0 +1,29 @@
+"""indice (veiculo_id, tipo, data) para a previsao vigente de manutencoes
+
+Revision ID: 20261018_manutencoes_indice
+Revises: 20261018_cliente_estatisticas
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261018_manutencoes_indice'
+down_revision = '20261018_cliente_estatisticas'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Mesma ordem do DISTINCT ON (veiculo_id, tipo) de services/manutencao_service.py:
+    # sugestões por veículo e lista de pendências da frota leem o índice em ordem
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_manutencoes_historico_veiculo_tipo_data
+        ON manutencoes_historico (veiculo_id, tipo, data_realizada DESC, km_realizada DESC, id DESC)
+    """)
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_manutencoes_historico_veiculo_tipo_data')
@@ -0,0 +1,37 @@
+"""sequence para numero de ordens_servico
+
+Revision ID: 20261018_seq_numero_ordem
+Revises: 20261018_status_canonico
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261018_seq_numero_ordem'
+down_revision = '20261018_status_canonico'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE SEQUENCE IF NOT EXISTS ordens_servico_numero_seq")
+
+    # Continuar a partir do maior número numérico já emitido (formato 00000001)
+    op.execute("""
+        SELECT setval(
+            'ordens_servico_numero_seq',
+            COALESCE((
+                SELECT MAX(numero::BIGINT)
+                FROM ordens_servico
+                WHERE numero ~ '^[0-9]+$'
+            ), 0) + 1,
+            false
+        )
+    """)
+
+
+def downgrade():
+    op.execute("DROP SEQUENCE IF EXISTS ordens_servico_numero_seq")
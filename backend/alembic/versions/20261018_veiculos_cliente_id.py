@@ -0,0 +1,28 @@
+"""indice em veiculos.cliente_id para as estatisticas da listagem de clientes
+
+Revision ID: 20261018_veiculos_cliente_id
+Revises: 20261018_busca_full_text
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261018_veiculos_cliente_id'
+down_revision = '20261018_busca_full_text'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Contagem de veículos ativos agrupada pelos clientes da página
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_veiculos_cliente_id
+        ON veiculos (cliente_id)
+    """)
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_veiculos_cliente_id')
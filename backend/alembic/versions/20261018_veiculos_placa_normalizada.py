@@ -0,0 +1,52 @@
+"""placa canonica (placa_normalizada) em veiculos
+
+Revision ID: 20261018_placa_normalizada
+Revises: 20261018_clientes_digitos
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261018_placa_normalizada'
+down_revision = '20261018_clientes_digitos'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+
+    # Coluna gerada: preenchida para as linhas existentes e mantida pelo banco
+    op.execute("""
+        ALTER TABLE veiculos
+        ADD COLUMN IF NOT EXISTS placa_normalizada VARCHAR(10)
+        GENERATED ALWAYS AS (NULLIF(regexp_replace(upper(placa), '[^A-Z0-9]', '', 'g'), '')) STORED
+    """)
+
+    duplicadas = conn.execute(sa.text("""
+        SELECT placa_normalizada, string_agg(id::TEXT || ':' || placa, ', ' ORDER BY id)
+        FROM veiculos
+        WHERE placa_normalizada IS NOT NULL
+        GROUP BY placa_normalizada
+        HAVING COUNT(*) > 1
+    """)).fetchall()
+    if duplicadas:
+        detalhes = '; '.join(f'{placa} -> {veiculos}' for placa, veiculos in duplicadas)
+        raise RuntimeError(
+            f'Placas duplicadas após normalização: {detalhes}. '
+            'Unifique esses veículos manualmente e rode a migração novamente.'
+        )
+
+    # text_pattern_ops atende igualdade e prefixo (LIKE 'ABC1%') pelo mesmo índice
+    op.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_veiculos_placa_normalizada
+        ON veiculos (placa_normalizada text_pattern_ops)
+    """)
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ux_veiculos_placa_normalizada')
+    op.execute('ALTER TABLE veiculos DROP COLUMN IF EXISTS placa_normalizada')
@@ -1,4 +1,4 @@
-﻿from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Numeric, Date, Float
+﻿from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Numeric, Date, Float, CheckConstraint, Sequence, Computed, Index
 from sqlalchemy.orm import relationship, foreign, synonym
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -14,6 +14,11 @@ class Cliente(Base):
     telefone = Column(String(20))
     telefone2 = Column(String(20))
     whatsapp = Column(String(20))
+    # Somente dígitos, gerados pelo banco: buscas por documento/telefone usam índice
+    cpf_cnpj_digitos = Column(String(20), Computed("regexp_replace(cpf_cnpj, '[^0-9]', '', 'g')", persisted=True), index=True)
+    telefone_digitos = Column(String(20), Computed("regexp_replace(telefone, '[^0-9]', '', 'g')", persisted=True), index=True)
+    telefone2_digitos = Column(String(20), Computed("regexp_replace(telefone2, '[^0-9]', '', 'g')", persisted=True), index=True)
+    whatsapp_digitos = Column(String(20), Computed("regexp_replace(whatsapp, '[^0-9]', '', 'g')", persisted=True), index=True)
     endereco = Column(String(500))
     numero = Column(String(20))
     complemento = Column(String(100))
@@ -39,14 +44,27 @@ class Cliente(Base):
 
 class Veiculo(Base):
     __tablename__ = "veiculos"
+    __table_args__ = (
+        Index(
+            "ux_veiculos_placa_normalizada",
+            "placa_normalizada",
+            unique=True,
+            postgresql_ops={"placa_normalizada": "text_pattern_ops"},
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    cliente_id = Column(Integer, ForeignKey("clientes.id"), nullable=False)
+    cliente_id = Column(Integer, ForeignKey("clientes.id"), nullable=False, index=True)
     marca = Column(String(100), nullable=False)
     modelo = Column(String(100), nullable=False)
     ano = Column(Integer, nullable=False)
     cor = Column(String(50))
     placa = Column(String(10), unique=True, index=True)
+    # Placa canônica gerada pelo banco (ver services.placa_service)
+    placa_normalizada = Column(
+        String(10),
+        Computed("NULLIF(regexp_replace(upper(placa), '[^A-Z0-9]', '', 'g'), '')", persisted=True)
+    )
     # Coluna no banco é 'chassis'
     chassis = Column(String(50), unique=True)
     renavam = Column(String(20))  # Adicionado
@@ -176,13 +194,22 @@ class Produto(Base):
     itens_ordem = relationship("ItemOrdem", back_populates="produto")
     lotes = relationship("LoteEstoque", back_populates="produto", foreign_keys="LoteEstoque.produto_id")
 
+# Numeração das OS (formatada com 8 dígitos em gerar_numero_ordem)
+NUMERO_ORDEM_SEQ = Sequence("ordens_servico_numero_seq", metadata=Base.metadata)
+
 class OrdemServico(Base):
     __tablename__ = "ordens_servico"
+    __table_args__ = (
+        CheckConstraint(
+            "status IN ('PENDENTE', 'EM_ANDAMENTO', 'AGUARDANDO_PECA', 'AGUARDANDO_APROVACAO', 'CONCLUIDA', 'CANCELADA')",
+            name="ck_ordens_servico_status",
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     numero = Column(String(20), unique=True, index=True)
-    cliente_id = Column(Integer, ForeignKey("clientes.id"), nullable=False)
-    veiculo_id = Column(Integer, ForeignKey("veiculos.id"), nullable=True)
+    cliente_id = Column(Integer, ForeignKey("clientes.id"), nullable=False, index=True)
+    veiculo_id = Column(Integer, ForeignKey("veiculos.id"), nullable=True, index=True)
     # Novos campos para o tipo de ordem
     tipo_ordem = Column(String(20), nullable=False, default="SERVICO")  # VENDA, SERVICO, VENDA_SERVICO
     # Campo para descrição detalhada do serviço (quando tipo for SERVICO ou VENDA_SERVICO)
@@ -190,7 +217,7 @@ class OrdemServico(Base):
     # Campos antigos mantidos para compatibilidade
     descricao_problema = Column(Text)  # Removido nullable=False para compatibilidade
     observacoes = Column(Text)
-    status = Column(String(30), default="PENDENTE")  # PENDENTE, EM_ANDAMENTO, AGUARDANDO_PECA, AGUARDANDO_APROVACAO, CONCLUIDA, CANCELADA
+    status = Column(String(30), nullable=False, default="PENDENTE", index=True)  # PENDENTE, EM_ANDAMENTO, AGUARDANDO_PECA, AGUARDANDO_APROVACAO, CONCLUIDA, CANCELADA
     prioridade = Column(String(20), default="MEDIA")  # BAIXA, MEDIA, ALTA, URGENTE
     # Colunas no banco possuem nomes diferentes (legado)
     # data_abertura no banco é do tipo DATE (legado)
@@ -226,8 +253,9 @@ class OrdemServico(Base):
     formas_pagamento = Column(Text)  # JSON com rateio de pagamentos
     taxa_pagamento_aplicada = Column(Numeric(10, 2), default=0)  # Valor da taxa já aplicada
     maquina_id = Column(Integer, ForeignKey("maquinas.id"), nullable=True)  # Máquina utilizada para a taxa
+    versao_calculo_financeiro = Column(Integer, nullable=True)  # Versão da regra usada ao gravar valor_faturado
     motivo_cancelamento = Column(Text)  # Motivo do cancelamento (quando status = CANCELADA)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relacionamentos
@@ -239,7 +267,7 @@ class ItemOrdem(Base):
     __tablename__ = "itens_ordem"
     
     id = Column(Integer, primary_key=True, index=True)
-    ordem_id = Column(Integer, ForeignKey("ordens_servico.id"), nullable=False)
+    ordem_id = Column(Integer, ForeignKey("ordens_servico.id"), nullable=False, index=True)
     produto_id = Column(Integer, ForeignKey("produtos.id"))  # Para produtos/peças
     descricao = Column(String(255), nullable=False)
     quantidade = Column(Numeric(10, 3), default=1)
@@ -348,26 +376,61 @@ class ManutencaoHistorico(Base):
     veiculo = relationship("Veiculo")
     ordem_servico = relationship("OrdemServico")
 
+# Previsão vigente de cada tipo por veículo (DISTINCT ON em services/manutencao_service.py)
+Index(
+    "ix_manutencoes_historico_veiculo_tipo_data",
+    ManutencaoHistorico.veiculo_id,
+    ManutencaoHistorico.tipo,
+    ManutencaoHistorico.data_realizada.desc(),
+    ManutencaoHistorico.km_realizada.desc(),
+    ManutencaoHistorico.id.desc(),
+)
+
 # Modelo para dados do Dashboard
 class DashboardStats(Base):
     __tablename__ = "dashboard_stats"
     
     id = Column(Integer, primary_key=True, index=True)
-    data_referencia = Column(Date, nullable=False)
+    data_referencia = Column(Date, nullable=False, unique=True)  # Um registro consolidado por dia
     total_clientes = Column(Integer, default=0)
     total_veiculos = Column(Integer, default=0)
     total_pecas_estoque = Column(Integer, default=0)
     ordens_abertas = Column(Integer, default=0)
-    ordens_hoje = Column(Integer, default=0)
-    receita_mensal = Column(Numeric(12, 2), default=0)
-    receita_diaria = Column(Numeric(10, 2), default=0)
+    ordens_hoje = Column(Integer, default=0)  # OS concluídas no dia
+    receita_mensal = Column(Numeric(12, 2), default=0)  # Receita bruta do mês até o dia
+    receita_diaria = Column(Numeric(10, 2), default=0)  # Receita bruta (Valor Cliente) das OS concluídas no dia
     crescimento_mensal = Column(Numeric(5, 2), default=0)
     servicos_realizados = Column(Integer, default=0)
-    pecas_vendidas = Column(Integer, default=0)
+    pecas_vendidas = Column(Numeric(12, 3), default=0)
     alertas_estoque = Column(Integer, default=0)
+    valor_total_vendas = Column(Numeric(12, 2), default=0)
+    vendas_servicos = Column(Numeric(12, 2), default=0)  # Serviços líquidos de desconto
+    vendas_pecas = Column(Numeric(12, 2), default=0)  # Peças líquidas de desconto
+    descontos = Column(Numeric(12, 2), default=0)
+    custo_pecas = Column(Numeric(12, 2), default=0)
+    mao_obra_avulsa = Column(Numeric(12, 2), default=0)
+    receita_liquida = Column(Numeric(12, 2), default=0)  # Soma do valor_faturado
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+# Projeção das estatísticas de cada cliente (OS concluídas), lida pela ficha do cliente
+class ClienteEstatistica(Base):
+    __tablename__ = "cliente_estatisticas"
+
+    cliente_id = Column(Integer, ForeignKey("clientes.id", ondelete="CASCADE"), primary_key=True)
+    total_gasto = Column(Numeric(12, 2), default=0)  # Somente valor de serviço (mesma regra da listagem)
+    total_servicos = Column(Integer, default=0)  # OS concluídas dos tipos SERVICO/VENDA_SERVICO
+    total_visitas = Column(Integer, default=0)  # Todas as OS concluídas
+    ticket_medio = Column(Numeric(12, 2), default=0)  # total_gasto / total_servicos
+    frequencia_dias = Column(Numeric(8, 1))  # Intervalo médio entre visitas
+    primeira_visita = Column(DateTime(timezone=True))
+    ultima_visita = Column(DateTime(timezone=True))
+    ultima_ordem_id = Column(Integer, ForeignKey("ordens_servico.id", ondelete="SET NULL"))
+    ultima_ordem_numero = Column(String(20))
+    top_servicos = Column(Text)  # JSON: [{descricao, quantidade, valor_total}]
+    top_pecas = Column(Text)  # JSON: [{descricao, quantidade, valor_total}]
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class Configuracao(Base):
     __tablename__ = "configuracoes"
     
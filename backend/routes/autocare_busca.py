@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from typing import Optional
+import logging
+from db import get_db
+from schemas.schemas_busca import BuscaGlobalResponse
+from services.busca_texto_service import LIMITE_BUSCA_GLOBAL, TIPOS_BUSCA_GLOBAL, buscar_global
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+@router.get("/", response_model=BuscaGlobalResponse)
+def busca_global(
+    q: str = Query(..., min_length=2, description="Termos da busca (aceita \"frase exata\", OR e -exclusão)"),
+    tipos: Optional[str] = Query(None, description="Tipos separados por vírgula: ordens, clientes, veiculos, produtos"),
+    limit: int = Query(20, ge=1, le=LIMITE_BUSCA_GLOBAL),
+    db: Session = Depends(get_db)
+):
+    """Busca full-text em ordens (inclusive itens), clientes, veículos e produtos, ordenada por relevância"""
+    termo = q.strip()
+    if tipos:
+        tipos_pedidos = [tipo.strip().lower() for tipo in tipos.split(",") if tipo.strip()]
+        invalidos = [tipo for tipo in tipos_pedidos if tipo not in TIPOS_BUSCA_GLOBAL]
+        if invalidos:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Tipos inválidos: {', '.join(invalidos)}. Use: {', '.join(TIPOS_BUSCA_GLOBAL)}"
+            )
+    else:
+        tipos_pedidos = list(TIPOS_BUSCA_GLOBAL)
+
+    try:
+        resultados = buscar_global(db, termo, tipos_pedidos, limit)
+    except Exception as e:
+        logger.error(f"Erro na busca global por '{termo}': {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Erro ao executar a busca"
+        )
+
+    return {"termo": termo, "resultados": resultados}
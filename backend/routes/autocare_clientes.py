@@ -1,9 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import case, or_
 from typing import List, Optional
 from db import get_db
-from models.autocare_models import Cliente, Veiculo, OrdemServico
+from models.autocare_models import Cliente, Veiculo
+from services.busca_texto_service import filtro_busca_clientes
+from services.estatisticas_cliente_service import EstatisticasCliente, carregar_estatisticas_cliente, estatisticas_por_cliente
+from services.cache_service import TAG_CLIENTES, TTL_TOTAL_LISTAGEM_SEGUNDOS, invalidar_cache, obter_ou_calcular
+from services.paginacao_service import paginar_com_total, proximo_cursor
 from schemas.schemas_cliente import (
     ClienteCreate,
     ClienteUpdate,
@@ -14,6 +18,42 @@ from schemas.schemas_veiculo import VeiculoList
 
 router = APIRouter()
 
+
+def cliente_com_estatisticas(cliente: Cliente, estatisticas: Optional[EstatisticasCliente]) -> dict:
+    estatisticas = estatisticas or EstatisticasCliente()
+    return {
+        "id": cliente.id,
+        "nome": cliente.nome,
+        "cpf_cnpj": cliente.cpf_cnpj,
+        "email": cliente.email,
+        "telefone": cliente.telefone,
+        "telefone2": cliente.telefone2,
+        "whatsapp": cliente.whatsapp,
+        "endereco": cliente.endereco,
+        "numero": cliente.numero,
+        "complemento": cliente.complemento,
+        "bairro": cliente.bairro,
+        "cidade": cliente.cidade,
+        "estado": cliente.estado,
+        "cep": cliente.cep,
+        "rg_ie": cliente.rg_ie,
+        "observacoes": cliente.observacoes,
+        "tipo": cliente.tipo,
+        "nome_fantasia": cliente.nome_fantasia,
+        "razao_social": cliente.razao_social,
+        "contato_responsavel": cliente.contato_responsavel,
+        "data_nascimento": cliente.data_nascimento,
+        "enviar_relatorio_email": cliente.enviar_relatorio_email,
+        "ativo": cliente.ativo,
+        "created_at": cliente.created_at,
+        "updated_at": cliente.updated_at,
+        "total_gasto": estatisticas.total_gasto,
+        "total_servicos": estatisticas.total_servicos,
+        "veiculos_count": estatisticas.veiculos_count,
+        "ultima_visita": estatisticas.ultima_visita
+    }
+
+
 @router.get("/", response_model=List[ClienteList])
 def listar_clientes(
     response: Response,
@@ -25,21 +65,10 @@ def listar_clientes(
     db: Session = Depends(get_db)
 ):
     """Listar clientes com filtros opcionais e estatísticas calculadas"""
-    from sqlalchemy import extract
-    from datetime import datetime, timedelta
-    from models.autocare_models import OrdemServico
-    
     query = db.query(Cliente)
     
     if search:
-        query = query.filter(
-            Cliente.nome.ilike(f"%{search}%") |
-            Cliente.cpf_cnpj.ilike(f"%{search}%") |
-            Cliente.email.ilike(f"%{search}%") |
-            Cliente.telefone.ilike(f"%{search}%") |
-            Cliente.telefone2.ilike(f"%{search}%") |
-            Cliente.whatsapp.ilike(f"%{search}%")
-        )
+        query = query.filter(filtro_busca_clientes(search))
     
     # Se não for informado o parâmetro `ativo`, por padrão retornamos apenas
     # clientes ativos (soft-delete = marcar `ativo = False`). Se o caller
@@ -68,110 +97,9 @@ def listar_clientes(
     except Exception:
         pass
 
-    clientes_com_stats = []
-    for cliente in clientes:
-        # Calcular total gasto baseado no período
-        now = datetime.now()
-        if periodo == "M":  # Mensal
-            data_inicio = now.replace(day=1)
-        elif periodo == "A":  # Anual
-            data_inicio = now.replace(month=1, day=1)
-        else:  # Total
-            data_inicio = None
-        
-        # Query base para ordens concluídas do cliente
-        ordens_query = db.query(OrdemServico).filter(
-            OrdemServico.cliente_id == cliente.id,
-            OrdemServico.status == 'CONCLUIDA'
-        )
-        
-        if data_inicio:
-            ordens_query = ordens_query.filter(OrdemServico.data_conclusao >= data_inicio)
-        
-        ordens = ordens_query.all()
-
-        # Regras de negócio:
-        # - Serviços: considerar apenas ordens dos tipos 'SERVICO' e 'VENDA_SERVICO'.
-        # - Total Gasto exibido nos clientes: somar SOMENTE o valor do serviço
-        #   (ex.: em 'VENDA_SERVICO' desconsiderar o valor de produtos/peças).
-        #   Para robustez, usamos na ordem: valor_servico > valor_mao_obra >
-        #   (valor_total - valor_pecas) > soma dos itens de tipo 'SERVICO'.
-        def valor_servico_da_os(os: OrdemServico) -> float:
-            try:
-                if os.tipo_ordem not in ('SERVICO', 'VENDA_SERVICO'):
-                    return 0.0
-                # valor_servico explícito
-                if os.valor_servico is not None and float(os.valor_servico) > 0:
-                    return float(os.valor_servico)
-                # valor_mao_obra legado
-                if os.valor_mao_obra is not None and float(os.valor_mao_obra) > 0:
-                    return float(os.valor_mao_obra)
-                # tentar derivar: total - pecas
-                if os.valor_total is not None and os.valor_pecas is not None:
-                    vt = float(os.valor_total or 0)
-                    vp = float(os.valor_pecas or 0)
-                    if vt - vp > 0:
-                        return vt - vp
-                # fallback: somar itens de serviço
-                if hasattr(os, 'itens') and os.itens:
-                    soma = 0.0
-                    for it in os.itens:
-                        try:
-                            if getattr(it, 'tipo', None) == 'SERVICO':
-                                soma += float(it.valor_total or 0)
-                        except Exception:
-                            continue
-                    return soma
-            except Exception:
-                pass
-            return 0.0
-
-        total_gasto = sum(valor_servico_da_os(os) for os in ordens)
-
-        # Calcular total de serviços no período (apenas OS com serviço)
-        total_servicos = sum(1 for os in ordens if os.tipo_ordem in ('SERVICO', 'VENDA_SERVICO'))
-        
-        # Calcular quantidade de veículos
-        veiculos_count = db.query(Veiculo).filter(
-            Veiculo.cliente_id == cliente.id,
-            Veiculo.ativo == True
-        ).count()
-        
-        # Converter para dict e adicionar estatísticas
-        cliente_dict = {
-            "id": cliente.id,
-            "nome": cliente.nome,
-            "cpf_cnpj": cliente.cpf_cnpj,
-            "email": cliente.email,
-            "telefone": cliente.telefone,
-            "telefone2": cliente.telefone2,
-            "whatsapp": cliente.whatsapp,
-            "endereco": cliente.endereco,
-            "numero": cliente.numero,
-            "complemento": cliente.complemento,
-            "bairro": cliente.bairro,
-            "cidade": cliente.cidade,
-            "estado": cliente.estado,
-            "cep": cliente.cep,
-            "rg_ie": cliente.rg_ie,
-            "observacoes": cliente.observacoes,
-            "tipo": cliente.tipo,
-            "nome_fantasia": cliente.nome_fantasia,
-            "razao_social": cliente.razao_social,
-            "contato_responsavel": cliente.contato_responsavel,
-            "data_nascimento": cliente.data_nascimento,
-            "enviar_relatorio_email": cliente.enviar_relatorio_email,
-            "ativo": cliente.ativo,
-            "created_at": cliente.created_at,
-            "updated_at": cliente.updated_at,
-            "total_gasto": total_gasto,
-            "total_servicos": total_servicos,
-            "veiculos_count": veiculos_count
-        }
-        
-        clientes_com_stats.append(cliente_dict)
-    
-    return clientes_com_stats
+    # Estatísticas da página inteira numa única consulta agrupada
+    estatisticas = estatisticas_por_cliente(db, [cliente.id for cliente in clientes], periodo)
+    return [cliente_com_estatisticas(cliente, estatisticas.get(cliente.id)) for cliente in clientes]
 
 
 @router.get("/paginado")
@@ -179,6 +107,7 @@ def listar_clientes_paginado(
     response: Response,
     page: int = 1,
     page_size: int = 20,
+    after: Optional[str] = None,
     search: Optional[str] = None,
     tipo: Optional[str] = None,
     ativo: Optional[bool] = None,
@@ -186,20 +115,10 @@ def listar_clientes_paginado(
     db: Session = Depends(get_db)
 ):
     """Listar clientes com paginação e busca server-side para melhor performance."""
-    from datetime import datetime
-
     query = db.query(Cliente)
 
     if search:
-        query = query.filter(
-            Cliente.nome.ilike(f"%{search}%") |
-            Cliente.cpf_cnpj.ilike(f"%{search}%") |
-            Cliente.email.ilike(f"%{search}%") |
-            Cliente.telefone.ilike(f"%{search}%") |
-            Cliente.telefone2.ilike(f"%{search}%") |
-            Cliente.whatsapp.ilike(f"%{search}%") |
-            Cliente.nome_fantasia.ilike(f"%{search}%")
-        )
+        query = query.filter(filtro_busca_clientes(search))
 
     if tipo in ("PF", "PJ"):
         query = query.filter(Cliente.tipo == tipo)
@@ -209,12 +128,20 @@ def listar_clientes_paginado(
     else:
         query = query.filter(Cliente.ativo == ativo)
 
-    total = query.count()
     page = max(1, page)
     page_size = max(1, min(page_size, 100))
-    skip = (page - 1) * page_size
+    filtrado = bool(search) or tipo in ("PF", "PJ") or ativo is False
+
+    # Listagem padrão (clientes ativos): total em cache, invalidado a cada escrita de cliente
+    def total_sem_filtros():
+        total = obter_ou_calcular(
+            "clientes_total", {}, [TAG_CLIENTES], query.count, ttl=TTL_TOTAL_LISTAGEM_SEGUNDOS
+        )
+        return total, True
 
-    clientes = query.order_by(Cliente.id.desc()).offset(skip).limit(page_size).all()
+    pagina = paginar_com_total(query, page, page_size, after, None, Cliente.id, filtrado, total_sem_filtros)
+    clientes = pagina.itens
+    total = pagina.total
 
     try:
         response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
@@ -224,99 +151,19 @@ def listar_clientes_paginado(
     except Exception:
         pass
 
-    clientes_com_stats = []
-    for cliente in clientes:
-        now = datetime.now()
-        if periodo == "M":
-            data_inicio = now.replace(day=1)
-        elif periodo == "A":
-            data_inicio = now.replace(month=1, day=1)
-        else:
-            data_inicio = None
-
-        ordens_query = db.query(OrdemServico).filter(
-            OrdemServico.cliente_id == cliente.id,
-            OrdemServico.status == 'CONCLUIDA'
-        )
-
-        if data_inicio:
-            ordens_query = ordens_query.filter(OrdemServico.data_conclusao >= data_inicio)
-
-        ordens = ordens_query.all()
-
-        def valor_servico_da_os(os: OrdemServico) -> float:
-            try:
-                if os.tipo_ordem not in ('SERVICO', 'VENDA_SERVICO'):
-                    return 0.0
-                if os.valor_servico is not None and float(os.valor_servico) > 0:
-                    return float(os.valor_servico)
-                if os.valor_mao_obra is not None and float(os.valor_mao_obra) > 0:
-                    return float(os.valor_mao_obra)
-                if os.valor_total is not None and os.valor_pecas is not None:
-                    vt = float(os.valor_total or 0)
-                    vp = float(os.valor_pecas or 0)
-                    if vt - vp > 0:
-                        return vt - vp
-                if hasattr(os, 'itens') and os.itens:
-                    soma = 0.0
-                    for it in os.itens:
-                        try:
-                            if getattr(it, 'tipo', None) == 'SERVICO':
-                                soma += float(it.valor_total or 0)
-                        except Exception:
-                            continue
-                    return soma
-            except Exception:
-                pass
-            return 0.0
-
-        total_gasto = sum(valor_servico_da_os(os) for os in ordens)
-        total_servicos = sum(1 for os in ordens if os.tipo_ordem in ('SERVICO', 'VENDA_SERVICO'))
-
-        veiculos_count = db.query(Veiculo).filter(
-            Veiculo.cliente_id == cliente.id,
-            Veiculo.ativo == True
-        ).count()
-
-        clientes_com_stats.append({
-            "id": cliente.id,
-            "nome": cliente.nome,
-            "cpf_cnpj": cliente.cpf_cnpj,
-            "email": cliente.email,
-            "telefone": cliente.telefone,
-            "telefone2": cliente.telefone2,
-            "whatsapp": cliente.whatsapp,
-            "endereco": cliente.endereco,
-            "numero": cliente.numero,
-            "complemento": cliente.complemento,
-            "bairro": cliente.bairro,
-            "cidade": cliente.cidade,
-            "estado": cliente.estado,
-            "cep": cliente.cep,
-            "rg_ie": cliente.rg_ie,
-            "observacoes": cliente.observacoes,
-            "tipo": cliente.tipo,
-            "nome_fantasia": cliente.nome_fantasia,
-            "razao_social": cliente.razao_social,
-            "contato_responsavel": cliente.contato_responsavel,
-            "data_nascimento": cliente.data_nascimento,
-            "enviar_relatorio_email": cliente.enviar_relatorio_email,
-            "ativo": cliente.ativo,
-            "created_at": cliente.created_at,
-            "updated_at": cliente.updated_at,
-            "total_gasto": total_gasto,
-            "total_servicos": total_servicos,
-            "veiculos_count": veiculos_count
-        })
+    estatisticas = estatisticas_por_cliente(db, [cliente.id for cliente in clientes], periodo)
+    clientes_com_stats = [cliente_com_estatisticas(cliente, estatisticas.get(cliente.id)) for cliente in clientes]
 
     total_pages = (total + page_size - 1) // page_size if total > 0 else 1
 
     return {
         "items": clientes_com_stats,
         "total": total,
+        "total_exato": pagina.total_exato,
         "page": page,
         "page_size": page_size,
-        "total_pages": total_pages
+        "total_pages": total_pages,
+        "next_cursor": proximo_cursor(clientes, page_size, lambda cliente: (cliente.id,))
     }
 
 @router.get("/buscar-cpf-cnpj/{cpf_cnpj}")
@@ -326,7 +173,7 @@ def buscar_cliente_por_cpf_cnpj(cpf_cnpj: str, db: Session = Depends(get_db)):
     cpf_cnpj_limpo = ''.join(filter(str.isdigit, cpf_cnpj))
     
     cliente = db.query(Cliente).filter(
-        func.regexp_replace(Cliente.cpf_cnpj, '[^0-9]', '', 'g') == cpf_cnpj_limpo
+        Cliente.cpf_cnpj_digitos == cpf_cnpj_limpo
     ).first()
     
     if not cliente:
@@ -354,22 +201,23 @@ def buscar_cliente_por_telefone(telefone: str, db: Session = Depends(get_db)):
     # Normalizar para somente dígitos
     telefone_limpo = ''.join(filter(str.isdigit, telefone))
 
-    # Procurar em telefone, telefone2 ou whatsapp (normalizando os campos no banco)
+    # Procurar em telefone, telefone2 ou whatsapp (colunas de dígitos indexadas),
+    # numa única consulta, preferindo o telefone principal
     cliente = db.query(Cliente).filter(
-        func.regexp_replace(Cliente.telefone, '[^0-9]', '', 'g') == telefone_limpo
+        or_(
+            Cliente.telefone_digitos == telefone_limpo,
+            Cliente.telefone2_digitos == telefone_limpo,
+            Cliente.whatsapp_digitos == telefone_limpo
+        )
+    ).order_by(
+        case(
+            (Cliente.telefone_digitos == telefone_limpo, 0),
+            (Cliente.telefone2_digitos == telefone_limpo, 1),
+            else_=2
+        ),
+        Cliente.id
     ).first()
 
-    if not cliente:
-        # tentar nas outras colunas
-        cliente = db.query(Cliente).filter(
-            func.regexp_replace(Cliente.telefone2, '[^0-9]', '', 'g') == telefone_limpo
-        ).first()
-
-    if not cliente:
-        cliente = db.query(Cliente).filter(
-            func.regexp_replace(Cliente.whatsapp, '[^0-9]', '', 'g') == telefone_limpo
-        ).first()
-
     if not cliente:
         return {
             "encontrado": False,
@@ -409,7 +257,7 @@ def criar_cliente(cliente_data: ClienteCreate, db: Session = Depends(get_db)):
     if cliente_data.cpf_cnpj:
         cpf_cnpj_limpo = ''.join(filter(str.isdigit, cliente_data.cpf_cnpj))
         existing = db.query(Cliente).filter(
-            func.regexp_replace(Cliente.cpf_cnpj, '[^0-9]', '', 'g') == cpf_cnpj_limpo
+            Cliente.cpf_cnpj_digitos == cpf_cnpj_limpo
         ).first()
         if existing:
             # Retornamos detalhe com o id do cliente existente e status ativo para
@@ -435,6 +283,7 @@ def criar_cliente(cliente_data: ClienteCreate, db: Session = Depends(get_db)):
     cliente = Cliente(**cliente_data.dict())
     db.add(cliente)
     db.commit()
+    invalidar_cache(TAG_CLIENTES)
     db.refresh(cliente)
     return cliente
 
@@ -456,7 +305,7 @@ def atualizar_cliente(
     if cliente_data.cpf_cnpj:
         cpf_cnpj_limpo = ''.join(filter(str.isdigit, cliente_data.cpf_cnpj))
         existing = db.query(Cliente).filter(
-            func.regexp_replace(Cliente.cpf_cnpj, '[^0-9]', '', 'g') == cpf_cnpj_limpo,
+            Cliente.cpf_cnpj_digitos == cpf_cnpj_limpo,
             Cliente.id != cliente_id
         ).first()
         if existing:
@@ -492,6 +341,7 @@ def atualizar_cliente(
         setattr(cliente, field, all_data.get(field))
     
     db.commit()
+    invalidar_cache(TAG_CLIENTES)
     db.refresh(cliente)
     return cliente
 
@@ -507,6 +357,7 @@ def deletar_cliente(cliente_id: int, db: Session = Depends(get_db)):
 
     cliente.ativo = False
     db.commit()
+    invalidar_cache(TAG_CLIENTES)
     db.refresh(cliente)
     # Retorna o cliente atualizado (com `ativo = False`) para que o frontend possa
     # validar imediatamente o resultado da operação.
@@ -524,6 +375,7 @@ def reativar_cliente(cliente_id: int, db: Session = Depends(get_db)):
     
     cliente.ativo = True
     db.commit()
+    invalidar_cache(TAG_CLIENTES)
     return {"message": "Cliente reativado com sucesso"}
 
 
@@ -555,71 +407,49 @@ def obter_estatisticas_cliente(
     
     now = datetime.now()
     if periodo == "M":  # Mensal
-        data_inicio = now.replace(day=1)
         periodo_desc = f"Setembro {now.year}"
     elif periodo == "A":  # Anual
-        data_inicio = now.replace(month=1, day=1)
         periodo_desc = f"Ano {now.year}"
     else:  # Total
-        data_inicio = None
         periodo_desc = "Total"
-    
-    # Query base para ordens concluídas do cliente
-    ordens_query = db.query(OrdemServico).filter(
-        OrdemServico.cliente_id == cliente_id,
-        OrdemServico.status == 'CONCLUIDA'
-    )
-    
-    if data_inicio:
-        ordens_query = ordens_query.filter(OrdemServico.data_conclusao >= data_inicio)
-    
-    ordens = ordens_query.all()
-
-    # Mesmas regras de negócio da listagem de clientes
-    def valor_servico_da_os(os: OrdemServico) -> float:
-        try:
-            if os.tipo_ordem not in ('SERVICO', 'VENDA_SERVICO'):
-                return 0.0
-            if os.valor_servico is not None and float(os.valor_servico) > 0:
-                return float(os.valor_servico)
-            if os.valor_mao_obra is not None and float(os.valor_mao_obra) > 0:
-                return float(os.valor_mao_obra)
-            if os.valor_total is not None and os.valor_pecas is not None:
-                vt = float(os.valor_total or 0)
-                vp = float(os.valor_pecas or 0)
-                if vt - vp > 0:
-                    return vt - vp
-            if hasattr(os, 'itens') and os.itens:
-                soma = 0.0
-                for it in os.itens:
-                    try:
-                        if getattr(it, 'tipo', None) == 'SERVICO':
-                            soma += float(it.valor_total or 0)
-                    except Exception:
-                        continue
-                return soma
-        except Exception:
-            pass
-        return 0.0
-
-    total_gasto = sum(valor_servico_da_os(os) for os in ordens)
-    
-    # Total de serviços no período: apenas OS com serviço
-    total_servicos = sum(1 for os in ordens if os.tipo_ordem in ('SERVICO', 'VENDA_SERVICO'))
-    
-    # Calcular quantidade de veículos ativos
-    veiculos_count = db.query(Veiculo).filter(
-        Veiculo.cliente_id == cliente_id,
-        Veiculo.ativo == True
-    ).count()
-    
+
+    # Projeção mantida a cada OS concluída/editada/cancelada (histórico completo)
+    estatisticas = carregar_estatisticas_cliente(db, cliente_id)
+    total_gasto = float(estatisticas["total_gasto"] or 0)
+    total_servicos = estatisticas["total_servicos"] or 0
+
+    # Recorte anual/mensal: mesma regra, agregada no banco só para o período
+    if periodo in ("A", "M"):
+        do_periodo = estatisticas_por_cliente(db, [cliente_id], periodo).get(cliente_id, EstatisticasCliente())
+        total_gasto = do_periodo.total_gasto
+        total_servicos = do_periodo.total_servicos
+
+    ultima_ordem = None
+    if estatisticas["ultima_ordem_id"]:
+        ultima_ordem = {
+            "id": estatisticas["ultima_ordem_id"],
+            "numero": estatisticas["ultima_ordem_numero"],
+            "data_conclusao": estatisticas["ultima_visita"],
+        }
+    frequencia_dias = estatisticas["frequencia_dias"]
+
     return {
         "cliente_id": cliente_id,
         "periodo": periodo,
         "periodo_desc": periodo_desc,
         "total_gasto": total_gasto,
         "total_servicos": total_servicos,
-        "veiculos_count": veiculos_count
+        "veiculos_count": estatisticas["veiculos_count"] or 0,
+        "total_gasto_historico": float(estatisticas["total_gasto"] or 0),
+        "total_visitas": estatisticas["total_visitas"] or 0,
+        "ticket_medio": float(estatisticas["ticket_medio"] or 0),
+        "frequencia_dias": float(frequencia_dias) if frequencia_dias is not None else None,
+        "primeira_visita": estatisticas["primeira_visita"],
+        "ultima_visita": estatisticas["ultima_visita"],
+        "ultima_ordem": ultima_ordem,
+        "top_servicos": estatisticas["top_servicos"],
+        "top_pecas": estatisticas["top_pecas"],
+        "atualizado_em": estatisticas["updated_at"]
     }
 
 @router.get("/{cliente_id}/veiculos", response_model=List[VeiculoList])
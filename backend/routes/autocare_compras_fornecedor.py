@@ -1,14 +1,24 @@
-from fastapi import APIRouter, HTTPException, Depends, Query, status
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, status
 from sqlalchemy.orm import Session
 from decimal import Decimal
 from datetime import datetime, timezone
-from typing import List
+from typing import List, Optional
 
 from db import get_db
 from models.autocare_models import (
     CompraFornecedor, ItemCompraFornecedor, Fornecedor, Produto,
     MovimentoEstoque, LoteEstoque
 )
+from services.cache_service import TAG_ESTOQUE, invalidar_cache
+from services.custo_fifo_service import movimentar_quantidade_produto
+from services.dashboard_stats_service import registrar_alteracao_dashboard
+from services.paginacao_service import (
+    definir_cabecalho_cursor,
+    filtrar_apos_cursor,
+    limitar_pagina,
+    ordenar_keyset,
+    proximo_cursor,
+)
 from schemas.schemas_compra_fornecedor import (
     CompraFornecedorCreate, CompraFornecedorResponse,
     CompraFornecedorList, CompraFornecedorUpdate
@@ -174,13 +184,15 @@ def criar_compra_fornecedor(
         db.add(lote)
         
         # Atualizar quantidade atual do produto
-        produto.quantidade_atual += quantidade
+        movimentar_quantidade_produto(db, produto.id, quantidade)
         produto.preco_custo = preco_custo_total
         if preco_venda:
             produto.preco_venda = preco_venda
         db.add(produto)
     
     db.commit()
+    invalidar_cache(TAG_ESTOQUE)
+    registrar_alteracao_dashboard(db)
     db.refresh(compra)
     
     return compra
@@ -188,15 +200,20 @@ def criar_compra_fornecedor(
 
 @router.get("/", response_model=List[CompraFornecedorList])
 def listar_compras_fornecedor(
+    response: Response,
     fornecedor_id: int = Query(None),
     data_inicio: str = Query(None),
     data_fim: str = Query(None),
     limit: int = Query(50, ge=1, le=1000),
     offset: int = Query(0, ge=0),
+    after: Optional[str] = Query(None),
     db: Session = Depends(get_db)
 ):
     """
     Listar compras de fornecedores com filtros opcionais.
+
+    Com after= (cursor do cabeçalho X-Next-Cursor) a página seguinte é buscada
+    por keyset em (data_compra, id) e offset é ignorado.
     """
     query = db.query(CompraFornecedor)
     
@@ -224,10 +241,18 @@ def listar_compras_fornecedor(
             )
     
     # Ordenar por data desc (mais recentes primeiro)
-    query = query.order_by(CompraFornecedor.data_compra.desc())
-    
-    total = query.count()
-    compras = query.limit(limit).offset(offset).all()
+    query = ordenar_keyset(query, CompraFornecedor.data_compra, CompraFornecedor.id)
+    if after:
+        query = filtrar_apos_cursor(query, CompraFornecedor.data_compra, CompraFornecedor.id, after)
+        limit = limitar_pagina(limit)
+    else:
+        query = query.offset(offset)
+
+    compras = query.limit(limit).all()
+    definir_cabecalho_cursor(
+        response,
+        proximo_cursor(compras, limit, lambda compra: (compra.data_compra, compra.id))
+    )
     
     resultado = []
     for compra in compras:
@@ -335,12 +360,7 @@ def deletar_compra_fornecedor(
             
             if lote:
                 # Revertir quantidade do produto
-                produto = db.query(Produto).filter(
-                    Produto.id == item.produto_id
-                ).first()
-                if produto:
-                    produto.quantidade_atual -= item.quantidade
-                    db.add(produto)
+                movimentar_quantidade_produto(db, item.produto_id, -item.quantidade)
                 
                 db.delete(lote)
             
@@ -348,5 +368,7 @@ def deletar_compra_fornecedor(
     
     db.delete(compra)
     db.commit()
+    invalidar_cache(TAG_ESTOQUE)
+    registrar_alteracao_dashboard(db)
     
     return {"message": "Compra deletada com sucesso"}
@@ -9,10 +9,15 @@ from models.autocare_models import (
     Cliente, Veiculo, OrdemServico, Produto,
     AlertaKm, ItemOrdem
 )
-from routes.autocare_ordens import (
-    calcular_valor_faturado_liquido,
-    obter_taxa_pagamento_aplicada,
-    normalizar_status_ordem,
+from services.cache_service import TAG_CLIENTES, TAG_ESTOQUE, TAG_ORDENS, TAG_VEICULOS, cache_resposta
+from services.dashboard_stats_service import (
+    agregar_ordens_concluidas,
+    expr_desconto_total,
+    expr_pecas_liquido,
+    expr_servico_liquido,
+    filtro_os_concluida,
+    obter_agregados_mensais,
+    obter_agregados_periodo,
 )
 
 router = APIRouter()
@@ -87,27 +92,8 @@ def obter_coluna_data_ordem(tipo_data: Optional[str]):
     return tipo_normalizado, coluna_data
 
 
-def calcular_valor_cliente_ordem(ordem: OrdemServico) -> Decimal:
-    valor_servico = Decimal(str(ordem.valor_servico or 0))
-    valor_pecas = Decimal(str(ordem.valor_pecas or 0))
-    valor_desconto = Decimal(str(ordem.valor_desconto if ordem.valor_desconto is not None else (ordem.desconto or 0)))
-    return valor_servico + valor_pecas - valor_desconto
-
-
-def calcular_valor_faturado_dashboard(ordem: OrdemServico, db: Session) -> Decimal:
-    valor_total = Decimal(str(ordem.valor_total or 0))
-    valor_custo_pecas = Decimal(str(ordem.valor_custo_pecas or 0))
-    valor_mao_obra_avulso = Decimal(str(ordem.valor_mao_obra_avulso or 0))
-    taxa_pagamento_aplicada = obter_taxa_pagamento_aplicada(ordem, db)
-
-    return calcular_valor_faturado_liquido(
-        valor_total=valor_total,
-        valor_custo_pecas=valor_custo_pecas,
-        valor_mao_obra_avulso=valor_mao_obra_avulso,
-        taxa_pagamento_aplicada=taxa_pagamento_aplicada,
-    )
-
 @router.get("/resumo")
+@cache_resposta("dashboard_resumo", tags=[TAG_ORDENS, TAG_ESTOQUE, TAG_CLIENTES, TAG_VEICULOS])
 def dashboard_resumo(
     data_inicio: Optional[str] = None,
     data_fim: Optional[str] = None,
@@ -121,24 +107,7 @@ def dashboard_resumo(
         data_fim: Data final no formato YYYY-MM-DD (opcional, padrão: primeiro dia do próximo mês)
         tipo_data: Base do filtro das OS. Aceita abertura ou conclusao (opcional, padrão: conclusao)
     """
-    _, coluna_data_ordem = obter_coluna_data_ordem(tipo_data)
-    
-    # Contadores gerais
-    total_clientes = db.query(Cliente).filter(Cliente.ativo == True).count()
-    total_veiculos = db.query(Veiculo).filter(Veiculo.ativo == True).count()
-    total_produtos = db.query(Produto).filter(Produto.ativo == True).count()
-    # Ordens de serviço - ajustado para status correto em maiúsculas
-    ordens_abertas = db.query(OrdemServico).filter(
-        or_(OrdemServico.status == "PENDENTE", OrdemServico.status == "Aberta")
-    ).count()
-    ordens_andamento = db.query(OrdemServico).filter(
-        or_(
-            OrdemServico.status == "EM_ANDAMENTO",
-            OrdemServico.status == "Em Andamento",
-            OrdemServico.status == "AGUARDANDO_PECA",
-            OrdemServico.status == "AGUARDANDO_APROVACAO"
-        )
-    ).count()
+    tipo_data_normalizado, coluna_data_ordem = obter_coluna_data_ordem(tipo_data)
     
     # Definir intervalo de datas
     inicio_mes, fim_mes = resolver_intervalo_datas(
@@ -146,124 +115,70 @@ def dashboard_resumo(
         data_fim,
         padrao_mes_atual=True,
     )
-    
-    # Ordens concluídas no mês
-    ordens_concluidas_mes_query = db.query(OrdemServico).filter(
-        and_(
-            or_(OrdemServico.status == "CONCLUIDA", OrdemServico.status == "Concluída"),
-            coluna_data_ordem >= inicio_mes,
-            coluna_data_ordem < fim_mes
-        )
-    )
-    ordens_concluidas_mes = ordens_concluidas_mes_query.all()
-    total_ordens_concluidas_mes = len(ordens_concluidas_mes)
+    hoje = date.today()
 
-    # Base financeira filtrada pelo intervalo selecionado.
-    ordens_concluidas_filtradas = db.query(OrdemServico).filter(
-        and_(
-            or_(OrdemServico.status == "CONCLUIDA", OrdemServico.status == "Concluída"),
-            coluna_data_ordem >= inicio_mes,
-            coluna_data_ordem < fim_mes,
-        )
-    ).all()
-    
-    # Produtos com estoque baixo
-    produtos_estoque_baixo = db.query(Produto).filter(
-        and_(
-            Produto.quantidade_atual <= Produto.quantidade_minima,
-            Produto.ativo == True
-        )
-    ).count()
-    
-    # Receita bruta: mesma regra usada no card da tela de OS padrão.
-    faturamento_mes = sum(
-        (calcular_valor_cliente_ordem(ordem) for ordem in ordens_concluidas_filtradas),
-        Decimal('0.00')
-    )
+    # Contadores gerais e de OS em aberto numa única ida ao banco
+    contadores = db.query(
+        db.query(func.count(Cliente.id)).filter(Cliente.ativo == True).scalar_subquery().label("total_clientes"),
+        db.query(func.count(Veiculo.id)).filter(Veiculo.ativo == True).scalar_subquery().label("total_veiculos"),
+        db.query(func.count(Produto.id)).filter(Produto.ativo == True).scalar_subquery().label("total_produtos"),
+        db.query(func.count(Produto.id)).filter(
+            and_(
+                Produto.quantidade_atual <= Produto.quantidade_minima,
+                Produto.ativo == True
+            )
+        ).scalar_subquery().label("produtos_estoque_baixo"),
+        db.query(func.count(OrdemServico.id)).filter(
+            OrdemServico.status == "PENDENTE"
+        ).scalar_subquery().label("abertas"),
+        db.query(func.count(OrdemServico.id)).filter(
+            OrdemServico.status.in_(["EM_ANDAMENTO", "AGUARDANDO_PECA", "AGUARDANDO_APROVACAO"])
+        ).scalar_subquery().label("em_andamento"),
+    ).one()
+
+    # Totais financeiros: dias fechados vêm da consolidação diária e só o dia
+    # corrente é calculado ao vivo (ou o período todo no filtro por abertura).
+    financeiro = obter_agregados_periodo(db, tipo_data_normalizado, coluna_data_ordem, inicio_mes, fim_mes)
 
     # Receita bruta de hoje: mesma regra da tela de OS (Valor Cliente)
-    hoje = date.today()
-    ordens_concluidas_hoje = db.query(OrdemServico).filter(
-        and_(
-            or_(OrdemServico.status == "CONCLUIDA", OrdemServico.status == "Concluída"),
-            func.date(coluna_data_ordem) == hoje
-        )
-    ).all()
-    faturamento_hoje = sum(
-        (calcular_valor_cliente_ordem(ordem) for ordem in ordens_concluidas_hoje),
-        Decimal('0.00')
-    )
-    
-    # Quantidade de serviços realizados no mês (conta OS do tipo SERVICO ou VENDA_SERVICO)
-    # Cada OS conta +1, independente de quantos serviços foram realizados
-    servicos_realizados = db.query(func.count(OrdemServico.id)).filter(
-        and_(
-            or_(OrdemServico.status == "CONCLUIDA", OrdemServico.status == "Concluída"),
-            coluna_data_ordem >= inicio_mes,
-            coluna_data_ordem < fim_mes,
-            or_(
-                OrdemServico.tipo_ordem == "SERVICO",
-                OrdemServico.tipo_ordem == "VENDA_SERVICO"
-            )
-        )
-    ).scalar() or 0
-    
-    # Quantidade de peças vendidas no mês (soma dos itens tipo PRODUTO)
-    pecas_vendidas = db.query(func.sum(ItemOrdem.quantidade)).join(
-        OrdemServico, ItemOrdem.ordem_id == OrdemServico.id
-    ).filter(
-        and_(
-            or_(OrdemServico.status == "CONCLUIDA", OrdemServico.status == "Concluída"),
-            coluna_data_ordem >= inicio_mes,
-            coluna_data_ordem < fim_mes,
-            or_(ItemOrdem.tipo == "PRODUTO", ItemOrdem.tipo == "produto")
-        )
-    ).scalar() or 0
-    
-    # Custo: usa a mesma base carregada pela tela de OS padrão.
-    custo_pecas = sum(
-        (Decimal(str(ordem.valor_custo_pecas or 0)) for ordem in ordens_concluidas_filtradas),
-        Decimal('0.00')
-    )
-    mao_obra_avulsa = sum(
-        (Decimal(str(ordem.valor_mao_obra_avulso or 0)) for ordem in ordens_concluidas_filtradas),
-        Decimal('0.00')
-    )
+    faturamento_hoje = agregar_ordens_concluidas(
+        db, coluna_data_ordem, hoje, hoje + timedelta(days=1)
+    )["faturamento"]
+
+    custo_pecas = financeiro["custo_pecas"]
+    mao_obra_avulsa = financeiro["mao_obra_avulsa"]
     
     # Custo mensal total
     custo_mensal = custo_pecas + mao_obra_avulsa
     
-    # Receita líquida: mesma regra da coluna Valor Faturado da tela de OS.
-    receita_liquida = sum(
-        (calcular_valor_faturado_dashboard(ordem, db) for ordem in ordens_concluidas_filtradas),
-        Decimal('0.00')
-    )
-    
     return {
         "contadores": {
-            "total_clientes": total_clientes,
-            "total_veiculos": total_veiculos,
-            "total_produtos": total_produtos,
-            "produtos_estoque_baixo": produtos_estoque_baixo
+            "total_clientes": contadores.total_clientes or 0,
+            "total_veiculos": contadores.total_veiculos or 0,
+            "total_produtos": contadores.total_produtos or 0,
+            "produtos_estoque_baixo": contadores.produtos_estoque_baixo or 0
         },
         "ordens_servico": {
-            "abertas": ordens_abertas,
-            "em_andamento": ordens_andamento,
-            "concluidas_mes": total_ordens_concluidas_mes
+            "abertas": contadores.abertas or 0,
+            "em_andamento": contadores.em_andamento or 0,
+            "concluidas_mes": int(financeiro["ordens_concluidas"])
         },
         "financeiro": {
-            "faturamento_mes": float(faturamento_mes),
+            # Receita bruta: mesma regra usada no card da tela de OS padrão.
+            "faturamento_mes": float(financeiro["faturamento"]),
             "faturamento_hoje": float(faturamento_hoje),
             "custo_pecas": float(custo_pecas),
             "mao_obra_avulsa": float(mao_obra_avulsa),
             "custo_mensal": float(custo_mensal),
-            "receita_liquida": float(receita_liquida),
-            "servicos_realizados": int(servicos_realizados),
-            "pecas_vendidas": int(pecas_vendidas)
+            # Receita líquida: mesma regra da coluna Valor Faturado da tela de OS.
+            "receita_liquida": float(financeiro["receita_liquida"]),
+            "servicos_realizados": int(financeiro["servicos_realizados"]),
+            "pecas_vendidas": int(financeiro["pecas_vendidas"])
         }
     }
 
 @router.get("/vendas-mensais")
+@cache_resposta("dashboard_vendas_mensais", tags=[TAG_ORDENS])
 def vendas_mensais(
     ano: Optional[int] = None,
     data_inicio: Optional[str] = None,
@@ -279,7 +194,7 @@ def vendas_mensais(
         data_fim: Data final no formato YYYY-MM-DD (opcional)
         tipo_data: Base do filtro das OS. Aceita abertura ou conclusao (opcional, padrão: conclusao)
     """
-    _, coluna_data_ordem = obter_coluna_data_ordem(tipo_data)
+    tipo_data_normalizado, coluna_data_ordem = obter_coluna_data_ordem(tipo_data)
     
     # Determinar intervalo de datas
     if data_inicio and data_fim:
@@ -295,115 +210,62 @@ def vendas_mensais(
         else:
             fim_intervalo = date(hoje.year, hoje.month + 1, 1)
     
-    # Arrays para armazenar dados dos meses no intervalo
+    # Filtro por conclusão: dias fechados vêm da consolidação diária
+    valores_por_mes = None
+    if tipo_data_normalizado == "conclusao":
+        valores_por_mes = obter_agregados_mensais(db, coluna_data_ordem, inicio_intervalo, fim_intervalo)
+
+    if valores_por_mes is None:
+        # Todas as séries do intervalo numa única consulta agrupada por mês
+        # Receita líquida de serviços e peças (descontos alocados proporcionalmente entre serviço e peças por OS)
+        mes_expr = func.date_trunc('month', coluna_data_ordem)
+        linhas_mensais = db.query(
+            mes_expr.label('mes'),
+            func.sum(OrdemServico.valor_total).label('valor_total_vendas'),
+            func.sum(expr_servico_liquido()).filter(
+                OrdemServico.tipo_ordem.in_(["SERVICO", "VENDA_SERVICO"])
+            ).label('vendas_servicos'),
+            func.sum(expr_pecas_liquido()).filter(
+                OrdemServico.tipo_ordem.in_(["VENDA", "VENDA_SERVICO"])
+            ).label('vendas_pecas'),
+            # Descontos totais do mês (usar valor_desconto se existir, senão desconto legado)
+            func.sum(expr_desconto_total()).label('descontos'),
+        ).filter(
+            and_(
+                filtro_os_concluida(),
+                coluna_data_ordem >= inicio_intervalo,
+                coluna_data_ordem < fim_intervalo
+            )
+        ).group_by(mes_expr).all()
+
+        valores_por_mes = {
+            (linha.mes.year, linha.mes.month): linha._asdict()
+            for linha in linhas_mensais
+            if linha.mes is not None
+        }
+
+    # Arrays para armazenar dados dos meses no intervalo (meses sem OS ficam zerados)
     vendas_totais = []
     vendas_servicos = []
     vendas_pecas = []
     descontos_mensais = []
     labels_meses = []
+    nomes_meses = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
     
-    # Gerar lista de meses entre inicio_intervalo e fim_intervalo
     data_atual = inicio_intervalo.replace(day=1)
     while data_atual < fim_intervalo:
-        mes = data_atual.month
-        ano_calculo = data_atual.year
-        
-        # Definir início e fim do mês
-        inicio_mes = date(ano_calculo, mes, 1)
-        if mes == 12:
-            fim_mes = date(ano_calculo + 1, 1, 1)
-        else:
-            fim_mes = date(ano_calculo, mes + 1, 1)
-
-        inicio_consulta = max(inicio_mes, inicio_intervalo)
-        fim_consulta = min(fim_mes, fim_intervalo)
-
-        if inicio_consulta >= fim_consulta:
-            if mes == 12:
-                data_atual = date(ano_calculo + 1, 1, 1)
-            else:
-                data_atual = date(ano_calculo, mes + 1, 1)
-            continue
-        
-        # Total de vendas do mês
-        total_mes = db.query(func.sum(OrdemServico.valor_total)).filter(
-            and_(
-                or_(OrdemServico.status == "CONCLUIDA", OrdemServico.status == "Concluída"),
-                coluna_data_ordem >= inicio_consulta,
-                coluna_data_ordem < fim_consulta
-            )
-        ).scalar() or Decimal('0.00')
-        
-        # Receita líquida de serviços e peças (descontos alocados proporcionalmente entre serviço e peças por OS)
-        total_bruto_expr = (func.coalesce(OrdemServico.valor_servico, 0) + func.coalesce(OrdemServico.valor_pecas, 0))
-        desconto_total_expr = func.coalesce(OrdemServico.valor_desconto, func.coalesce(OrdemServico.desconto, 0))
-
-        # Parte do desconto atribuída ao serviço
-        desconto_serv_expr = func.coalesce(
-            (func.coalesce(OrdemServico.valor_servico, 0) / func.nullif(total_bruto_expr, 0)) * desconto_total_expr,
-            0
-        )
-        serv_net_expr = func.coalesce(OrdemServico.valor_servico, 0) - desconto_serv_expr
-
-        # Parte do desconto atribuída às peças
-        desconto_pec_expr = func.coalesce(
-            (func.coalesce(OrdemServico.valor_pecas, 0) / func.nullif(total_bruto_expr, 0)) * desconto_total_expr,
-            0
-        )
-        pec_net_expr = func.coalesce(OrdemServico.valor_pecas, 0) - desconto_pec_expr
-
-        servicos_mes = db.query(func.sum(serv_net_expr)).filter(
-            and_(
-                or_(OrdemServico.status == "CONCLUIDA", OrdemServico.status == "Concluída"),
-                coluna_data_ordem >= inicio_consulta,
-                coluna_data_ordem < fim_consulta,
-                or_(
-                    OrdemServico.tipo_ordem == "SERVICO",
-                    OrdemServico.tipo_ordem == "VENDA_SERVICO"
-                )
-            )
-        ).scalar() or Decimal('0.00')
-
-        pecas_mes = db.query(func.sum(pec_net_expr)).filter(
-            and_(
-                or_(OrdemServico.status == "CONCLUIDA", OrdemServico.status == "Concluída"),
-                coluna_data_ordem >= inicio_consulta,
-                coluna_data_ordem < fim_consulta,
-                or_(
-                    OrdemServico.tipo_ordem == "VENDA",
-                    OrdemServico.tipo_ordem == "VENDA_SERVICO"
-                )
-            )
-        ).scalar() or Decimal('0.00')
-        
-        # Descontos totais do mês (usar valor_desconto se existir, senão desconto legado)
-        descontos_mes = db.query(
-            func.sum(
-                func.coalesce(OrdemServico.valor_desconto, func.coalesce(OrdemServico.desconto, 0))
-            )
-        ).filter(
-            and_(
-                or_(OrdemServico.status == "CONCLUIDA", OrdemServico.status == "Concluída"),
-                coluna_data_ordem >= inicio_consulta,
-                coluna_data_ordem < fim_consulta
-            )
-        ).scalar() or Decimal('0.00')
-
-        # Adicionar aos arrays
-        vendas_totais.append(float(total_mes))
-        vendas_servicos.append(float(servicos_mes))
-        vendas_pecas.append(float(pecas_mes))
-        descontos_mensais.append(float(descontos_mes))
-        
-        # Nome do mês
-        nomes_meses = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
-        labels_meses.append(nomes_meses[mes - 1])
+        valores_mes = valores_por_mes.get((data_atual.year, data_atual.month), {})
+        vendas_totais.append(float(valores_mes.get('valor_total_vendas') or 0))
+        vendas_servicos.append(float(valores_mes.get('vendas_servicos') or 0))
+        vendas_pecas.append(float(valores_mes.get('vendas_pecas') or 0))
+        descontos_mensais.append(float(valores_mes.get('descontos') or 0))
+        labels_meses.append(nomes_meses[data_atual.month - 1])
         
         # Avançar para o próximo mês
-        if mes == 12:
-            data_atual = date(ano_calculo + 1, 1, 1)
+        if data_atual.month == 12:
+            data_atual = date(data_atual.year + 1, 1, 1)
         else:
-            data_atual = date(ano_calculo, mes + 1, 1)
+            data_atual = date(data_atual.year, data_atual.month + 1, 1)
     
     return {
         "meses": labels_meses,
@@ -414,6 +276,7 @@ def vendas_mensais(
     }
 
 @router.get("/ordens-status")
+@cache_resposta("dashboard_ordens_status", tags=[TAG_ORDENS])
 def ordens_por_status(
     data_inicio: Optional[str] = None,
     data_fim: Optional[str] = None,
@@ -471,29 +334,12 @@ def ordens_por_status(
         "AGUARDANDO_APROVACAO": "Aguardando Aprovação",
         "CONCLUIDA": "Concluída",
         "CANCELADA": "Cancelada",
-        # Compatibilidade com valores antigos
-        "Aberta": "Pendente",
-        "Em Andamento": "Em Andamento",
-        "Concluída": "Concluída",
     }
     
     resultado = []
     for item in status_count:
-        status = item.status
-        # Normalizar status para o padrão atual
-        if status in labels_status:
-            label = labels_status[status]
-            # Converter para o padrão atual se necessário
-            status_normalizado = status if status in cores_status else {
-                "Aberta": "PENDENTE",
-                "Em Andamento": "EM_ANDAMENTO",
-                "Concluída": "CONCLUIDA"
-            }.get(status, status)
-        else:
-            label = status
-            status_normalizado = status
-        
-        cor = cores_status.get(status_normalizado, "rgba(107, 114, 128, 0.8)")  # gray-500 default
+        label = labels_status.get(item.status, item.status)
+        cor = cores_status.get(item.status, "rgba(107, 114, 128, 0.8)")  # gray-500 default
         
         resultado.append({
             "status": label,
@@ -504,6 +350,7 @@ def ordens_por_status(
     return resultado
 
 @router.get("/produtos-mais-vendidos")
+@cache_resposta("dashboard_produtos_mais_vendidos", tags=[TAG_ORDENS, TAG_ESTOQUE])
 def produtos_mais_vendidos(
     limit: int = 10,
     periodo_dias: int = 30,
@@ -522,7 +369,7 @@ def produtos_mais_vendidos(
         OrdemServico, ItemOrdem.ordem_id == OrdemServico.id
     ).filter(
         and_(
-            OrdemServico.status == "Concluída",
+            OrdemServico.status == "CONCLUIDA",
             OrdemServico.data_conclusao >= data_limite,
             ItemOrdem.tipo == "produto"
         )
@@ -542,6 +389,7 @@ def produtos_mais_vendidos(
     ]
 
 @router.get("/alertas")
+@cache_resposta("dashboard_alertas", tags=[TAG_ORDENS, TAG_ESTOQUE, TAG_CLIENTES, TAG_VEICULOS])
 def dashboard_alertas(
     data_inicio: Optional[str] = None,
     data_fim: Optional[str] = None,
@@ -661,7 +509,7 @@ def faturamento_periodo(
     # Faturamento total
     faturamento = db.query(func.sum(OrdemServico.valor_total)).filter(
         and_(
-            OrdemServico.status == "Concluída",
+            OrdemServico.status == "CONCLUIDA",
             func.date(OrdemServico.data_conclusao).between(inicio, fim)
         )
     ).scalar() or Decimal('0.00')
@@ -669,7 +517,7 @@ def faturamento_periodo(
     # Número de ordens concluídas
     num_ordens = db.query(func.count(OrdemServico.id)).filter(
         and_(
-            OrdemServico.status == "Concluída",
+            OrdemServico.status == "CONCLUIDA",
             func.date(OrdemServico.data_conclusao).between(inicio, fim)
         )
     ).scalar() or 0
@@ -680,14 +528,14 @@ def faturamento_periodo(
     # Faturamento por tipo (produtos vs serviços)
     faturamento_produtos = db.query(func.sum(OrdemServico.valor_produtos)).filter(
         and_(
-            OrdemServico.status == "Concluída",
+            OrdemServico.status == "CONCLUIDA",
             func.date(OrdemServico.data_conclusao).between(inicio, fim)
         )
     ).scalar() or Decimal('0.00')
     
     faturamento_servicos = db.query(func.sum(OrdemServico.valor_servicos)).filter(
         and_(
-            OrdemServico.status == "Concluída",
+            OrdemServico.status == "CONCLUIDA",
             func.date(OrdemServico.data_conclusao).between(inicio, fim)
         )
     ).scalar() or Decimal('0.00')
@@ -705,6 +553,7 @@ def faturamento_periodo(
     }
 
 @router.get("/clientes-ativos")
+@cache_resposta("dashboard_clientes_ativos", tags=[TAG_ORDENS, TAG_CLIENTES])
 def clientes_mais_ativos(
     limit: int = 10,
     periodo_dias: int = 90,
@@ -721,7 +570,7 @@ def clientes_mais_ativos(
         OrdemServico, Cliente.id == OrdemServico.cliente_id
     ).filter(
         and_(
-            OrdemServico.status == "Concluída",
+            OrdemServico.status == "CONCLUIDA",
             OrdemServico.data_conclusao >= data_limite
         )
     ).group_by(
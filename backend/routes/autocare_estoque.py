@@ -1,13 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import and_
 from typing import List, Optional
 from datetime import datetime
 import pytz
 from db import get_db
 from models.autocare_models import Produto, Categoria, MovimentoEstoque, Fornecedor, LoteEstoque, Usuario
 from routes.autocare_auth import get_current_user
+from services.busca_texto_service import filtro_busca_produtos
+from services.cache_service import TAG_ESTOQUE, invalidar_cache
+from services.custo_fifo_service import EstoqueInsuficienteError, movimentar_quantidade_produto, reservar_estoque
+from services.dashboard_stats_service import registrar_alteracao_dashboard
+from services.paginacao_service import (
+    definir_cabecalho_cursor,
+    filtrar_apos_cursor,
+    limitar_pagina,
+    ordenar_keyset,
+    proximo_cursor,
+)
 from schemas.schemas_estoque import (
     ProdutoCreate,
     ProdutoUpdate,
@@ -26,6 +37,12 @@ import logging
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+
+def nome_fornecedor(registro) -> Optional[str]:
+    """Nome do fornecedor pelo relacionamento (carregar com joinedload nas listagens)."""
+    fornecedor = registro.fornecedor if registro.fornecedor_id else None
+    return fornecedor.nome if fornecedor else None
+
 # Função para obter usuário opcional (não levanta exceção se não autenticado)
 security = HTTPBearer(auto_error=False)
 
@@ -47,8 +64,10 @@ def get_current_user_optional(
 
 @router.get("/produtos", response_model=List[ProdutoList])
 def listar_produtos(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    after: Optional[str] = None,
     search: Optional[str] = None,
     categoria: Optional[str] = None,
     fornecedor_id: Optional[int] = None,
@@ -57,16 +76,10 @@ def listar_produtos(
     db: Session = Depends(get_db)
 ):
     """Listar produtos com filtros opcionais"""
-    query = db.query(Produto)
+    query = db.query(Produto).options(joinedload(Produto.fornecedor))
 
     if search:
-        query = query.filter(
-            or_(
-                Produto.codigo.ilike(f"%{search}%"),
-                Produto.nome.ilike(f"%{search}%"),
-                Produto.descricao.ilike(f"%{search}%")
-            )
-        )
+        query = query.filter(filtro_busca_produtos(search))
 
     if categoria:
         query = query.filter(Produto.categoria == categoria)
@@ -83,20 +96,21 @@ def listar_produtos(
     else:
         query = query.filter(Produto.ativo == ativo)
 
-    produtos = query.offset(skip).limit(limit).all()
+    query = ordenar_keyset(query, None, Produto.id, descendente=False)
+    if after:
+        query = filtrar_apos_cursor(query, None, Produto.id, after, descendente=False)
+        limit = limitar_pagina(limit)
+    else:
+        query = query.offset(skip)
+
+    produtos = query.limit(limit).all()
+    definir_cabecalho_cursor(response, proximo_cursor(produtos, limit, lambda produto: (produto.id,)))
 
     # Construir lista de saída explicitando os campos esperados pelo schema
     response_list = []
     for p in produtos:
-        # Enriquecer com nome do fornecedor (quando presente)
-        try:
-            if p.fornecedor_id:
-                f = db.query(Fornecedor).filter(Fornecedor.id == p.fornecedor_id).first()
-                fornecedor_nome = f.nome if f else None
-            else:
-                fornecedor_nome = None
-        except Exception:
-            fornecedor_nome = None
+        # Enriquecer com nome do fornecedor (já carregado no join)
+        fornecedor_nome = nome_fornecedor(p)
 
         # Obter quantidades com segurança
         qa = getattr(p, 'quantidade_atual', 0) or 0
@@ -154,21 +168,14 @@ def listar_produtos(
 @router.get("/produtos/{produto_id}", response_model=ProdutoResponse)
 def buscar_produto(produto_id: int, db: Session = Depends(get_db)):
     """Buscar produto por ID"""
-    produto = db.query(Produto).filter(Produto.id == produto_id).first()
+    produto = db.query(Produto).options(joinedload(Produto.fornecedor)).filter(Produto.id == produto_id).first()
     if not produto:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Produto não encontrado"
         )
     # Enriquecer com nome do fornecedor quando disponível
-    try:
-        if produto.fornecedor_id:
-            f = db.query(Fornecedor).filter(Fornecedor.id == produto.fornecedor_id).first()
-            produto.fornecedor_nome = f.nome if f else None
-        else:
-            produto.fornecedor_nome = None
-    except Exception:
-        produto.fornecedor_nome = None
+    produto.fornecedor_nome = nome_fornecedor(produto)
     # Garantir que o campo `status` seja calculado e retornado (evitar null)
     try:
         if getattr(produto, 'quantidade_atual', 0) == 0:
@@ -206,16 +213,10 @@ def criar_produto(produto_data: ProdutoCreate, db: Session = Depends(get_db)):
     produto = Produto(**produto_data.dict())
     db.add(produto)
     db.commit()
+    invalidar_cache(TAG_ESTOQUE)
     db.refresh(produto)
     # Enriquecer com nome do fornecedor (se informado)
-    try:
-        if produto.fornecedor_id:
-            f = db.query(Fornecedor).filter(Fornecedor.id == produto.fornecedor_id).first()
-            produto.fornecedor_nome = f.nome if f else None
-        else:
-            produto.fornecedor_nome = None
-    except Exception:
-        produto.fornecedor_nome = None
+    produto.fornecedor_nome = nome_fornecedor(produto)
     return produto
 
 @router.put("/produtos/{produto_id}", response_model=ProdutoResponse)
@@ -252,16 +253,10 @@ def atualizar_produto(
     for key, value in update_data.items():
         setattr(produto, key, value)
     db.commit()
+    invalidar_cache(TAG_ESTOQUE)
     db.refresh(produto)
     # Enriquecer com nome do fornecedor (quando disponível)
-    try:
-        if produto.fornecedor_id:
-            f = db.query(Fornecedor).filter(Fornecedor.id == produto.fornecedor_id).first()
-            produto.fornecedor_nome = f.nome if f else None
-        else:
-            produto.fornecedor_nome = None
-    except Exception:
-        produto.fornecedor_nome = None
+    produto.fornecedor_nome = nome_fornecedor(produto)
     return produto
 
 
@@ -277,6 +272,7 @@ def deletar_produto(produto_id: int, db: Session = Depends(get_db)):
     # Soft-delete: marcar como inativo
     produto.ativo = False
     db.commit()
+    invalidar_cache(TAG_ESTOQUE)
     db.refresh(produto)
     try:
         produto.fornecedor_nome = produto.fornecedor.nome if getattr(produto, 'fornecedor', None) else None
@@ -328,14 +324,16 @@ def criar_categoria(categoria_data: CategoriaCreate, db: Session = Depends(get_d
 
 @router.get("/movimentos", response_model=List[MovimentacaoEstoqueResponse])
 def listar_movimentos_estoque(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    after: Optional[str] = None,
     produto_id: Optional[int] = None,
     tipo: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """Listar movimentações de estoque"""
-    query = db.query(MovimentoEstoque)
+    query = db.query(MovimentoEstoque).options(joinedload(MovimentoEstoque.fornecedor))
     
     if produto_id:
         query = query.filter(MovimentoEstoque.item_id == produto_id)
@@ -343,15 +341,22 @@ def listar_movimentos_estoque(
     if tipo:
         query = query.filter(MovimentoEstoque.tipo == tipo)
     
-    movimentos = query.order_by(MovimentoEstoque.data_movimentacao.desc()).offset(skip).limit(limit).all()
+    query = ordenar_keyset(query, MovimentoEstoque.data_movimentacao, MovimentoEstoque.id)
+    if after:
+        query = filtrar_apos_cursor(query, MovimentoEstoque.data_movimentacao, MovimentoEstoque.id, after)
+        limit = limitar_pagina(limit)
+    else:
+        query = query.offset(skip)
+
+    movimentos = query.limit(limit).all()
+    definir_cabecalho_cursor(
+        response,
+        proximo_cursor(movimentos, limit, lambda mov: (mov.data_movimentacao, mov.id))
+    )
     
     # Enriquecer com nome do fornecedor
     for mov in movimentos:
-        if mov.fornecedor_id:
-            fornecedor = db.query(Fornecedor).filter(Fornecedor.id == mov.fornecedor_id).first()
-            mov.fornecedor_nome = fornecedor.nome if fornecedor else None
-        else:
-            mov.fornecedor_nome = None
+        mov.fornecedor_nome = nome_fornecedor(mov)
     
     return movimentos
 
@@ -395,7 +400,7 @@ def criar_movimento_estoque(
     if movimento_data.tipo == "ENTRADA":
         # ENTRADA: Criar novo lote
         quantidade_entrada = movimento_data.quantidade
-        produto.quantidade_atual += quantidade_entrada
+        movimentar_quantidade_produto(db, produto.id, quantidade_entrada)
         
         # Atualizar preços do produto se fornecidos na movimentação
         if movimento_data.preco_custo and movimento_data.preco_custo > 0:
@@ -423,73 +428,36 @@ def criar_movimento_estoque(
         # SAIDA: Consumir dos lotes mais antigos (FIFO)
         quantidade_saida = movimento_data.quantidade
         
-        # Buscar lotes disponíveis ordenados por data de entrada (FIFO)
-        lotes_disponiveis = db.query(LoteEstoque).filter(
-            and_(
-                LoteEstoque.produto_id == produto.id,
-                LoteEstoque.saldo_atual > 0,
-                LoteEstoque.ativo == True
-            )
-        ).order_by(LoteEstoque.data_entrada.asc()).all()
-        
-        # Verificar se há estoque suficiente
-        estoque_total = sum(lote.saldo_atual for lote in lotes_disponiveis)
-        if estoque_total < quantidade_saida:
+        # Baixa atômica do total do produto e dos lotes (travados em ordem de id)
+        try:
+            custo_fifo = reservar_estoque(db, [(produto.id, quantidade_saida)], exigir_lotes=True)[produto.id]
+        except EstoqueInsuficienteError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Estoque insuficiente. Disponível: {estoque_total}, Solicitado: {quantidade_saida}"
+                detail=f"Estoque insuficiente. Disponível: {e.disponivel}, Solicitado: {quantidade_saida}"
             )
         
-        # Consumir dos lotes (FIFO)
-        quantidade_restante = quantidade_saida
-        custo_total = 0
-        
-        for lote in lotes_disponiveis:
-            if quantidade_restante <= 0:
-                break
-                
-            if lote.saldo_atual >= quantidade_restante:
-                # Este lote tem estoque suficiente
-                consumo = quantidade_restante
-                lote.saldo_atual -= consumo
-                custo_total += consumo * lote.preco_custo_unitario
-                quantidade_restante = 0
-            else:
-                # Este lote será consumido completamente
-                consumo = lote.saldo_atual
-                custo_total += consumo * lote.preco_custo_unitario
-                quantidade_restante -= consumo
-                lote.saldo_atual = 0
-        
-        # Atualizar quantidade do produto
-        produto.quantidade_atual -= quantidade_saida
-        
         # Atualizar o custo no movimento baseado no custo FIFO
         if quantidade_saida > 0:
-            movimento.preco_custo = custo_total / quantidade_saida
+            movimento.preco_custo = custo_fifo.custo_medio
     
     db.commit()
+    invalidar_cache(TAG_ESTOQUE)
+    registrar_alteracao_dashboard(db)
     db.refresh(movimento)
     return movimento
 
 @router.get("/produtos/estoque-baixo", response_model=List[ProdutoList])
 def produtos_estoque_baixo(db: Session = Depends(get_db)):
     """Listar produtos com estoque baixo"""
-    produtos = db.query(Produto).filter(
+    produtos = db.query(Produto).options(joinedload(Produto.fornecedor)).filter(
         and_(
             Produto.quantidade_atual <= Produto.quantidade_minima,
             Produto.ativo == True
         )
     ).all()
     for p in produtos:
-        try:
-            if p.fornecedor_id:
-                f = db.query(Fornecedor).filter(Fornecedor.id == p.fornecedor_id).first()
-                p.fornecedor_nome = f.nome if f else None
-            else:
-                p.fornecedor_nome = None
-        except Exception:
-            p.fornecedor_nome = None
+        p.fornecedor_nome = nome_fornecedor(p)
     return produtos
 
 @router.post("/produtos/{produto_id}/ajuste-estoque")
@@ -535,6 +503,8 @@ def ajustar_estoque(
         # Atualizar estoque do produto
         produto.quantidade_atual = novo_estoque
         db.commit()
+        invalidar_cache(TAG_ESTOQUE)
+        registrar_alteracao_dashboard(db)
     
     return {
         "message": "Estoque ajustado com sucesso",
@@ -564,7 +534,7 @@ def listar_lotes_produto(
         )
     
     # Consultar lotes
-    query = db.query(LoteEstoque).filter(LoteEstoque.produto_id == produto_id)
+    query = db.query(LoteEstoque).options(joinedload(LoteEstoque.fornecedor)).filter(LoteEstoque.produto_id == produto_id)
     
     if apenas_disponiveis:
         query = query.filter(
@@ -578,11 +548,7 @@ def listar_lotes_produto(
     
     # Enriquecer com nome do fornecedor
     for lote in lotes:
-        if lote.fornecedor_id:
-            fornecedor = db.query(Fornecedor).filter(Fornecedor.id == lote.fornecedor_id).first()
-            lote.fornecedor_nome = fornecedor.nome if fornecedor else None
-        else:
-            lote.fornecedor_nome = None
+        lote.fornecedor_nome = nome_fornecedor(lote)
     
     return lotes
 
@@ -610,15 +576,17 @@ def buscar_lote(lote_id: int, db: Session = Depends(get_db)):
 
 @router.get("/lotes", response_model=List[LoteEstoqueList])
 def listar_todos_lotes(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    after: Optional[str] = None,
     apenas_disponiveis: bool = True,
     fornecedor_id: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
     """Listar todos os lotes do estoque"""
     
-    query = db.query(LoteEstoque)
+    query = db.query(LoteEstoque).options(joinedload(LoteEstoque.fornecedor))
     
     if apenas_disponiveis:
         query = query.filter(
@@ -631,14 +599,18 @@ def listar_todos_lotes(
     if fornecedor_id:
         query = query.filter(LoteEstoque.fornecedor_id == fornecedor_id)
     
-    lotes = query.order_by(LoteEstoque.data_entrada.desc()).offset(skip).limit(limit).all()
+    query = ordenar_keyset(query, LoteEstoque.data_entrada, LoteEstoque.id)
+    if after:
+        query = filtrar_apos_cursor(query, LoteEstoque.data_entrada, LoteEstoque.id, after)
+        limit = limitar_pagina(limit)
+    else:
+        query = query.offset(skip)
+
+    lotes = query.limit(limit).all()
+    definir_cabecalho_cursor(response, proximo_cursor(lotes, limit, lambda lote: (lote.data_entrada, lote.id)))
     
     # Enriquecer com nome do fornecedor
     for lote in lotes:
-        if lote.fornecedor_id:
-            fornecedor = db.query(Fornecedor).filter(Fornecedor.id == lote.fornecedor_id).first()
-            lote.fornecedor_nome = fornecedor.nome if fornecedor else None
-        else:
-            lote.fornecedor_nome = None
+        lote.fornecedor_nome = nome_fornecedor(lote)
     
     return lotes
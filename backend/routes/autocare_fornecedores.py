@@ -3,6 +3,9 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 from db import get_db
 from models.autocare_models import Fornecedor
+from services.busca_texto_service import filtro_busca_fornecedores
+from services.cache_service import TAG_FORNECEDORES, TTL_TOTAL_LISTAGEM_SEGUNDOS, invalidar_cache, obter_ou_calcular
+from services.paginacao_service import paginar_com_total, proximo_cursor
 from schemas.schemas_fornecedor import (
     FornecedorCreate,
     FornecedorUpdate,
@@ -24,11 +27,7 @@ def listar_fornecedores(
     query = db.query(Fornecedor)
     
     if search:
-        query = query.filter(
-            Fornecedor.nome.ilike(f"%{search}%") |
-            Fornecedor.cnpj.ilike(f"%{search}%") |
-            Fornecedor.email.ilike(f"%{search}%")
-        )
+        query = query.filter(filtro_busca_fornecedores(search))
     
     # Se não for informado `ativo`, por padrão retornamos apenas fornecedores ativos.
     # Se o caller fornecer explicitamente `ativo=True` ou `ativo=False`, respeitamos.
@@ -45,6 +44,7 @@ def listar_fornecedores(
 def listar_fornecedores_paginado(
     page: int = 1,
     page_size: int = 20,
+    after: Optional[str] = None,
     search: Optional[str] = None,
     ativo: Optional[bool] = None,
     db: Session = Depends(get_db)
@@ -53,31 +53,37 @@ def listar_fornecedores_paginado(
     query = db.query(Fornecedor)
 
     if search:
-        query = query.filter(
-            Fornecedor.nome.ilike(f"%{search}%") |
-            Fornecedor.cnpj.ilike(f"%{search}%") |
-            Fornecedor.email.ilike(f"%{search}%")
-        )
+        query = query.filter(filtro_busca_fornecedores(search))
 
     if ativo is None:
         query = query.filter(Fornecedor.ativo == True)
     else:
         query = query.filter(Fornecedor.ativo == ativo)
 
-    total = query.count()
     page = max(1, page)
     page_size = max(1, min(page_size, 100))
-    skip = (page - 1) * page_size
+    filtrado = bool(search) or ativo is False
+
+    # Listagem padrão (fornecedores ativos): total em cache, invalidado a cada escrita de fornecedor
+    def total_sem_filtros():
+        total = obter_ou_calcular(
+            "fornecedores_total", {}, [TAG_FORNECEDORES], query.count, ttl=TTL_TOTAL_LISTAGEM_SEGUNDOS
+        )
+        return total, True
 
-    fornecedores = query.order_by(Fornecedor.id.desc()).offset(skip).limit(page_size).all()
+    pagina = paginar_com_total(query, page, page_size, after, None, Fornecedor.id, filtrado, total_sem_filtros)
+    fornecedores = pagina.itens
+    total = pagina.total
     total_pages = (total + page_size - 1) // page_size if total > 0 else 1
 
     return {
         "items": fornecedores,
         "total": total,
+        "total_exato": pagina.total_exato,
         "page": page,
         "page_size": page_size,
-        "total_pages": total_pages
+        "total_pages": total_pages,
+        "next_cursor": proximo_cursor(fornecedores, page_size, lambda fornecedor: (fornecedor.id,))
     }
 
 @router.get("/{fornecedor_id}", response_model=FornecedorResponse)
@@ -116,6 +122,7 @@ def criar_fornecedor(fornecedor_data: FornecedorCreate, db: Session = Depends(ge
     fornecedor = Fornecedor(**fornecedor_data.dict())
     db.add(fornecedor)
     db.commit()
+    invalidar_cache(TAG_FORNECEDORES)
     db.refresh(fornecedor)
     return fornecedor
 
@@ -162,6 +169,7 @@ def atualizar_fornecedor(
     for key, value in update_data.items():
         setattr(fornecedor, key, value)
     db.commit()
+    invalidar_cache(TAG_FORNECEDORES)
     db.refresh(fornecedor)
     return fornecedor
 
@@ -177,6 +185,7 @@ def deletar_fornecedor(fornecedor_id: int, db: Session = Depends(get_db)):
     
     fornecedor.ativo = False
     db.commit()
+    invalidar_cache(TAG_FORNECEDORES)
     db.refresh(fornecedor)
     return fornecedor
 
@@ -192,4 +201,5 @@ def reativar_fornecedor(fornecedor_id: int, db: Session = Depends(get_db)):
     
     fornecedor.ativo = True
     db.commit()
+    invalidar_cache(TAG_FORNECEDORES)
     return {"message": "Fornecedor reativado com sucesso"}
\ No newline at end of file
@@ -1,7 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, func, or_
-from typing import Any, Dict, List, Optional
+from sqlalchemy import and_, case, func, or_, select
+from typing import Any, Dict, List, Optional, Tuple
 from decimal import Decimal
 from datetime import datetime, date
 from difflib import get_close_matches
@@ -11,7 +11,36 @@ import logging
 import unicodedata
 import json
 from db import get_db
-from models.autocare_models import OrdemServico, ItemOrdem, Cliente, Veiculo, Produto, MovimentoEstoque, LoteEstoque, ManutencaoHistorico, TaxaPagamento, Maquina
+from models.autocare_models import OrdemServico, ItemOrdem, Cliente, Veiculo, Produto, MovimentoEstoque, LoteEstoque, ManutencaoHistorico, TaxaPagamento, Maquina, NUMERO_ORDEM_SEQ
+from services.busca_texto_service import filtro_busca_ordens
+from services.cache_service import (
+    TAG_ESTOQUE,
+    TAG_ORDENS,
+    TTL_TOTAL_LISTAGEM_SEGUNDOS,
+    cache_resposta,
+    invalidar_cache,
+    obter_ou_calcular,
+)
+from services.classificador_manutencao_service import montar_historicos, obter_classificador
+from services.custo_fifo_service import (
+    CustoFifoProduto,
+    EstoqueInsuficienteError,
+    calcular_custos_fifo,
+    movimentar_quantidades_produtos,
+    reservar_estoque,
+)
+from services.dashboard_stats_service import registrar_alteracao_dashboard
+from services.estatisticas_cliente_service import registrar_alteracao_estatisticas_cliente
+from services.paginacao_service import (
+    definir_cabecalho_cursor,
+    filtrar_apos_cursor,
+    limitar_pagina,
+    ordenar_keyset,
+    paginar_com_total,
+    proximo_cursor,
+)
+from services.placa_service import filtro_placa_exata, filtro_placa_prefixo, normalizar_placa
+from services.produtos_autocomplete_service import autocompletar_produtos
 from schemas.schemas_ordem import (
     OrdemServicoNovaCreate,
     OrdemServicoNovaUpdate,
@@ -39,7 +68,7 @@ def status_ordem_chave(status_value: str) -> str:
 
 
 STATUS_ORDEM_DEFINICOES = {
-    "PENDENTE": ["PENDENTE", "Pendente"],
+    "PENDENTE": ["PENDENTE", "Pendente", "Aberta"],
     "EM_ANDAMENTO": ["EM_ANDAMENTO", "EM ANDAMENTO", "EMANDAMENTO", "Em andamento", "Em Andamento"],
     "AGUARDANDO_PECA": [
         "AGUARDANDO_PECA",
@@ -63,14 +92,13 @@ STATUS_ORDEM_DEFINICOES = {
     "CANCELADA": ["CANCELADA", "Cancelada"],
 }
 
-STATUS_ORDEM_VARIANTES = {
-    status_canonico: sorted(set(variantes))
-    for status_canonico, variantes in STATUS_ORDEM_DEFINICOES.items()
-}
+# Códigos gravados em ordens_servico.status (garantidos pela check constraint
+# ck_ordens_servico_status). As variantes acima só são aceitas na entrada.
+STATUS_ORDEM_CANONICOS = tuple(STATUS_ORDEM_DEFINICOES)
 
 STATUS_ORDEM_ALIAS = {
     status_ordem_chave(variante): status_canonico
-    for status_canonico, variantes in STATUS_ORDEM_VARIANTES.items()
+    for status_canonico, variantes in STATUS_ORDEM_DEFINICOES.items()
     for variante in variantes
 }
 
@@ -95,62 +123,127 @@ def normalizar_status_ordem(status_value: Optional[str]) -> Optional[str]:
     return status_texto.upper().replace(" ", "_")
 
 
-def filtro_status_ordem(coluna, *status_canonicos: str):
-    variantes = []
-    for status_canonico in status_canonicos:
-        status_normalizado = normalizar_status_ordem(status_canonico) or status_canonico
-        variantes.extend(STATUS_ORDEM_VARIANTES.get(status_normalizado, [status_normalizado]))
+def validar_status_ordem(status_value: Optional[str]) -> str:
+    """Normaliza o status recebido na escrita e rejeita valores fora dos códigos canônicos."""
+    status_canonico = normalizar_status_ordem(status_value)
+    if status_canonico not in STATUS_ORDEM_CANONICOS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Status inválido: {status_value}. Use um de: {', '.join(STATUS_ORDEM_CANONICOS)}"
+        )
+    return status_canonico
+
 
-    return coluna.in_(sorted(set(variantes)))
+def filtro_status_ordem(coluna, *status_canonicos: str):
+    # O banco só contém códigos canônicos: igualdade simples usa o índice em status
+    if len(status_canonicos) == 1:
+        return coluna == status_canonicos[0]
+    return coluna.in_(status_canonicos)
 
 def gerar_numero_ordem(db: Session) -> str:
-    """Gerar próximo número de ordem sequencial"""
-    ultimo_numero = db.query(func.max(OrdemServico.numero)).scalar()
-    
-    if ultimo_numero:
-        try:
-            proximo = int(ultimo_numero) + 1
-        except:
-            # Se não conseguir converter, usar timestamp
-            proximo = int(datetime.now().strftime("%Y%m%d%H%M%S"))[-8:]
-    else:
-        proximo = 1
-    
+    """Gerar próximo número de ordem sequencial (sequence do PostgreSQL, sem corrida entre requisições)"""
+    proximo = db.execute(select(NUMERO_ORDEM_SEQ.next_value())).scalar()
     return str(proximo).zfill(8)
 
+COLUNAS_TAXA_POR_FORMA = {
+    'DINHEIRO': 'taxa_dinheiro',
+    'PIX': 'taxa_pix',
+    'DEBITO': 'taxa_debito',
+    'CREDITO': 'taxa_credito',
+}
+
+
+class ResolvedorTaxaPagamento:
+    """Resolve taxas de pagamento carregando a tabela de máquinas uma única vez.
+
+    Deve ser instanciado por requisição e reutilizado para todas as ordens de
+    uma listagem, evitando uma consulta a `maquinas` por forma de pagamento.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self._maquinas: Optional[Dict[int, Maquina]] = None
+        self._maquina_default: Optional[Maquina] = None
+
+    def _carregar(self) -> None:
+        if self._maquinas is not None:
+            return
+        maquinas = self.db.query(Maquina).all()
+        self._maquinas = {maquina.id: maquina for maquina in maquinas}
+        self._maquina_default = next((maquina for maquina in maquinas if maquina.eh_default), None)
+
+    @property
+    def maquina_default(self) -> Optional[Maquina]:
+        self._carregar()
+        return self._maquina_default
+
+    def percentual(self, tipo_pagamento: Optional[str], maquina_id: Optional[int] = None) -> Decimal:
+        """Percentual de taxa para o tipo de pagamento (máquina informada ou padrão)."""
+        if not tipo_pagamento:
+            return Decimal('0.00')
+
+        coluna = COLUNAS_TAXA_POR_FORMA.get(tipo_pagamento.upper())
+        if not coluna:
+            return Decimal('0.00')
+
+        self._carregar()
+        maquina = self._maquinas.get(maquina_id) if maquina_id else None
+        if maquina is None:
+            maquina = self._maquina_default
+        if maquina is None:
+            return Decimal('0.00')
+
+        return _decimal(getattr(maquina, coluna))
+
+    def taxa_para_formas(
+        self,
+        valor_total: Decimal,
+        maquina_id: Optional[int],
+        forma_pagamento: Optional[str],
+        formas_pagamento_raw: Any,
+    ) -> Decimal:
+        formas_pagamento = parse_formas_pagamento_json(formas_pagamento_raw)
+
+        if formas_pagamento:
+            taxa_total = Decimal('0.00')
+            for item in formas_pagamento:
+                percentual = self.percentual(item.get('forma'), maquina_id)
+                valor_item = _decimal(item.get('valor'))
+                if percentual > 0 and valor_item > 0:
+                    taxa_total += valor_item * (percentual / Decimal('100'))
+            return taxa_total.quantize(Decimal('0.01'))
+
+        if forma_pagamento:
+            percentual_taxa = self.percentual(forma_pagamento, maquina_id)
+            if percentual_taxa > 0:
+                return (_decimal(valor_total) * (percentual_taxa / Decimal('100'))).quantize(Decimal('0.01'))
+
+        return Decimal('0.00')
+
+    def taxa_aplicada(self, ordem: OrdemServico) -> Decimal:
+        """Taxa gravada na ordem ou, para OS concluídas sem taxa, a taxa calculada."""
+        taxa_aplicada = _decimal(ordem.taxa_pagamento_aplicada)
+        if taxa_aplicada > 0:
+            return taxa_aplicada
+
+        if ordem.status != "CONCLUIDA":
+            return taxa_aplicada
+
+        taxa_calculada = self.taxa_para_formas(
+            valor_total=_decimal(ordem.valor_total),
+            maquina_id=ordem.maquina_id,
+            forma_pagamento=ordem.forma_pagamento,
+            formas_pagamento_raw=ordem.formas_pagamento,
+        )
+        if taxa_calculada > 0:
+            return taxa_calculada
+
+        return taxa_aplicada
+
+
 def obter_taxa_pagamento(db: Session, tipo_pagamento: Optional[str], maquina_id: Optional[int] = None) -> Decimal:
     """Obter a taxa de pagamento para um tipo específico de uma máquina"""
-    if not tipo_pagamento:
-        return Decimal('0.00')
-    
-    tipo_pagamento_upper = tipo_pagamento.upper()
-    
-    # Se tiver máquina específica, usar suas taxas
-    if maquina_id:
-        maquina = db.query(Maquina).filter(Maquina.id == maquina_id).first()
-        if maquina:
-            if tipo_pagamento_upper == 'DINHEIRO':
-                return maquina.taxa_dinheiro
-            elif tipo_pagamento_upper == 'PIX':
-                return maquina.taxa_pix
-            elif tipo_pagamento_upper == 'DEBITO':
-                return maquina.taxa_debito
-            elif tipo_pagamento_upper == 'CREDITO':
-                return maquina.taxa_credito
-    
-    # Se não tiver máquina, usar a máquina padrão
-    maquina_default = db.query(Maquina).filter(Maquina.eh_default == True).first()
-    if maquina_default:
-        if tipo_pagamento_upper == 'DINHEIRO':
-            return maquina_default.taxa_dinheiro
-        elif tipo_pagamento_upper == 'PIX':
-            return maquina_default.taxa_pix
-        elif tipo_pagamento_upper == 'DEBITO':
-            return maquina_default.taxa_debito
-        elif tipo_pagamento_upper == 'CREDITO':
-            return maquina_default.taxa_credito
-
-    return Decimal('0.00')
+    return ResolvedorTaxaPagamento(db).percentual(tipo_pagamento, maquina_id)
 
 
 def _decimal(value: Any) -> Decimal:
@@ -229,45 +322,24 @@ def calcular_taxa_para_formas_pagamento(
     maquina_id: Optional[int],
     forma_pagamento: Optional[str],
     formas_pagamento_raw: Any,
+    resolvedor: Optional[ResolvedorTaxaPagamento] = None,
 ) -> Decimal:
-    formas_pagamento = parse_formas_pagamento_json(formas_pagamento_raw)
-
-    if formas_pagamento:
-        taxa_total = Decimal('0.00')
-        for item in formas_pagamento:
-            percentual = obter_taxa_pagamento(db, item.get('forma'), maquina_id)
-            valor_item = _decimal(item.get('valor'))
-            if percentual > 0 and valor_item > 0:
-                taxa_total += valor_item * (_decimal(percentual) / Decimal('100'))
-        return taxa_total.quantize(Decimal('0.01'))
-
-    if forma_pagamento:
-        percentual_taxa = obter_taxa_pagamento(db, forma_pagamento, maquina_id)
-        if percentual_taxa > 0:
-            return (_decimal(valor_total) * (_decimal(percentual_taxa) / Decimal('100'))).quantize(Decimal('0.01'))
-
-    return Decimal('0.00')
-
-
-def obter_taxa_pagamento_aplicada(ordem: OrdemServico, db: Session) -> Decimal:
-    taxa_aplicada = Decimal(str(ordem.taxa_pagamento_aplicada or 0))
-    if taxa_aplicada > 0:
-        return taxa_aplicada
-
-    if normalizar_status_ordem(ordem.status) != "CONCLUIDA":
-        return taxa_aplicada
-
-    taxa_calculada = calcular_taxa_para_formas_pagamento(
-        db=db,
-        valor_total=_decimal(ordem.valor_total),
-        maquina_id=ordem.maquina_id,
-        forma_pagamento=ordem.forma_pagamento,
-        formas_pagamento_raw=ordem.formas_pagamento,
+    resolvedor = resolvedor or ResolvedorTaxaPagamento(db)
+    return resolvedor.taxa_para_formas(
+        valor_total=valor_total,
+        maquina_id=maquina_id,
+        forma_pagamento=forma_pagamento,
+        formas_pagamento_raw=formas_pagamento_raw,
     )
-    if taxa_calculada > 0:
-        return taxa_calculada
 
-    return taxa_aplicada
+
+def obter_taxa_pagamento_aplicada(
+    ordem: OrdemServico,
+    db: Session,
+    resolvedor: Optional[ResolvedorTaxaPagamento] = None,
+) -> Decimal:
+    resolvedor = resolvedor or ResolvedorTaxaPagamento(db)
+    return resolvedor.taxa_aplicada(ordem)
 
 def calcular_valor_faturado_liquido(
     valor_total: Decimal,
@@ -278,6 +350,59 @@ def calcular_valor_faturado_liquido(
     """Calcula o valor faturado líquido da ordem."""
     return valor_total - taxa_pagamento_aplicada - valor_mao_obra_avulso - valor_custo_pecas
 
+
+# Versão da regra de cálculo gravada em valor_faturado. Incrementar sempre que a
+# fórmula mudar: ordens com versão antiga voltam a ser recalculadas na leitura
+# até que o script de recálculo carimbe a nova versão.
+VERSAO_CALCULO_FINANCEIRO = 1
+
+
+def gravar_snapshot_financeiro(
+    ordem: OrdemServico,
+    db: Session,
+    resolvedor_taxa: Optional[ResolvedorTaxaPagamento] = None,
+) -> Decimal:
+    """Grava o valor faturado oficial (já com a taxa) e carimba a versão do cálculo.
+
+    Deve ser chamado apenas nos caminhos de escrita (criação, edição, conclusão
+    e cancelamento); as leituras usam o valor gravado.
+    """
+    resolvedor = resolvedor_taxa or ResolvedorTaxaPagamento(db)
+    taxa_pagamento_aplicada = resolvedor.taxa_aplicada(ordem)
+
+    ordem.taxa_pagamento_aplicada = taxa_pagamento_aplicada
+    ordem.valor_faturado = calcular_valor_faturado_liquido(
+        valor_total=_decimal(ordem.valor_total),
+        valor_custo_pecas=_decimal(ordem.valor_custo_pecas),
+        valor_mao_obra_avulso=_decimal(ordem.valor_mao_obra_avulso),
+        taxa_pagamento_aplicada=taxa_pagamento_aplicada,
+    )
+    ordem.versao_calculo_financeiro = VERSAO_CALCULO_FINANCEIRO
+    return ordem.valor_faturado
+
+
+def obter_valores_financeiros(
+    ordem: OrdemServico,
+    db: Session,
+    resolvedor_taxa: Optional[ResolvedorTaxaPagamento] = None,
+) -> Tuple[Decimal, Decimal]:
+    """Retorna (taxa_pagamento_aplicada, valor_faturado) da ordem.
+
+    Usa os valores gravados quando a versão do cálculo é a atual; ordens antigas
+    ainda não recalculadas caem no cálculo dinâmico.
+    """
+    if ordem.versao_calculo_financeiro == VERSAO_CALCULO_FINANCEIRO:
+        return _decimal(ordem.taxa_pagamento_aplicada), _decimal(ordem.valor_faturado)
+
+    taxa_pagamento_aplicada = obter_taxa_pagamento_aplicada(ordem, db, resolvedor_taxa)
+    valor_faturado = calcular_valor_faturado_liquido(
+        valor_total=_decimal(ordem.valor_total),
+        valor_custo_pecas=_decimal(ordem.valor_custo_pecas),
+        valor_mao_obra_avulso=_decimal(ordem.valor_mao_obra_avulso),
+        taxa_pagamento_aplicada=taxa_pagamento_aplicada,
+    )
+    return taxa_pagamento_aplicada, valor_faturado
+
 def calcular_custo_ativo_movimentos(movimentos: List[MovimentoEstoque], produto_id: int) -> Decimal:
     """Calcula o custo ativo de um produto em uma OS considerando saídas e devoluções."""
     chunks = []
@@ -328,17 +453,18 @@ def aplicar_taxa_pagamento(db: Session, ordem: OrdemServico, maquina_id: Optiona
     Returns:
         Valor da taxa aplicada
     """
-    if normalizar_status_ordem(ordem.status) != "CONCLUIDA":
+    if ordem.status != "CONCLUIDA":
         return Decimal('0.00')
     
+    resolvedor = ResolvedorTaxaPagamento(db)
+
     # Se não forneceu máquina, usar a padrão
     if not maquina_id:
-        maquina_default = db.query(Maquina).filter(Maquina.eh_default == True).first()
+        maquina_default = resolvedor.maquina_default
         if maquina_default:
             maquina_id = maquina_default.id
     
-    taxa_valor = calcular_taxa_para_formas_pagamento(
-        db=db,
+    taxa_valor = resolvedor.taxa_para_formas(
         valor_total=_decimal(ordem.valor_total),
         maquina_id=maquina_id,
         forma_pagamento=ordem.forma_pagamento,
@@ -351,168 +477,21 @@ def aplicar_taxa_pagamento(db: Session, ordem: OrdemServico, maquina_id: Optiona
     
     # IMPORTANTE: Atualizar valor_faturado deduzindo a taxa de pagamento
     # Fórmula: valor_faturado = valor_total - taxa_pagamento - valor_mao_obra_avulso - valor_custo_pecas
-    valor_total = Decimal(str(ordem.valor_total or 0))
-    valor_custo_pecas = Decimal(str(ordem.valor_custo_pecas or 0))
-    valor_mao_obra_avulso = Decimal(str(ordem.valor_mao_obra_avulso or 0))
-    
-    ordem.valor_faturado = valor_total - taxa_valor - valor_mao_obra_avulso - valor_custo_pecas
+    gravar_snapshot_financeiro(ordem, db, resolvedor)
     
     logger.info(f"Taxa de pagamento aplicada para OS {ordem.numero}: R${taxa_valor:.2f}")
-    logger.info(f"Componentes do valor_faturado: valor_total={valor_total}, taxa={taxa_valor}, mao_obra={valor_mao_obra_avulso}, custo_pecas={valor_custo_pecas}")
+    logger.info(f"Componentes do valor_faturado: valor_total={ordem.valor_total}, taxa={taxa_valor}, mao_obra={ordem.valor_mao_obra_avulso}, custo_pecas={ordem.valor_custo_pecas}")
     logger.info(f"Novo valor_faturado: R${ordem.valor_faturado:.2f}")
     
     db.flush()
     
     return taxa_valor
 
-def consumir_lotes_fifo(db: Session, produto_id: int, quantidade_saida) -> float:
-    """
-    Consumir lotes via FIFO e retornar o custo médio
-    
-    Args:
-        db: Sessão do banco
-        produto_id: ID do produto
-        quantidade_saida: Quantidade a ser consumida (float, int ou Decimal)
-        
-    Returns:
-        Custo médio unitário da saída (baseado nos lotes consumidos)
-    """
-    # Converter quantidade para float
-    qtd_saida = float(quantidade_saida)
-    
-    # Buscar lotes disponíveis ordenados por data de entrada (FIFO)
-    lotes_disponiveis = db.query(LoteEstoque).filter(
-        and_(
-            LoteEstoque.produto_id == produto_id,
-            LoteEstoque.saldo_atual > 0,
-            LoteEstoque.ativo == True
-        )
-    ).order_by(LoteEstoque.data_entrada.asc()).all()
-    
-    # Verificar se há estoque suficiente
-    estoque_total = sum(float(lote.saldo_atual) for lote in lotes_disponiveis)
-    if estoque_total < qtd_saida:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Estoque insuficiente. Disponível: {estoque_total}, Solicitado: {qtd_saida}"
-        )
-    
-    # Consumir dos lotes (FIFO)
-    quantidade_restante = qtd_saida
-    custo_total = 0.0
-    
-    for lote in lotes_disponiveis:
-        if quantidade_restante <= 0:
-            break
-            
-        saldo_lote = float(lote.saldo_atual)
-        
-        if saldo_lote >= quantidade_restante:
-            # Este lote tem estoque suficiente
-            consumo = quantidade_restante
-            lote.saldo_atual = saldo_lote - consumo
-            custo_total += consumo * float(lote.preco_custo_unitario)
-            quantidade_restante = 0
-        else:
-            # Este lote será consumido completamente
-            consumo = saldo_lote
-            custo_total += consumo * float(lote.preco_custo_unitario)
-            quantidade_restante -= consumo
-            lote.saldo_atual = 0.0
-    
-    # Retornar custo médio unitário
-    return custo_total / qtd_saida if qtd_saida > 0 else 0.0
-
-def calcular_custo_lotes_fifo(db: Session, produto_id: int, quantidade: float) -> float:
-    """
-    Calcular o custo FIFO para uma quantidade de produto SEM consumir do estoque
-    (apenas para leitura/cálculo)
-    
-    Args:
-        db: Sessão do banco
-        produto_id: ID do produto
-        quantidade: Quantidade desejada
-        
-    Returns:
-        Custo total baseado na fórmula FIFO, ou 0 se não houver lotes
-    """
-    try:
-        msg = f"Calculando custo FIFO para produto {produto_id}, quantidade {quantidade}"
-        print(msg, flush=True)
-        logger.info(msg)
-        
-        # Buscar lotes disponíveis ordenados por data de entrada (FIFO)
-        lotes_disponiveis = db.query(LoteEstoque).filter(
-            and_(
-                LoteEstoque.produto_id == produto_id,
-                LoteEstoque.saldo_atual > 0,
-                LoteEstoque.ativo == True
-            )
-        ).order_by(LoteEstoque.data_entrada.asc()).all()
-        
-        msg = f"Encontrados {len(lotes_disponiveis)} lotes para produto {produto_id}"
-        print(msg, flush=True)
-        logger.info(msg)
-        
-        if not lotes_disponiveis:
-            # Se não há lotes, retornar 0
-            msg = f"Nenhum lote disponível para produto {produto_id}"
-            print(msg, flush=True)
-            logger.warning(msg)
-            return 0.0
-        
-        # Verificar se há estoque suficiente
-        estoque_total = sum(float(lote.saldo_atual) for lote in lotes_disponiveis)
-        msg = f"Estoque total disponível: {estoque_total}, quantidade solicitada: {quantidade}"
-        print(msg, flush=True)
-        logger.info(msg)
-        
-        if estoque_total < quantidade:
-            # Se não há estoque suficiente, retornar 0 (será tratado na validação)
-            msg = f"Estoque insuficiente: {estoque_total} < {quantidade}"
-            print(msg, flush=True)
-            logger.warning(msg)
-            return 0.0
-        
-        # Calcular custo total via FIFO (sem modificar os lotes)
-        quantidade_restante = float(quantidade)
-        custo_total = 0.0
-        
-        for lote in lotes_disponiveis:
-            if quantidade_restante <= 0:
-                break
-            
-            saldo_lote = float(lote.saldo_atual)
-            preco_custo = float(lote.preco_custo_unitario)
-            
-            if saldo_lote >= quantidade_restante:
-                # Este lote tem estoque suficiente
-                consumo = quantidade_restante
-                custo_item = consumo * preco_custo
-                custo_total += custo_item
-                msg = f"  Lote {lote.id}: consumo {consumo} * R${preco_custo:.2f} = R${custo_item:.2f}"
-                print(msg, flush=True)
-                logger.info(msg)
-                quantidade_restante = 0
-            else:
-                # Este lote será consumido completamente
-                consumo = saldo_lote
-                custo_item = consumo * preco_custo
-                custo_total += custo_item
-                msg = f"  Lote {lote.id}: consumo {consumo} * R${preco_custo:.2f} = R${custo_item:.2f}"
-                print(msg, flush=True)
-                logger.info(msg)
-                quantidade_restante -= consumo
-        
-        msg = f"Custo FIFO total para produto {produto_id}: R${custo_total:.2f}"
-        print(msg, flush=True)
-        logger.info(msg)
-        return custo_total
-    except Exception as e:
-        msg = f"Erro ao calcular custo FIFO para produto {produto_id}: {e}"
-        print(msg, flush=True)
-        logger.error(msg, exc_info=True)
-        return 0.0
+def custo_unitario_fifo(custo: Optional[CustoFifoProduto], produto: Optional[Produto]) -> Decimal:
+    """Custo médio FIFO do produto; sem lotes suficientes (produtos antigos), usa o preco_custo do cadastro."""
+    if custo and custo.suficiente and custo.custo_total > 0:
+        return custo.custo_medio
+    return _decimal(produto.preco_custo) if produto else Decimal('0.00')
 
 @router.post("/buscar-cliente", response_model=ClienteBuscaResponse)
 def buscar_cliente_para_ordem_post(busca: ClienteBuscaRequest, db: Session = Depends(get_db)):
@@ -580,40 +559,26 @@ def buscar_cliente_comum(termo_busca: str, db: Session):
         else:
             logger.info(f"11 dígitos válidos como CPF: '{termo_limpo}'")
     
-    # Construir query baseada no tipo detectado
-    if buscar_como_cpf or len(termo_limpo) != 11:
+    # Colunas de dígitos indexadas (cpf_cnpj_digitos, telefone_digitos...)
+    filtro_cpf = Cliente.cpf_cnpj_digitos == termo_limpo
+    filtro_telefone = or_(
+        Cliente.telefone_digitos == termo_limpo,
+        Cliente.telefone2_digitos == termo_limpo,
+        Cliente.whatsapp_digitos == termo_limpo
+    )
+    query_ativos = db.query(Cliente).filter(Cliente.ativo == True)
+
+    if len(termo_limpo) != 11:
         # Buscar por CPF/CNPJ
-        cliente = db.query(Cliente).filter(
-            func.regexp_replace(Cliente.cpf_cnpj, '[^0-9]', '', 'g') == termo_limpo
-        ).filter(Cliente.ativo == True).first()
+        cliente = query_ativos.filter(filtro_cpf).first()
     else:
-        # Buscar apenas por telefone
-        cliente = db.query(Cliente).filter(
-            or_(
-                func.regexp_replace(Cliente.telefone, '[^0-9]', '', 'g') == termo_limpo,
-                func.regexp_replace(Cliente.telefone2, '[^0-9]', '', 'g') == termo_limpo,
-                func.regexp_replace(Cliente.whatsapp, '[^0-9]', '', 'g') == termo_limpo
-            )
-        ).filter(Cliente.ativo == True).first()
-    
-    # Se não encontrou e é 11 dígitos, tentar a busca alternativa
-    if not cliente and len(termo_limpo) == 11:
-        if buscar_como_cpf:
-            # Tentou CPF, agora tentar telefone
-            logger.info("CPF não encontrado, tentando como telefone...")
-            cliente = db.query(Cliente).filter(
-                or_(
-                    func.regexp_replace(Cliente.telefone, '[^0-9]', '', 'g') == termo_limpo,
-                    func.regexp_replace(Cliente.telefone2, '[^0-9]', '', 'g') == termo_limpo,
-                    func.regexp_replace(Cliente.whatsapp, '[^0-9]', '', 'g') == termo_limpo
-                )
-            ).filter(Cliente.ativo == True).first()
-        else:
-            # Tentou telefone, agora tentar CPF
-            logger.info("Telefone não encontrado, tentando como CPF...")
-            cliente = db.query(Cliente).filter(
-                func.regexp_replace(Cliente.cpf_cnpj, '[^0-9]', '', 'g') == termo_limpo
-            ).filter(Cliente.ativo == True).first()
+        # 11 dígitos podem ser CPF ou celular: uma única consulta nas duas
+        # interpretações, preferindo a indicada pelo dígito verificador
+        prioridade_cpf = 0 if buscar_como_cpf else 1
+        cliente = query_ativos.filter(or_(filtro_cpf, filtro_telefone)).order_by(
+            case((filtro_cpf, prioridade_cpf), else_=1 - prioridade_cpf),
+            Cliente.id
+        ).first()
     
     if not cliente:
         logger.info(f"Cliente não encontrado para termo: '{termo}'")
@@ -671,16 +636,16 @@ def buscar_veiculo_por_placa(busca: VeiculoBuscaRequest, db: Session = Depends(g
             message="Placa não pode estar vazia"
         )
     
-    # Remove caracteres especiais da placa para busca mais flexível
-    placa_limpa = ''.join(filter(str.isalnum, placa))
-    
-    # Buscar veículo por placa
-    veiculo = db.query(Veiculo).filter(
-        or_(
-            Veiculo.placa.ilike(f"%{placa}%"),
-            Veiculo.placa.ilike(f"%{placa_limpa}%")
-        )
-    ).filter(Veiculo.ativo == True).first()
+    # Placa canônica (sem formatação); a busca usa o índice de placa_normalizada
+    placa_limpa = normalizar_placa(placa)
+    query_ativos = db.query(Veiculo).filter(Veiculo.ativo == True)
+
+    veiculo = query_ativos.filter(filtro_placa_exata(placa_limpa)).first()
+    if not veiculo and placa_limpa:
+        # Placa digitada pela metade: primeira placa que começa com o prefixo
+        veiculo = query_ativos.filter(filtro_placa_prefixo(placa_limpa)).order_by(
+            Veiculo.placa_normalizada
+        ).first()
     
     if not veiculo:
         logger.info(f"Veículo não encontrado para placa: '{placa}'")
@@ -758,25 +723,8 @@ def buscar_produtos_autocomplete(
     limit: int = 20,
     db: Session = Depends(get_db)
 ):
-    """Buscar produtos para autocomplete na ordem de serviço"""
-    query = db.query(Produto).filter(
-        and_(
-            Produto.ativo == True,
-            Produto.quantidade_atual > 0  # Só produtos com estoque
-        )
-    )
-    
-    if search.strip():
-        query = query.filter(
-            or_(
-                Produto.codigo.ilike(f"%{search}%"),
-                Produto.nome.ilike(f"%{search}%"),
-                Produto.descricao.ilike(f"%{search}%")
-            )
-        )
-    
-    produtos = query.order_by(Produto.nome).limit(limit).all()
-    return produtos
+    """Buscar produtos para autocomplete na ordem de serviço (índice em memória do worker)"""
+    return autocompletar_produtos(db, search, limit)
 
 @router.get("/produtos/{produto_id}/lotes-disponiveis")
 def buscar_lotes_disponiveis_produto(
@@ -829,8 +777,10 @@ def buscar_lotes_disponiveis_produto(
 
 @router.get("/", response_model=List[OrdemServicoNovaList])
 def listar_ordens_servico(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    after: Optional[str] = None,
     search: Optional[str] = None,
     cliente_id: Optional[int] = None,
     veiculo_id: Optional[int] = None,
@@ -840,7 +790,11 @@ def listar_ordens_servico(
     data_fim: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Listar ordens de serviço com filtros"""
+    """Listar ordens de serviço com filtros.
+
+    Com after= (cursor do cabeçalho X-Next-Cursor da página anterior) a
+    listagem segue por keyset em (data_abertura, id) e skip é ignorado.
+    """
     query = db.query(OrdemServico).options(
         joinedload(OrdemServico.cliente),
         joinedload(OrdemServico.veiculo)
@@ -856,18 +810,7 @@ def listar_ordens_servico(
         query = query.filter(OrdemServico.tipo_ordem == tipo_ordem)
 
     if search and search.strip():
-        termo_busca = search.strip()
-        termo_numero = termo_busca.lstrip("#").strip()
-        termo_numero_like = f"%{termo_numero}%" if termo_numero else f"%{termo_busca}%"
-        termo_like = f"%{termo_busca}%"
-
-        query = query.filter(
-            or_(
-                OrdemServico.numero.ilike(termo_numero_like),
-                OrdemServico.cliente.has(Cliente.nome.ilike(termo_like)),
-                OrdemServico.veiculo.has(Veiculo.placa.ilike(termo_like)),
-            )
-        )
+        query = query.filter(filtro_busca_ordens(search.strip()))
     
     if status:
         status_normalizado = normalizar_status_ordem(status)
@@ -895,33 +838,35 @@ def listar_ordens_servico(
         except ValueError:
             pass
     
-    query_ordenada = query.order_by(OrdemServico.data_abertura.desc()).offset(skip)
+    query = ordenar_keyset(query, OrdemServico.data_abertura, OrdemServico.id)
 
-    # Quando houver busca textual, retornamos todos os resultados filtrados para
-    # permitir encontrar OS antigas sem ficar restrito aos últimos 100 registros.
-    if search and search.strip():
-        ordens = query_ordenada.all()
+    if after:
+        query = filtrar_apos_cursor(query, OrdemServico.data_abertura, OrdemServico.id, after)
+        limit = limitar_pagina(limit)
     else:
-        ordens = query_ordenada.limit(limit).all()
+        query = query.offset(skip)
+        # Busca textual pagina pelo cursor em vez de devolver todos os resultados
+        if search and search.strip():
+            limit = limitar_pagina(limit)
+
+    ordens = query.limit(limit).all()
+    definir_cabecalho_cursor(
+        response,
+        proximo_cursor(ordens, limit, lambda ordem: (ordem.data_abertura, ordem.id))
+    )
     
     # Enriquecer com dados do cliente e veículo
+    # Taxas resolvidas com uma única leitura da tabela de máquinas para toda a página
+    resolvedor_taxa = ResolvedorTaxaPagamento(db)
     result = []
     for ordem in ordens:
         # Usar data_ordem (DateTime) se disponível, senão data_abertura (Date)
         data_ordem_completa = ordem.data_ordem if ordem.data_ordem else ordem.data_abertura
         
-        # Recalcular valor_faturado dinamicamente
-        # valor_faturado = valor_total - valor_custo_pecas - valor_mao_obra_avulso
-        valor_total = ordem.valor_total or Decimal('0.00')
+        # valor_faturado gravado na escrita (recalculado apenas para ordens sem snapshot atual)
         valor_custo_pecas = ordem.valor_custo_pecas or Decimal('0.00')
         valor_mao_obra_avulso = ordem.valor_mao_obra_avulso or Decimal('0.00')
-        taxa_pagamento_aplicada = obter_taxa_pagamento_aplicada(ordem, db)
-        valor_faturado_calculado = calcular_valor_faturado_liquido(
-            valor_total=valor_total,
-            valor_custo_pecas=valor_custo_pecas,
-            valor_mao_obra_avulso=valor_mao_obra_avulso,
-            taxa_pagamento_aplicada=taxa_pagamento_aplicada,
-        )
+        taxa_pagamento_aplicada, valor_faturado = obter_valores_financeiros(ordem, db, resolvedor_taxa)
         
         ordem_dict = {
             "id": ordem.id,
@@ -933,7 +878,7 @@ def listar_ordens_servico(
             "tipo_ordem": ordem.tipo_ordem,
             "data_abertura": data_ordem_completa,  # Usar data_ordem com hora completa
             "data_conclusao": ordem.data_conclusao,
-            "status": normalizar_status_ordem(ordem.status) or ordem.status,
+            "status": ordem.status,
             "valor_servico": ordem.valor_servico,
             "valor_pecas": ordem.valor_pecas,
             "valor_desconto": ordem.valor_desconto,
@@ -944,26 +889,23 @@ def listar_ordens_servico(
             "numero_parcelas": ordem.numero_parcelas or 1,
             "formas_pagamento": parse_formas_pagamento_json(ordem.formas_pagamento),
             "taxa_pagamento_aplicada": taxa_pagamento_aplicada,
-            "valor_faturado": valor_faturado_calculado  # Recalculado dinamicamente
+            "valor_faturado": valor_faturado
         }
         result.append(OrdemServicoNovaList(**ordem_dict))
     
     return result
 
 
-def montar_ordem_listagem(ordem: OrdemServico, db: Session) -> OrdemServicoNovaList:
+def montar_ordem_listagem(
+    ordem: OrdemServico,
+    db: Session,
+    resolvedor_taxa: Optional[ResolvedorTaxaPagamento] = None,
+) -> OrdemServicoNovaList:
     data_ordem_completa = ordem.data_ordem if ordem.data_ordem else ordem.data_abertura
 
-    valor_total = ordem.valor_total or Decimal('0.00')
     valor_custo_pecas = ordem.valor_custo_pecas or Decimal('0.00')
     valor_mao_obra_avulso = ordem.valor_mao_obra_avulso or Decimal('0.00')
-    taxa_pagamento_aplicada = obter_taxa_pagamento_aplicada(ordem, db)
-    valor_faturado_calculado = calcular_valor_faturado_liquido(
-        valor_total=valor_total,
-        valor_custo_pecas=valor_custo_pecas,
-        valor_mao_obra_avulso=valor_mao_obra_avulso,
-        taxa_pagamento_aplicada=taxa_pagamento_aplicada,
-    )
+    taxa_pagamento_aplicada, valor_faturado = obter_valores_financeiros(ordem, db, resolvedor_taxa)
 
     ordem_dict = {
         "id": ordem.id,
@@ -975,7 +917,7 @@ def montar_ordem_listagem(ordem: OrdemServico, db: Session) -> OrdemServicoNovaL
         "tipo_ordem": ordem.tipo_ordem,
         "data_abertura": data_ordem_completa,
         "data_conclusao": ordem.data_conclusao,
-        "status": normalizar_status_ordem(ordem.status) or ordem.status,
+        "status": ordem.status,
         "valor_servico": ordem.valor_servico,
         "valor_pecas": ordem.valor_pecas,
         "valor_desconto": ordem.valor_desconto,
@@ -986,7 +928,7 @@ def montar_ordem_listagem(ordem: OrdemServico, db: Session) -> OrdemServicoNovaL
         "numero_parcelas": ordem.numero_parcelas or 1,
         "formas_pagamento": parse_formas_pagamento_json(ordem.formas_pagamento),
         "taxa_pagamento_aplicada": taxa_pagamento_aplicada,
-        "valor_faturado": valor_faturado_calculado,
+        "valor_faturado": valor_faturado,
     }
 
     return OrdemServicoNovaList(**ordem_dict)
@@ -996,6 +938,7 @@ def montar_ordem_listagem(ordem: OrdemServico, db: Session) -> OrdemServicoNovaL
 def listar_ordens_servico_paginado(
     page: int = 1,
     page_size: int = 10,
+    after: Optional[str] = None,
     search: Optional[str] = None,
     cliente_id: Optional[int] = None,
     veiculo_id: Optional[int] = None,
@@ -1005,7 +948,11 @@ def listar_ordens_servico_paginado(
     data_fim: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Listar ordens de serviço com paginação server-side."""
+    """Listar ordens de serviço com paginação server-side.
+
+    Com after= (next_cursor da página anterior) a página é buscada por keyset
+    em vez de offset; page continua sendo devolvido apenas como referência.
+    """
     query = db.query(OrdemServico).options(
         joinedload(OrdemServico.cliente),
         joinedload(OrdemServico.veiculo)
@@ -1021,18 +968,7 @@ def listar_ordens_servico_paginado(
         query = query.filter(OrdemServico.tipo_ordem == tipo_ordem)
 
     if search and search.strip():
-        termo_busca = search.strip()
-        termo_numero = termo_busca.lstrip("#").strip()
-        termo_numero_like = f"%{termo_numero}%" if termo_numero else f"%{termo_busca}%"
-        termo_like = f"%{termo_busca}%"
-
-        query = query.filter(
-            or_(
-                OrdemServico.numero.ilike(termo_numero_like),
-                OrdemServico.cliente.has(Cliente.nome.ilike(termo_like)),
-                OrdemServico.veiculo.has(Veiculo.placa.ilike(termo_like)),
-            )
-        )
+        query = query.filter(filtro_busca_ordens(search.strip()))
 
     if status:
         status_normalizado = normalizar_status_ordem(status)
@@ -1055,47 +991,83 @@ def listar_ordens_servico_paginado(
         except ValueError:
             pass
 
-    total = query.count()
     page = max(1, page)
     page_size = max(1, min(page_size, 100))
-    skip = (page - 1) * page_size
+    filtrado = any((
+        search and search.strip(), cliente_id, veiculo_id, tipo_ordem, status, data_inicio, data_fim
+    ))
+
+    # Sem filtros o total vem do cache (invalidado a cada escrita de OS)
+    def total_sem_filtros():
+        total = obter_ou_calcular(
+            "ordens_total",
+            {},
+            [TAG_ORDENS],
+            lambda: db.query(func.count(OrdemServico.id)).scalar(),
+            ttl=TTL_TOTAL_LISTAGEM_SEGUNDOS,
+        )
+        return total, True
 
-    ordens = query.order_by(OrdemServico.data_abertura.desc()).offset(skip).limit(page_size).all()
+    pagina = paginar_com_total(
+        query, page, page_size, after, OrdemServico.data_abertura, OrdemServico.id, filtrado, total_sem_filtros
+    )
+    ordens = pagina.itens
+    total = pagina.total
     total_pages = (total + page_size - 1) // page_size if total > 0 else 1
+    resolvedor_taxa = ResolvedorTaxaPagamento(db)
 
     return {
-        "items": [montar_ordem_listagem(ordem, db) for ordem in ordens],
+        "items": [montar_ordem_listagem(ordem, db, resolvedor_taxa) for ordem in ordens],
         "total": total,
+        "total_exato": pagina.total_exato,
         "page": page,
         "page_size": page_size,
         "total_pages": total_pages,
+        "next_cursor": proximo_cursor(ordens, page_size, lambda ordem: (ordem.data_abertura, ordem.id)),
     }
 
 @router.get("/estatisticas")
+@cache_resposta("ordens_estatisticas", tags=[TAG_ORDENS], ttl=30)
 def obter_estatisticas_ordens(db: Session = Depends(get_db)):
     """Obter estatísticas das ordens de serviço"""
     try:
-        # Contar por status
-        total = db.query(OrdemServico).count()
-        pendentes = db.query(OrdemServico).filter(filtro_status_ordem(OrdemServico.status, "PENDENTE")).count()
-        em_andamento = db.query(OrdemServico).filter(filtro_status_ordem(OrdemServico.status, "EM_ANDAMENTO")).count()
-        aguardando_peca = db.query(OrdemServico).filter(filtro_status_ordem(OrdemServico.status, "AGUARDANDO_PECA")).count()
-        aguardando_aprovacao = db.query(OrdemServico).filter(filtro_status_ordem(OrdemServico.status, "AGUARDANDO_APROVACAO")).count()
-        concluidas = db.query(OrdemServico).filter(filtro_status_ordem(OrdemServico.status, "CONCLUIDA")).count()
-        canceladas = db.query(OrdemServico).filter(filtro_status_ordem(OrdemServico.status, "CANCELADA")).count()
-        
-        # Calcular valores
-        resultado_valor_total = db.query(
-            func.coalesce(func.sum(OrdemServico.valor_total), 0)
-        ).scalar()
-        
-        resultado_valor_mes = db.query(
+        # Intervalo do mês corrente em colunas puras
+        inicio_mes_atual = date.today().replace(day=1)
+        if inicio_mes_atual.month == 12:
+            inicio_proximo_mes = date(inicio_mes_atual.year + 1, 1, 1)
+        else:
+            inicio_proximo_mes = date(inicio_mes_atual.year, inicio_mes_atual.month + 1, 1)
+
+        # Contagens e totais por status numa consulta agrupada
+        linhas_status = db.query(
+            OrdemServico.status,
+            func.count(OrdemServico.id).label('quantidade'),
+            func.coalesce(func.sum(OrdemServico.valor_total), 0).label('valor_total'),
+        ).group_by(OrdemServico.status).all()
+
+        # Total do mês em consulta própria: o intervalo no WHERE usa o índice em created_at
+        resultado_valor_mes = _decimal(db.query(
             func.coalesce(func.sum(OrdemServico.valor_total), 0)
         ).filter(
-            filtro_status_ordem(OrdemServico.status, "CONCLUIDA"),
-            func.extract('month', OrdemServico.created_at) == func.extract('month', func.now()),
-            func.extract('year', OrdemServico.created_at) == func.extract('year', func.now())
-        ).scalar()
+            OrdemServico.status == "CONCLUIDA",
+            OrdemServico.created_at >= inicio_mes_atual,
+            OrdemServico.created_at < inicio_proximo_mes,
+        ).scalar())
+
+        contagem_status: Dict[str, int] = {}
+        total = 0
+        resultado_valor_total = Decimal('0.00')
+        for linha in linhas_status:
+            contagem_status[linha.status] = linha.quantidade
+            total += linha.quantidade
+            resultado_valor_total += _decimal(linha.valor_total)
+
+        pendentes = contagem_status.get("PENDENTE", 0)
+        em_andamento = contagem_status.get("EM_ANDAMENTO", 0)
+        aguardando_peca = contagem_status.get("AGUARDANDO_PECA", 0)
+        aguardando_aprovacao = contagem_status.get("AGUARDANDO_APROVACAO", 0)
+        concluidas = contagem_status.get("CONCLUIDA", 0)
+        canceladas = contagem_status.get("CANCELADA", 0)
         
         return {
             "total": total,
@@ -1142,13 +1114,8 @@ def buscar_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
     # Calcular valor_subtotal já que é uma property readonly que retorna None
     valor_subtotal_calculado = (ordem.valor_pecas or Decimal('0')) + (ordem.valor_servico or Decimal('0'))
     
-    # Recalcular valor_faturado dinamicamente
-    # valor_faturado = valor_total - valor_custo_pecas - valor_mao_obra_avulso - taxa_pagamento_aplicada
-    valor_total = ordem.valor_total or Decimal('0.00')
-    valor_custo_pecas = ordem.valor_custo_pecas or Decimal('0.00')
-    valor_mao_obra_avulso = ordem.valor_mao_obra_avulso or Decimal('0.00')
-    taxa_pagamento_aplicada = obter_taxa_pagamento_aplicada(ordem, db)
-    valor_faturado_calculado = valor_total - valor_custo_pecas - valor_mao_obra_avulso - taxa_pagamento_aplicada
+    # valor_faturado gravado na escrita (lucro líquido já com a taxa de pagamento)
+    _, valor_faturado = obter_valores_financeiros(ordem, db)
     
     response_data = {
         "id": ordem.id,
@@ -1166,7 +1133,7 @@ def buscar_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
         "tipo_desconto": ordem.tipo_desconto or 'TOTAL',  # Evitar None
         "observacoes": ordem.observacoes,
         "funcionario_responsavel": ordem.funcionario_responsavel,
-        "status": normalizar_status_ordem(ordem.status) or ordem.status,
+        "status": ordem.status,
         "data_abertura": ordem.data_abertura,
         "data_conclusao": ordem.data_conclusao,
         "valor_pecas": ordem.valor_pecas,
@@ -1174,7 +1141,7 @@ def buscar_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
         "valor_desconto": ordem.valor_desconto,
         "valor_total": ordem.valor_total,
         "valor_custo_pecas": ordem.valor_custo_pecas or Decimal('0.00'),  # Custo real das peças
-        "valor_faturado": valor_faturado_calculado,  # Valor faturado recalculado (lucro líquido)
+        "valor_faturado": valor_faturado,  # Valor faturado (lucro líquido)
         "tempo_gasto_horas": ordem.tempo_gasto_horas or Decimal('0'),  # Evitar None
         "aprovado_cliente": ordem.aprovado_cliente,
         "forma_pagamento": ordem.forma_pagamento,
@@ -1215,7 +1182,7 @@ def buscar_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
     
     return OrdemServicoNovaResponse(**response_data)
 
-def calcular_valores_ordem(ordem_data: dict, itens: List[ItemOrdem], movimentos_estoque: List[MovimentoEstoque] = None, db: Session = None) -> dict:
+def calcular_valores_ordem(ordem_data: dict, itens: List[ItemOrdem], movimentos_estoque: List[MovimentoEstoque] = None, db: Session = None, custos_itens: Optional[List[Decimal]] = None) -> dict:
     """Calcular valores da ordem de serviço
     
     Valor Total (cobrado ao cliente) = Valor Serviço + Valor Venda Peças - Desconto
@@ -1226,13 +1193,14 @@ def calcular_valores_ordem(ordem_data: dict, itens: List[ItemOrdem], movimentos_
         itens: Lista de itens da ordem
         movimentos_estoque: Lista de movimentos de estoque para calcular custo real das peças
         db: Session do banco (necessário para calcular custo FIFO quando criar nova ordem)
+        custos_itens: Custos já calculados em lote (alinhados com itens); dispensa consultas por item
     """
     valor_venda_pecas = Decimal('0.00')  # Valor de VENDA das peças (cobrado do cliente)
     valor_custo_pecas = Decimal('0.00')  # Valor de CUSTO das peças (o que foi pago ao fornecedor)
     valor_servico = ordem_data.get('valor_servico', Decimal('0.00'))
     
     # Somar valores dos itens (valor de venda) e buscar custo real das peças
-    for item in itens:
+    for indice, item in enumerate(itens):
         if item.tipo == "PRODUTO":
             valor_venda_pecas += item.valor_total
             
@@ -1241,33 +1209,21 @@ def calcular_valores_ordem(ordem_data: dict, itens: List[ItemOrdem], movimentos_
             
             logger.info(f"📦 Processando item: produto_id={item.produto_id}, quantidade={item.quantidade}, tipo={item.tipo}")
             
+            # Custo já calculado em lote pelo chamador
+            if custos_itens is not None:
+                custo_item = custos_itens[indice]
             # Se há movimentos de estoque (ordem já foi processada), usar o saldo líquido
-            if movimentos_estoque:
+            elif movimentos_estoque:
                 logger.info(f"  ✅ Buscando custo líquido via movimentos de estoque")
                 custo_item = calcular_custo_ativo_movimentos(movimentos_estoque, item.produto_id)
             # Se está criando ordem nova e temos db, calcular via FIFO
             elif db and item.produto_id:
                 logger.info(f"  ✅ Calculando custo via FIFO (ordem nova)")
-                try:
-                    custo_fifo = calcular_custo_lotes_fifo(db, item.produto_id, float(item.quantidade))
-                    custo_item = Decimal(str(custo_fifo))
-                    logger.info(f"  ✅ Custo FIFO calculado: R${custo_fifo:.2f}")
-                    if custo_item <= 0:
-                        produto = db.query(Produto).filter(Produto.id == item.produto_id).first()
-                        if produto and produto.preco_custo:
-                            custo_item = Decimal(str(produto.preco_custo)) * Decimal(str(item.quantidade))
-                            logger.warning(f"  ✅ FIFO retornou zero; usando preco_custo do produto: R${produto.preco_custo:.2f} x {item.quantidade} = R${custo_item:.2f}")
-                except Exception as e:
-                    logger.warning(f"⚠️ Erro ao calcular custo FIFO para produto {item.produto_id}: {e}")
-                    logger.warning(f"  Tentando usar preco_custo do produto como fallback...")
-                    # Fallback: usar o preco_custo do produto
+                custo_fifo = calcular_custos_fifo(db, [(item.produto_id, item.quantidade)])[item.produto_id]
+                produto = None
+                if not custo_fifo.suficiente or custo_fifo.custo_total <= 0:
                     produto = db.query(Produto).filter(Produto.id == item.produto_id).first()
-                    if produto and produto.preco_custo:
-                        custo_item = Decimal(str(produto.preco_custo)) * Decimal(str(item.quantidade))
-                        logger.warning(f"  ✅ Usando preco_custo do produto: R${produto.preco_custo:.2f} x {item.quantidade} = R${custo_item:.2f}")
-                    else:
-                        logger.warning(f"  ❌ Nenhum custo encontrado, usando 0")
-                        custo_item = Decimal('0.00')
+                custo_item = custo_unitario_fifo(custo_fifo, produto) * _decimal(item.quantidade)
             
             valor_custo_pecas += custo_item
     
@@ -1365,21 +1321,34 @@ async def criar_ordem_servico(request: Request, db: Session = Depends(get_db)):
                 detail="Veículo não encontrado ou não pertence ao cliente"
             )
     
-    # Validar itens de produto se houver
+    # Validar itens de produto se houver (uma consulta para todos os produtos)
+    quantidades_por_produto: Dict[int, Decimal] = {}
     for item in ordem_data.itens:
         if item.tipo == "PRODUTO" and item.produto_id:
-            produto = db.query(Produto).filter(Produto.id == item.produto_id).first()
-            if not produto:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"Produto {item.produto_id} não encontrado"
-                )
-            
-            if produto.quantidade_atual < item.quantidade:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Estoque insuficiente para o produto {produto.nome}. Disponível: {produto.quantidade_atual}"
-                )
+            quantidades_por_produto[item.produto_id] = (
+                quantidades_por_produto.get(item.produto_id, Decimal('0')) + _decimal(item.quantidade)
+            )
+
+    produtos: Dict[int, Produto] = {}
+    if quantidades_por_produto:
+        produtos = {
+            produto.id: produto
+            for produto in db.query(Produto).filter(Produto.id.in_(list(quantidades_por_produto))).all()
+        }
+
+    for produto_id, quantidade in quantidades_por_produto.items():
+        produto = produtos.get(produto_id)
+        if not produto:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Produto {produto_id} não encontrado"
+            )
+
+        if _decimal(produto.quantidade_atual) < quantidade:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Estoque insuficiente para o produto {produto.nome}. Disponível: {produto.quantidade_atual}"
+            )
     
     # Gerar número da ordem
     numero = gerar_numero_ordem(db)
@@ -1391,7 +1360,7 @@ async def criar_ordem_servico(request: Request, db: Session = Depends(get_db)):
         if ordem_dict.get('veiculo_id') in (0, '0'):
             ordem_dict['veiculo_id'] = None
         if ordem_dict.get('status'):
-            ordem_dict['status'] = normalizar_status_ordem(ordem_dict.get('status'))
+            ordem_dict['status'] = validar_status_ordem(ordem_dict.get('status'))
 
         formas_pagamento_create = ordem_dict.pop('formas_pagamento', None)
         if formas_pagamento_create:
@@ -1430,7 +1399,7 @@ async def criar_ordem_servico(request: Request, db: Session = Depends(get_db)):
             detail=f"Erro ao criar ordem de serviço: {str(e)}"
         )
     
-    # Processar itens
+    # Processar itens (inseridos em lote no flush)
     itens_criados = []
     try:
         for item_data in ordem_data.itens:
@@ -1440,8 +1409,8 @@ async def criar_ordem_servico(request: Request, db: Session = Depends(get_db)):
             # Calcular valor total do item
             item.valor_total = item.quantidade * item.valor_unitario
             
-            db.add(item)
             itens_criados.append(item)
+        db.add_all(itens_criados)
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -1451,7 +1420,14 @@ async def criar_ordem_servico(request: Request, db: Session = Depends(get_db)):
     
     # Calcular valores totais
     try:
-        valores = calcular_valores_ordem(ordem_dict, itens_criados, db=db)
+        # Custo FIFO de toda a cesta em memória: uma consulta de lotes para todos os produtos
+        custos_fifo = calcular_custos_fifo(db, quantidades_por_produto.items())
+        custos_itens = [
+            custo_unitario_fifo(custos_fifo.get(item.produto_id), produtos.get(item.produto_id)) * _decimal(item.quantidade)
+            if item.tipo == "PRODUTO" and item.produto_id else Decimal('0.00')
+            for item in itens_criados
+        ]
+        valores = calcular_valores_ordem(ordem_dict, itens_criados, db=db, custos_itens=custos_itens)
         ordem.valor_pecas = valores['valor_pecas']
         ordem.valor_servico = valores['valor_servico']
         # valor_subtotal ?? uma property readonly, não pode ser setado
@@ -1460,6 +1436,7 @@ async def criar_ordem_servico(request: Request, db: Session = Depends(get_db)):
         ordem.valor_total = valores['valor_total']
         ordem.valor_custo_pecas = valores['valor_custo_pecas']
         ordem.valor_faturado = valores['valor_faturado']
+        gravar_snapshot_financeiro(ordem, db)
         
         # Campos de compatibilidade
         ordem.valor_mao_obra = ordem.valor_servico
@@ -1472,6 +1449,7 @@ async def criar_ordem_servico(request: Request, db: Session = Depends(get_db)):
                 veiculo.km_atual = ordem.km_veiculo
         
         db.commit()
+        invalidar_cache(TAG_ORDENS, TAG_ESTOQUE)
         db.refresh(ordem)
     except Exception as e:
         db.rollback()
@@ -1479,16 +1457,21 @@ async def criar_ordem_servico(request: Request, db: Session = Depends(get_db)):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao finalizar criação da ordem: {str(e)}"
         )
+
+    if ordem.status == "CONCLUIDA":
+        registrar_alteracao_estatisticas_cliente(db, [ordem.cliente_id])
     
     # Retornar ordem criada
     return buscar_ordem_servico(ordem.id, db)
 
 def criar_historico_manutencao(ordem: OrdemServico, db: Session):
     """
-    Cria um registro no histórico de manutenções quando uma ordem de serviço é concluída.
-    Analisa os itens de serviço para determinar o tipo de manutenção e sugerir a pr??xima revisão.
+    Cria os registros do histórico de manutenções quando uma ordem de serviço é concluída.
+    Cada item de serviço é classificado pelas sugestões de manutenção cadastradas
+    (services/classificador_manutencao_service.py): um registro por tipo reconhecido,
+    com a próxima revisão pelo intervalo da sugestão.
     """
-    # Verificar se a ordem tem veículo associado e se ?? do tipo SERVICO ou VENDA_SERVICO
+    # Verificar se a ordem tem veículo associado e se é do tipo SERVICO ou VENDA_SERVICO
     if not ordem.veiculo_id or ordem.tipo_ordem not in ["SERVICO", "VENDA_SERVICO"]:
         return
     
@@ -1512,79 +1495,168 @@ def criar_historico_manutencao(ordem: OrdemServico, db: Session):
             ItemOrdem.ordem_id == ordem.id,
             ItemOrdem.tipo == "SERVICO"
         )
-    ).all()
-    
-    # Se não houver itens de serviço, usar descrição genérica
-    if not itens_servico:
-        tipo_manutencao = "Manutenção"
-        descricao_completa = ordem.descricao_servico or ordem.descricao_problema or "Serviço realizado"
-    else:
-        # Combinar descrições dos serviços
-        descricoes = [item.descricao for item in itens_servico if item.descricao]
-        tipo_manutencao = descricoes[0] if descricoes else "Manutenção"
-        descricao_completa = ", ".join(descricoes) if descricoes else "Serviços realizados"
-    
-    # Determinar kilometragem da pr??xima manutenção baseado no tipo de serviço
-    km_proxima = None
-    intervalo_km = None
-    
-    # Análise inteligente do tipo de serviço para sugerir pr??xima revisão
-    descricao_lower = descricao_completa.lower()
-    
-    if "óleo" in descricao_lower or "oleo" in descricao_lower or "lubrificante" in descricao_lower:
-        intervalo_km = 5000  # Troca de óleo geralmente a cada 5000 km
-    elif "filtro" in descricao_lower and "óleo" not in descricao_lower:
-        intervalo_km = 10000  # Filtros diversos
-    elif "correia" in descricao_lower:
-        intervalo_km = 50000  # Correia dentada/poly
-    elif "vela" in descricao_lower:
-        intervalo_km = 20000  # Velas de ignição
-    elif "freio" in descricao_lower or "pastilha" in descricao_lower or "disco" in descricao_lower:
-        intervalo_km = 30000  # Sistema de freios
-    elif "amortecedor" in descricao_lower or "suspensão" in descricao_lower or "suspensao" in descricao_lower:
-        intervalo_km = 40000  # Suspens??o
-    elif "pneu" in descricao_lower or "balanceamento" in descricao_lower or "alinhamento" in descricao_lower:
-        intervalo_km = 10000  # Rodízio/alinhamento de pneus
-    elif "bateria" in descricao_lower:
-        intervalo_km = 50000  # Bateria
-    elif "ar condicionado" in descricao_lower or "climatizador" in descricao_lower:
-        intervalo_km = 15000  # Ar condicionado
-    elif "revisão" in descricao_lower or "revisao" in descricao_lower or "inspeção" in descricao_lower or "inspecao" in descricao_lower:
-        intervalo_km = 10000  # Revis??o geral
-    else:
-        # Serviço gen??rico - sugerir revisão padrão
-        intervalo_km = 10000
-    
-    # Calcular km da pr??xima manutenção
-    km_atual = ordem.km_veiculo or veiculo.km_atual
-    if km_atual and intervalo_km:
-        km_proxima = km_atual + intervalo_km
-    
-    # Calcular data estimada da pr??xima manutenção (assumindo m??dia de 1000 km/mês)
-    data_proxima = None
-    if km_proxima and km_atual:
-        km_restantes = km_proxima - km_atual
-        meses_estimados = km_restantes / 1000  # Estimativa: 1000 km por mês
-        from dateutil.relativedelta import relativedelta
-        data_hoje = date.today()
-        data_proxima = data_hoje + relativedelta(months=int(meses_estimados))
-    
-    # Criar registro de histórico
-    historico = ManutencaoHistorico(
-        veiculo_id=ordem.veiculo_id,
-        tipo=tipo_manutencao[:100],  # Limitar a 100 caracteres
-        descricao=descricao_completa,
-        km_realizada=km_atual,
-        data_realizada=ordem.data_conclusao.date() if ordem.data_conclusao else date.today(),
-        km_proxima=km_proxima,
-        data_proxima=data_proxima,
-        valor=ordem.valor_total,
-        observacoes=ordem.observacoes,
-        ordem_servico_id=ordem.id
-    )
+    ).order_by(ItemOrdem.id).all()
     
-    db.add(historico)
-    logger.info(f"Histórico de manutenção criado para OS {ordem.numero} - Ve??culo {veiculo.placa} - Próxima em {km_proxima} km")
+    historicos = montar_historicos(ordem, itens_servico, veiculo.km_atual, obter_classificador(db))
+    db.add_all([ManutencaoHistorico(**historico) for historico in historicos])
+    for historico in historicos:
+        logger.info(f"Histórico de manutenção criado para OS {ordem.numero} - Veículo {veiculo.placa} - {historico['tipo']} - Próxima em {historico['km_proxima']} km")
+
+ESTADOS_COM_BAIXA = ("CONCLUIDA", "EM_ANDAMENTO")
+
+def reconciliar_estoque_ordem(
+    db: Session,
+    ordem: OrdemServico,
+    previous_status: str,
+    itens_anteriores: Dict[int, Dict[str, Any]],
+    itens_atuais: List[ItemOrdem],
+    itens_alterados: bool,
+) -> List[MovimentoEstoque]:
+    """
+    Gera em lote as movimentações de estoque de uma edição de OS.
+
+    - Entrada em EM_ANDAMENTO/CONCLUIDA: saída da quantidade atual de cada item;
+    - Já com baixa e itens alterados: saída ou devolução apenas da diferença de cada item;
+    - Demais status: devolve, por produto, o que as movimentações da OS ainda mantêm fora do estoque.
+
+    Faz uma consulta de movimentos da OS e uma de produtos, reserva todas as saídas
+    de uma vez e grava totais e movimentos em lote.
+
+    Args:
+        itens_anteriores: Itens de produto antes da edição (id -> produto_id, quantidade, valor_unitario, descricao)
+        itens_atuais: Itens da OS após a edição
+        itens_alterados: Se o payload trouxe itens
+
+    Returns:
+        Todos os movimentos da OS (existentes e novos), em ordem de criação
+    """
+    novo_status = ordem.status
+    movimentos_ordem = db.query(MovimentoEstoque).filter(
+        MovimentoEstoque.ordem_servico_id == ordem.id
+    ).order_by(MovimentoEstoque.id.asc()).all()
+
+    itens_produto = {item.id: item for item in itens_atuais if item.tipo == "PRODUTO" and item.produto_id}
+    saidas: List[Dict[str, Any]] = []
+    entradas: List[Dict[str, Any]] = []
+
+    def linha(produto_id, quantidade, valor_unitario, motivo, observacoes, valor_total=None):
+        return {
+            'item_id': produto_id,
+            'quantidade': quantidade,
+            'preco_unitario': valor_unitario,
+            'valor_total': valor_total if valor_total is not None else ((valor_unitario * quantidade) if valor_unitario else None),
+            'motivo': motivo,
+            'observacoes': observacoes,
+        }
+
+    if novo_status in ESTADOS_COM_BAIXA and previous_status not in ESTADOS_COM_BAIXA:
+        # Baixa completa: cada item provoca saída igual à sua quantidade
+        for item in itens_produto.values():
+            saidas.append(linha(
+                item.produto_id, item.quantidade, item.valor_unitario, "Ordem de Serviço",
+                f"OS {ordem.numero} - {item.descricao} - Status: {novo_status}",
+                valor_total=item.valor_total,
+            ))
+
+    elif novo_status in ESTADOS_COM_BAIXA and itens_alterados:
+        # Ordem já tinha baixa aplicada: aplicar somente o delta de cada item (removidos têm nova quantidade 0)
+        motivo_ajuste = f"Ajuste Ordem de Serviço - OS {ordem.numero}"
+        for item_id in sorted(set(itens_anteriores) | set(itens_produto)):
+            anterior = itens_anteriores.get(item_id)
+            atual = itens_produto.get(item_id)
+
+            if anterior and (atual is None or atual.produto_id != anterior['produto_id']):
+                # Item removido (ou trocado de produto): devolver a quantidade anterior
+                if anterior['quantidade'] > 0:
+                    entradas.append(linha(
+                        anterior['produto_id'], anterior['quantidade'], anterior['valor_unitario'],
+                        f"Ajuste Ordem de Serviço (removido item) - OS {ordem.numero}",
+                        f"Item removido na edição, repondo {anterior['quantidade']}",
+                    ))
+                anterior = None
+            if atual is None:
+                continue
+
+            quantidade_anterior = anterior['quantidade'] if anterior else 0
+            delta = _decimal(atual.quantidade) - _decimal(quantidade_anterior)
+            observacao = f"Ajuste quantidade item id={item_id}: {quantidade_anterior} -> {atual.quantidade}"
+            if delta > 0:
+                saidas.append(linha(atual.produto_id, delta, atual.valor_unitario, motivo_ajuste, observacao))
+            elif delta < 0:
+                entradas.append(linha(atual.produto_id, abs(delta), atual.valor_unitario, motivo_ajuste, observacao))
+
+    elif novo_status not in ESTADOS_COM_BAIXA:
+        # Devolver apenas o que ainda está fora do estoque (saídas - entradas da OS), evitando devoluções duplicadas
+        fora_do_estoque: Dict[int, Decimal] = {}
+        for movimento in movimentos_ordem:
+            quantidade = _decimal(movimento.quantidade)
+            if movimento.tipo == "SAIDA":
+                fora_do_estoque[movimento.item_id] = fora_do_estoque.get(movimento.item_id, Decimal('0')) + quantidade
+            elif movimento.tipo == "ENTRADA":
+                fora_do_estoque[movimento.item_id] = fora_do_estoque.get(movimento.item_id, Decimal('0')) - quantidade
+
+        item_por_produto = {}
+        for anterior in itens_anteriores.values():
+            item_por_produto.setdefault(anterior['produto_id'], anterior)
+        for item in itens_produto.values():
+            item_por_produto[item.produto_id] = {
+                'valor_unitario': item.valor_unitario,
+                'descricao': item.descricao,
+            }
+
+        motivo = "Devolução Ordem de Serviço" if novo_status != "CANCELADA" else "Cancelamento de Ordem"
+        for produto_id, quantidade in fora_do_estoque.items():
+            if quantidade <= 0:
+                continue
+            item = item_por_produto.get(produto_id, {})
+            observacao = f"OS {ordem.numero} - {item.get('descricao') or ''} - Status alterado para: {novo_status}"
+            if novo_status == "CANCELADA" and ordem.motivo_cancelamento:
+                observacao += f" | Motivo: {ordem.motivo_cancelamento}"
+            logger.info(f"Devolucao calculada OS={ordem.numero} produto_id={produto_id} ainda_devolver={quantidade}")
+            entradas.append(linha(produto_id, quantidade, item.get('valor_unitario'), motivo, observacao))
+
+    if not saidas and not entradas:
+        return movimentos_ordem
+
+    # Uma consulta para todos os produtos envolvidos; produtos inexistentes são ignorados
+    produto_ids = {mov['item_id'] for mov in saidas + entradas}
+    produtos = {produto.id: produto for produto in db.query(Produto).filter(Produto.id.in_(list(produto_ids))).all()}
+    saidas = [mov for mov in saidas if mov['item_id'] in produtos]
+    entradas = [mov for mov in entradas if mov['item_id'] in produtos]
+
+    # Reservar todas as saídas de uma vez (trava produtos e lotes consumidos em ordem de id)
+    try:
+        custos_fifo = reservar_estoque(db, [(mov['item_id'], mov['quantidade']) for mov in saidas])
+    except EstoqueInsuficienteError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Estoque insuficiente para o produto {e.nome}"
+        )
+
+    devolucoes: Dict[int, Decimal] = {}
+    for mov in entradas:
+        devolucoes[mov['item_id']] = devolucoes.get(mov['item_id'], Decimal('0')) + _decimal(mov['quantidade'])
+    movimentar_quantidades_produtos(db, devolucoes)
+
+    tz = pytz.timezone('America/Sao_Paulo')
+    agora = datetime.now(tz)
+    novos_movimentos = [
+        MovimentoEstoque(
+            **mov,
+            tipo="SAIDA",
+            # Custo real baseado nos lotes FIFO (produtos antigos sem lotes usam o custo do produto)
+            preco_custo=custo_unitario_fifo(custos_fifo.get(mov['item_id']), produtos[mov['item_id']]),
+            ordem_servico_id=ordem.id,
+            data_movimentacao=agora,
+        )
+        for mov in saidas
+    ] + [
+        MovimentoEstoque(**mov, tipo="ENTRADA", ordem_servico_id=ordem.id, data_movimentacao=agora)
+        for mov in entradas
+    ]
+    db.add_all(novos_movimentos)
+
+    return movimentos_ordem + novos_movimentos
 
 @router.put("/{ordem_id}", response_model=OrdemServicoNovaResponse)
 def atualizar_ordem_servico(
@@ -1602,10 +1674,10 @@ def atualizar_ordem_servico(
     
     # Atualizar apenas campos não nulos (exceto itens que seráo tratados separadamente)
     # Guardar status anterior para detectar transição corretamente
-    previous_status = normalizar_status_ordem(ordem.status) or ordem.status
+    previous_status = ordem.status
+    data_conclusao_anterior = ordem.data_conclusao
+    cliente_id_anterior = ordem.cliente_id
     disparar_email_fechamento = False
-    if ordem.status != previous_status:
-        ordem.status = previous_status
     update_data = ordem_data.dict(exclude_unset=True)
     itens_payload = update_data.pop('itens', None)
     formas_pagamento_payload = update_data.pop('formas_pagamento', None)
@@ -1615,7 +1687,7 @@ def atualizar_ordem_servico(
         update_data['veiculo_id'] = None
 
     if 'status' in update_data and update_data.get('status') is not None:
-        update_data['status'] = normalizar_status_ordem(update_data.get('status'))
+        update_data['status'] = validar_status_ordem(update_data.get('status'))
 
     valor_total_base = _decimal(update_data.get('valor_total', ordem.valor_total or Decimal('0.00')))
     formas_validas = {'DINHEIRO', 'PIX', 'DEBITO', 'CREDITO'}
@@ -1654,7 +1726,7 @@ def atualizar_ordem_servico(
             ])
 
     # Validar se status est?? mudando para CANCELADA e motivo_cancelamento foi fornecido
-    novo_status = normalizar_status_ordem(update_data.get('status', ordem.status)) or ordem.status
+    novo_status = update_data.get('status') or ordem.status
     if novo_status == "CANCELADA" and previous_status != "CANCELADA":
         motivo = update_data.get('motivo_cancelamento')
         if not motivo or not motivo.strip():
@@ -1665,7 +1737,16 @@ def atualizar_ordem_servico(
 
     # Mapear itens existentes e quantidades ANTES de qualquer alteração
     itens_existentes = {it.id: it for it in ordem.itens}
-    quantidades_anteriores = {it.id: it.quantidade for it in ordem.itens}
+    itens_anteriores = {
+        it.id: {
+            'produto_id': it.produto_id,
+            'quantidade': it.quantidade,
+            'valor_unitario': it.valor_unitario,
+            'descricao': it.descricao,
+        }
+        for it in itens_existentes.values()
+        if it.tipo == "PRODUTO" and it.produto_id
+    }
     
     # Remover campos que s??o properties somente leitura
     update_data.pop('tempo_estimado_horas', None)
@@ -1747,39 +1828,18 @@ def atualizar_ordem_servico(
                     desconto_item=desconto_item or 0,
                     observacoes=observacoes
                 )
-                db.add(novo)
-                db.flush()
                 novos_itens_objs.append(novo)
 
-        # Deletar itens que não vieram no payload (nova quantidade 0)
+        db.add_all(novos_itens_objs)
+
+        # Deletar itens que não vieram no payload (a devolução ao estoque é feita na reconciliação abaixo)
         for existing_id, existing_obj in itens_existentes.items():
             if existing_id not in ids_recebidos:
-                # Se a ordem já tinha baixa aplicada, precisamos devolver a quantidade anterior ao estoque
-                if previous_status in ["CONCLUIDA", "EM_ANDAMENTO"] and quantidades_anteriores.get(existing_id, 0) > 0:
-                    produto = db.query(Produto).filter(Produto.id == existing_obj.produto_id).first()
-                    if produto:
-                        qtd_devolver = quantidades_anteriores.get(existing_id, 0)
-                        tz = pytz.timezone('America/Sao_Paulo')
-                        movimento = MovimentoEstoque(
-                            item_id=produto.id,
-                            tipo="ENTRADA",
-                            quantidade=qtd_devolver,
-                            preco_unitario=existing_obj.valor_unitario,
-                            valor_total=(existing_obj.valor_unitario * qtd_devolver) if existing_obj.valor_unitario else None,
-                            motivo=f"Ajuste Ordem de Serviço (removido item) - OS {ordem.numero}",
-                            observacoes=f"Item removido na edição, repondo {qtd_devolver}",
-                            ordem_servico_id=ordem.id,
-                            data_movimentacao=datetime.now(tz)
-                        )
-                        db.add(movimento)
-                        produto.quantidade_atual += qtd_devolver
-                        # Status do produto é calculado automaticamente pela property
-
                 db.delete(existing_obj)
 
-        # Garantir que ordem.itens reflita o estado atual
+        # Gravar itens em lote e garantir que ordem.itens reflita o estado atual
         db.flush()
-        db.refresh(ordem)
+        db.expire(ordem, ['itens'])
     
     # ========================================
     # LÓGICA DE MOVIMENTAÇÃO DE ESTOQUE
@@ -1802,289 +1862,36 @@ def atualizar_ordem_servico(
     # Baixa de estoque — dois casos:
     # 1) Transição para CONCLUIDA/EM_ANDAMENTO (anteriormente não estava) -> baixa completa da quantidade atual dos itens
     # 2) Ordem já estava em CONCLUIDA/EM_ANDAMENTO e itens foram alterados -> aplicar apenas o delta (novo - antigo). Se delta>0 criar SAIDA, delta<0 criar ENTRADA
-    novo_status = normalizar_status_ordem(ordem.status) or ordem.status
-    if ordem.status != novo_status:
-        ordem.status = novo_status
-    if novo_status in ["CONCLUIDA", "EM_ANDAMENTO"] and previous_status not in ["CONCLUIDA", "EM_ANDAMENTO"]:
+    # Demais status devolvem o que as movimentações da OS ainda mantêm fora do estoque (ver reconciliar_estoque_ordem)
+    novo_status = ordem.status
+    if novo_status == "CONCLUIDA" and previous_status not in ESTADOS_COM_BAIXA:
         # Para CONCLUIDA, atualizar data de conclusão
-        if novo_status == "CONCLUIDA":
-            ordem.data_conclusao = datetime.now()
-            disparar_email_fechamento = True
-            # Aplicar taxa de pagamento baseada na forma de pagamento e máquina selecionada
-            maquina_id = update_data.get('maquina_id')
-            aplicar_taxa_pagamento(db, ordem, maquina_id)
-            # Criar registro no histórico de manutenções do veículo
-            try:
-                criar_historico_manutencao(ordem, db)
-            except Exception as e:
-                logger.error(f"Erro ao criar histórico de manutenção para OS {ordem.numero}: {str(e)}")
-
-        # Baixa completa: cada item provoca saída igual à sua quantidade
-        itens_produto = db.query(ItemOrdem).filter(
-            and_(
-                ItemOrdem.ordem_id == ordem_id,
-                ItemOrdem.tipo == "PRODUTO",
-                ItemOrdem.produto_id.isnot(None)
-            )
-        ).all()
-
-        for item in itens_produto:
-            produto = db.query(Produto).filter(Produto.id == item.produto_id).first()
-            if produto:
-                # Verificar estoque disponível
-                if produto.quantidade_atual < item.quantidade:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail=f"Estoque insuficiente para o produto {produto.nome}"
-                    )
-
-                # Criar movimento de saída
-                tz = pytz.timezone('America/Sao_Paulo')
-                
-                # Consumir lotes via FIFO e obter custo médio
-                try:
-                    custo_medio = consumir_lotes_fifo(db, item.produto_id, item.quantidade)
-                except HTTPException:
-                    # Se não houver lotes (produtos antigos), usar custo do produto
-                    custo_medio = float(produto.preco_custo) if produto.preco_custo else 0
-                
-                movimento = MovimentoEstoque(
-                    item_id=item.produto_id,
-                    tipo="SAIDA",
-                    quantidade=item.quantidade,
-                    preco_unitario=item.valor_unitario,
-                    preco_custo=custo_medio,  # Custo real baseado nos lotes FIFO
-                    valor_total=item.valor_total,
-                    motivo="Ordem de Serviço",
-                    observacoes=f"OS {ordem.numero} - {item.descricao} - Status: {novo_status}",
-                    ordem_servico_id=ordem.id,
-                    data_movimentacao=datetime.now(tz)
-                )
-                db.add(movimento)
-
-                # Atualizar estoque do produto
-                produto.quantidade_atual -= item.quantidade
-                # Status do produto é calculado automaticamente pela property
-
-          # Ordem já tinha baixa aplicada aplicar somente delta quando itens mudaram
-        # Obter quantidades atuais após atualização
-        itens_atualizados = db.query(ItemOrdem).filter(ItemOrdem.ordem_id == ordem.id).all()
-        quantidades_novas = {it.id: it.quantidade for it in itens_atualizados}
-
-        # Mapear por produto: se item foi novo (id não estava em quantidades_anteriores) consideramos anterior=0
-        # Para itens deletados, quantidades_novas não terá a chave tratamos como novo=0
-        all_item_ids = set(list(quantidades_anteriores.keys()) + list(quantidades_novas.keys()))
-
-        for item_id in all_item_ids:
-            old_q = quantidades_anteriores.get(item_id, 0)
-            new_q = quantidades_novas.get(item_id, 0)
-
-            # Converter Decimal/Num para float/Decimal coerente
-            try:
-                old_q_val = old_q
-            except Exception:
-                old_q_val = 0
-            try:
-                new_q_val = new_q
-            except Exception:
-                new_q_val = 0
-
-            # Se não houve mudança, pular
-            if new_q_val == old_q_val:
-                continue
-
-            # Buscar item (pode ter sido deletado neste caso new_q_val == 0)
-            item_obj = db.query(ItemOrdem).filter(ItemOrdem.id == item_id).first()
-            # Se item_obj for None e old_q>0, significa que item foi removido -> criar ENTRADA de old_q
-            if item_obj is None and old_q_val > 0:
-                # precisamos saber qual produto era antes buscar em itens_existentes
-                existing_item = itens_existentes.get(item_id)
-                if not existing_item or not existing_item.produto_id:
-                    continue
-                produto = db.query(Produto).filter(Produto.id == existing_item.produto_id).first()
-                if not produto:
-                    continue
-
-                # Criar movimento ENTRADA devolvendo ao estoque
-                tz = pytz.timezone('America/Sao_Paulo')
-                movimento = MovimentoEstoque(
-                    item_id=produto.id,
-                    tipo="ENTRADA",
-                    quantidade=old_q_val,
-                    preco_unitario=existing_item.valor_unitario,
-                    valor_total=(existing_item.valor_unitario * old_q_val) if existing_item.valor_unitario else None,
-                    motivo=f"Ajuste Ordem de Serviço (removido item) - OS {ordem.numero}",
-                    observacoes=f"Ajuste retroativo: item removido, repondo {old_q_val}",
-                    ordem_servico_id=ordem.id,
-                    data_movimentacao=datetime.now(tz)
-                )
-                db.add(movimento)
-                produto.quantidade_atual += old_q_val
-                # data_ultima_movimentacao e tipo_ultima_movimentacao s??o properties calculadas
-                # N??o atribuir produto.status diretamente ?? uma property calculada
-
-            else:
-                # item_obj existe (ou new_q_val>0) -> calcular delta = new - old
-                produto_id = None
-                valor_unitario = None
-                if item_obj:
-                    produto_id = item_obj.produto_id
-                    valor_unitario = item_obj.valor_unitario
-                else:
-                    # Se item_obj não existe mas new_q_val>0 (caso novo com id temporário), pular novo item já foi tratado na transição inicial
-                    continue
-
-                if not produto_id:
-                    continue
-
-                delta = new_q_val - old_q_val
-                if delta == 0:
-                    continue
-
-                produto = db.query(Produto).filter(Produto.id == produto_id).first()
-                if not produto:
-                    continue
-
-                if delta > 0:
-                    # Sa??da apenas da diferen??a
-                    if produto.quantidade_atual < delta:
-                        raise HTTPException(
-                            status_code=status.HTTP_400_BAD_REQUEST,
-                            detail=f"Estoque insuficiente para o produto {produto.nome} ao aplicar ajuste de quantidade"
-                        )
-                    tz = pytz.timezone('America/Sao_Paulo')
-                    
-                    # Consumir lotes via FIFO
-                    try:
-                        custo_medio = consumir_lotes_fifo(db, produto.id, delta)
-                    except HTTPException:
-                        custo_medio = float(produto.preco_custo) if produto.preco_custo else 0
-                    
-                    movimento = MovimentoEstoque(
-                        item_id=produto.id,
-                        tipo="SAIDA",
-                        quantidade=delta,
-                        preco_unitario=valor_unitario,
-                        preco_custo=custo_medio,  # Custo real FIFO
-                        valor_total=(valor_unitario * delta) if valor_unitario else None,
-                        motivo=f"Ajuste Ordem de Serviço - OS {ordem.numero}",
-                        observacoes=f"Ajuste quantidade item id={item_id}: {old_q_val} -> {new_q_val}",
-                        ordem_servico_id=ordem.id,
-                        data_movimentacao=datetime.now(tz)
-                    )
-                    db.add(movimento)
-                    produto.quantidade_atual -= delta
-                    # Status do produto ?? calculado automaticamente pela property
-                else:
-                    # delta < 0 -> devolver ao estoque
-                    entrada_q = abs(delta)
-                    tz = pytz.timezone('America/Sao_Paulo')
-                    movimento = MovimentoEstoque(
-                        item_id=produto.id,
-                        tipo="ENTRADA",
-                        quantidade=entrada_q,
-                        preco_unitario=valor_unitario,
-                        valor_total=(valor_unitario * entrada_q) if valor_unitario else None,
-                        motivo=f"Ajuste Ordem de Serviço - OS {ordem.numero}",
-                        observacoes=f"Ajuste quantidade item id={item_id}: {old_q_val} -> {new_q_val}",
-                        ordem_servico_id=ordem.id,
-                        data_movimentacao=datetime.now(tz)
-                    )
-                    db.add(movimento)
-                    produto.quantidade_atual += entrada_q
-                    # Status do produto ?? calculado automaticamente pela property
-
-    elif novo_status in ["PENDENTE", "AGUARDANDO_PECA", "AGUARDANDO_APROVACAO", "CANCELADA"] and (
-        previous_status in ["CONCLUIDA", "EM_ANDAMENTO"] or
-        # Ou se já existirem movimentos SAIDA para essa ordem (baixa aplicada retroativamente)
-        db.query(func.count(MovimentoEstoque.id)).filter(
-            and_(MovimentoEstoque.ordem_servico_id == ordem.id, MovimentoEstoque.tipo == "SAIDA")
-        ).scalar() > 0
-    ):
-        # Transição DE status com baixa aplicada PARA status de pausa/cancelamento -> devolver apenas o que ainda não foi devolvido
-        # Para evitar devoluções duplicadas, vamos calcular por produto quanto foi SA??DO para o serviço e quanto já foi devolvido (ENTRADA com motivo de devolução)
-        itens_produto = db.query(ItemOrdem).filter(
-            and_(
-                ItemOrdem.ordem_id == ordem_id,
-                ItemOrdem.tipo == "PRODUTO",
-                ItemOrdem.produto_id.isnot(None)
-            )
-        ).all()
-
-        for item in itens_produto:
-            produto = db.query(Produto).filter(Produto.id == item.produto_id).first()
-            if not produto:
-                continue
-
-            # Soma total de SAIDA registrada para este produto/ordem
-            total_saida = db.query(func.sum(MovimentoEstoque.quantidade)).filter(
-                and_(
-                    MovimentoEstoque.ordem_servico_id == ordem.id,
-                    MovimentoEstoque.item_id == produto.id,
-                    MovimentoEstoque.tipo == "SAIDA"
-                )
-            ).scalar() or 0
-
-            # Soma total de ENTRADA já gerada como devolução para esta ordem/produto
-            total_entrada_devolucao = db.query(func.sum(MovimentoEstoque.quantidade)).filter(
-                and_(
-                    MovimentoEstoque.ordem_servico_id == ordem.id,
-                    MovimentoEstoque.item_id == produto.id,
-                    MovimentoEstoque.tipo == "ENTRADA",
-                    MovimentoEstoque.motivo.ilike("%Devolução Ordem de Serviço%")
-                )
-            ).scalar() or 0
-
-            # Calcular quanto ainda precisa ser devolvido
-            try:
-                ainda_devolver = (Decimal(total_saida) - Decimal(total_entrada_devolucao))
-            except Exception:
-                ainda_devolver = Decimal('0')
-
-            # Se nada a devolver, pular
-            if ainda_devolver <= 0:
-                continue
-
-            # Log detalhado para depuração: mostrar totais calculados
-            logger.info(f"Devolucao calculada OS={ordem.numero} produto_id={produto.id} total_saida={total_saida} total_entrada_devolucao={total_entrada_devolucao} ainda_devolver={ainda_devolver} item_quantidade={item.quantidade}")
-
-            # Devolver todo o saldo remanescente (ainda_devolver).
-            # Antes devolv??amos em parcelas limitadas ao item.quantidade, o que causava devoluções m??ltiplas
-            # em m??ltiplas alterações de status. Aqui garantimos que a primeira transição devolver?? o restante.
-            qtd_a_devolver = ainda_devolver
-
-            # Se é cancelamento, incluir o motivo na observação
-            observacao_movimento = f"OS {ordem.numero} - {item.descricao} - Status alterado para: {novo_status}"
-            if novo_status == "CANCELADA" and ordem.motivo_cancelamento:
-                observacao_movimento += f" | Motivo: {ordem.motivo_cancelamento}"
-
-            tz = pytz.timezone('America/Sao_Paulo')
-            movimento = MovimentoEstoque(
-                item_id=produto.id,
-                tipo="ENTRADA",
-                quantidade=qtd_a_devolver,
-                preco_unitario=item.valor_unitario,
-                valor_total=(item.valor_unitario * qtd_a_devolver) if item.valor_unitario else None,
-                motivo="Devolução Ordem de Serviço" if novo_status != "CANCELADA" else "Cancelamento de Ordem",
-                observacoes=observacao_movimento,
-                ordem_servico_id=ordem.id,
-                data_movimentacao=datetime.now(tz)
-            )
-            db.add(movimento)
+        ordem.data_conclusao = datetime.now()
+        disparar_email_fechamento = True
+        # Aplicar taxa de pagamento baseada na forma de pagamento e máquina selecionada
+        maquina_id = update_data.get('maquina_id')
+        aplicar_taxa_pagamento(db, ordem, maquina_id)
+        # Criar registro no histórico de manutenções do veículo
+        try:
+            criar_historico_manutencao(ordem, db)
+        except Exception as e:
+            logger.error(f"Erro ao criar histórico de manutenção para OS {ordem.numero}: {str(e)}")
 
-            produto.quantidade_atual += qtd_a_devolver
-            # Status do produto ?? calculado automaticamente pela property
+    itens_da_ordem = db.query(ItemOrdem).filter(ItemOrdem.ordem_id == ordem.id).all()
+    movimentos_ordem = reconciliar_estoque_ordem(
+        db,
+        ordem,
+        previous_status,
+        itens_anteriores,
+        itens_da_ordem,
+        itens_alterados=itens_payload is not None,
+    )
     
-    # Garantir que os movimentos recém-criados estejam visíveis para a query de recálculo
+    # Gravar os movimentos recém-criados (inserção em lote)
     db.flush()
     
-    # Recalcular valores da ordem com itens atualizados
+    # Recalcular valores da ordem com itens atualizados e o custo ativo líquido após devoluções
     try:
-        itens_da_ordem = db.query(ItemOrdem).filter(ItemOrdem.ordem_id == ordem.id).all()
-        # Buscar todos os movimentos da OS para calcular o custo ativo líquido após devoluções
-        movimentos_ordem = db.query(MovimentoEstoque).filter(
-            MovimentoEstoque.ordem_servico_id == ordem.id
-        ).order_by(MovimentoEstoque.id.asc()).all()
         ordem_dict = {
             'valor_servico': ordem.valor_servico or Decimal('0.00'),
             'percentual_desconto': ordem.percentual_desconto or Decimal('0.00'),
@@ -2103,7 +1910,7 @@ def atualizar_ordem_servico(
         ordem.valor_faturado = valores['valor_faturado']
         ordem.valor_mao_obra = ordem.valor_servico
         ordem.desconto = ordem.valor_desconto
-        if normalizar_status_ordem(ordem.status) == "CONCLUIDA" and (ordem.forma_pagamento or ordem.formas_pagamento):
+        if ordem.status == "CONCLUIDA" and (ordem.forma_pagamento or ordem.formas_pagamento):
             aplicar_taxa_pagamento(db, ordem, ordem.maquina_id)
     except Exception:
         # Se algo falhar no recálculo, registrar exceção
@@ -2115,7 +1922,19 @@ def atualizar_ordem_servico(
         if veiculo and ordem_data.km_veiculo > veiculo.km_atual:
             veiculo.km_atual = ordem_data.km_veiculo
     
+    # Valor faturado oficial gravado após todos os recálculos da edição
+    gravar_snapshot_financeiro(ordem, db)
     db.commit()
+    invalidar_cache(TAG_ORDENS, TAG_ESTOQUE)
+
+    # Consolidação diária do dashboard (dia da conclusão e dia corrente)
+    if {previous_status, ordem.status} & {"CONCLUIDA", "CANCELADA"}:
+        registrar_alteracao_dashboard(db, [data_conclusao_anterior, ordem.data_conclusao])
+
+    # Projeção de estatísticas do(s) cliente(s): só OS concluídas entram nela
+    if previous_status == "CONCLUIDA" or ordem.status == "CONCLUIDA":
+        registrar_alteracao_estatisticas_cliente(db, [cliente_id_anterior, ordem.cliente_id])
+
     db.refresh(ordem)
 
     if disparar_email_fechamento:
@@ -2230,14 +2049,17 @@ def cancelar_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
             detail="Ordem de serviço não encontrada"
         )
     
-    if normalizar_status_ordem(ordem.status) == "CONCLUIDA":
+    if ordem.status == "CONCLUIDA":
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="N??o é possível cancelar uma ordem de serviço concluída"
         )
     
     ordem.status = "CANCELADA"
+    gravar_snapshot_financeiro(ordem, db)
     db.commit()
+    invalidar_cache(TAG_ORDENS)
+    registrar_alteracao_dashboard(db, [ordem.data_conclusao])
     
     return {"message": "Ordem de serviço cancelada com sucesso"}
 
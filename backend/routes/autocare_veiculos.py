@@ -1,10 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, contains_eager, joinedload
 from sqlalchemy import or_, and_
 from typing import List, Optional
 import logging
 from db import get_db
 from models.autocare_models import Veiculo, Cliente
+from services.busca_texto_service import contem_sem_acento, filtro_busca_veiculos
+from services.cache_service import TAG_VEICULOS, TTL_TOTAL_LISTAGEM_SEGUNDOS, invalidar_cache, obter_ou_calcular
+from services.manutencao_service import (
+    MARGEM_DIAS_SUGESTAO,
+    MARGEM_KM_SUGESTAO,
+    descrever_sugestao,
+    filtro_manutencao_pendente,
+    km_restantes,
+    ultimas_manutencoes,
+)
+from services.paginacao_service import paginar_com_total, proximo_cursor
+from services.placa_service import LIMITE_SUGESTOES_PLACA, filtro_placa_exata, filtro_placa_prefixo, normalizar_placa
 from schemas.schemas_veiculo import (
     VeiculoCreate,
     VeiculoUpdate,
@@ -35,11 +47,7 @@ def listar_veiculos(
         query = query.filter(Veiculo.cliente_id == cliente_id)
     
     if search:
-        query = query.filter(
-            Veiculo.marca.ilike(f"%{search}%") |
-            Veiculo.modelo.ilike(f"%{search}%") |
-            Veiculo.placa.ilike(f"%{search}%")
-        )
+        query = query.filter(filtro_busca_veiculos(search))
     
     # Por padrão retornamos apenas veículos ativos (comportamento consistente com clientes).
     if ativo is None:
@@ -62,6 +70,7 @@ def listar_veiculos(
 def listar_veiculos_paginado(
     page: int = 1,
     page_size: int = 20,
+    after: Optional[str] = None,
     search: Optional[str] = None,
     marca: Optional[str] = None,
     ativo: Optional[bool] = None,
@@ -71,11 +80,7 @@ def listar_veiculos_paginado(
     query = db.query(Veiculo)
 
     if search:
-        query = query.filter(
-            Veiculo.marca.ilike(f"%{search}%") |
-            Veiculo.modelo.ilike(f"%{search}%") |
-            Veiculo.placa.ilike(f"%{search}%")
-        )
+        query = query.filter(filtro_busca_veiculos(search))
 
     if marca:
         query = query.filter(Veiculo.marca == marca)
@@ -85,20 +90,114 @@ def listar_veiculos_paginado(
     else:
         query = query.filter(Veiculo.ativo == ativo)
 
-    total = query.count()
     page = max(1, page)
     page_size = max(1, min(page_size, 100))
-    skip = (page - 1) * page_size
+    filtrado = bool(search or marca) or ativo is False
+
+    # Listagem padrão (veículos ativos): total em cache, invalidado a cada escrita de veículo
+    def total_sem_filtros():
+        total = obter_ou_calcular(
+            "veiculos_total", {}, [TAG_VEICULOS], query.count, ttl=TTL_TOTAL_LISTAGEM_SEGUNDOS
+        )
+        return total, True
 
-    veiculos = query.order_by(Veiculo.id.desc()).offset(skip).limit(page_size).all()
+    pagina = paginar_com_total(query, page, page_size, after, None, Veiculo.id, filtrado, total_sem_filtros)
+    veiculos = pagina.itens
+    total = pagina.total
     total_pages = (total + page_size - 1) // page_size if total > 0 else 1
 
     return {
         "items": veiculos,
         "total": total,
+        "total_exato": pagina.total_exato,
+        "page": page,
+        "page_size": page_size,
+        "total_pages": total_pages,
+        "next_cursor": proximo_cursor(veiculos, page_size, lambda veiculo: (veiculo.id,))
+    }
+
+@router.get("/manutencoes-pendentes")
+def listar_manutencoes_pendentes(
+    page: int = 1,
+    page_size: int = 50,
+    after: Optional[str] = None,
+    margem_km: int = MARGEM_KM_SUGESTAO,
+    margem_dias: Optional[int] = MARGEM_DIAS_SUGESTAO,
+    apenas_atrasadas: bool = False,
+    cliente_id: Optional[int] = None,
+    tipo: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Manutenções vencidas ou próximas de toda a frota (veículos e clientes ativos),
+    das mais atrasadas para as mais distantes, para campanhas de recall.
+    Considera a km prevista (margem_km) e, se informado, a data prevista (margem_dias).
+    """
+    manutencao = ultimas_manutencoes()
+    query = db.query(manutencao).join(
+        Veiculo, Veiculo.id == manutencao.veiculo_id
+    ).join(
+        Cliente, Cliente.id == Veiculo.cliente_id
+    ).options(
+        contains_eager(manutencao.veiculo).contains_eager(Veiculo.cliente)
+    ).filter(
+        Veiculo.ativo == True,
+        Cliente.ativo == True
+    )
+
+    if apenas_atrasadas:
+        query = query.filter(filtro_manutencao_pendente(manutencao, 0, 0 if margem_dias is not None else None))
+    else:
+        query = query.filter(filtro_manutencao_pendente(manutencao, margem_km, margem_dias))
+
+    if cliente_id:
+        query = query.filter(Veiculo.cliente_id == cliente_id)
+
+    if tipo:
+        query = query.filter(contem_sem_acento(manutencao.tipo, tipo))
+
+    page = max(1, page)
+    page_size = max(1, min(page_size, 200))
+
+    # Mais atrasadas primeiro: ordem decrescente de km excedidos
+    km_excedidos = -km_restantes(manutencao)
+    pagina = paginar_com_total(
+        query, page, page_size, after, km_excedidos, manutencao.id, True, lambda: (query.count(), True)
+    )
+    total = pagina.total
+    total_pages = (total + page_size - 1) // page_size if total > 0 else 1
+
+    items = []
+    for m in pagina.itens:
+        veiculo = m.veiculo
+        cliente = veiculo.cliente
+        km_atual = veiculo.km_atual or 0
+        items.append({
+            "veiculo_id": veiculo.id,
+            "placa": veiculo.placa,
+            "marca": veiculo.marca,
+            "modelo": veiculo.modelo,
+            "ano": veiculo.ano,
+            "km_atual": km_atual,
+            "cliente_id": cliente.id,
+            "cliente_nome": cliente.nome,
+            "telefone": cliente.telefone,
+            "whatsapp": cliente.whatsapp,
+            "email": cliente.email,
+            **descrever_sugestao(m, km_atual)
+        })
+
+    return {
+        "items": items,
+        "total": total,
+        "total_exato": pagina.total_exato,
         "page": page,
         "page_size": page_size,
-        "total_pages": total_pages
+        "total_pages": total_pages,
+        "next_cursor": proximo_cursor(
+            pagina.itens, page_size,
+            lambda m: ((m.veiculo.km_atual or 0) - m.km_proxima, m.id)
+        )
     }
 
 @router.get("/{veiculo_id}", response_model=VeiculoResponse)
@@ -137,7 +236,7 @@ def criar_veiculo(veiculo_data: VeiculoCreate, db: Session = Depends(get_db)):
     # Verificar se placa já existe (somente se foi fornecida e não vazia)
     placa = clean_data.get('placa')
     if placa:
-        existing = db.query(Veiculo).filter(Veiculo.placa == placa).first()
+        existing = db.query(Veiculo).filter(filtro_placa_exata(placa)).first()
         if existing:
             # Retornar conflito com informações do registro existente (id e ativo)
             raise HTTPException(
@@ -166,6 +265,7 @@ def criar_veiculo(veiculo_data: VeiculoCreate, db: Session = Depends(get_db)):
     veiculo = Veiculo(**clean_data)
     db.add(veiculo)
     db.commit()
+    invalidar_cache(TAG_VEICULOS)
     db.refresh(veiculo)
     return veiculo
 
@@ -203,7 +303,7 @@ def atualizar_veiculo(
     placa = update_data.get('placa')
     if placa:
         existing = db.query(Veiculo).filter(
-            Veiculo.placa == placa,
+            filtro_placa_exata(placa),
             Veiculo.id != veiculo_id
         ).first()
         if existing:
@@ -237,6 +337,7 @@ def atualizar_veiculo(
         setattr(veiculo, key, value)
     
     db.commit()
+    invalidar_cache(TAG_VEICULOS)
     db.refresh(veiculo)
     return veiculo
 
@@ -253,6 +354,7 @@ def deletar_veiculo(veiculo_id: int, db: Session = Depends(get_db)):
 
     veiculo.ativo = False
     db.commit()
+    invalidar_cache(TAG_VEICULOS)
     db.refresh(veiculo)
     return veiculo
 
@@ -278,6 +380,7 @@ def atualizar_km_veiculo(
     
     veiculo.km_atual = novo_km
     db.commit()
+    invalidar_cache(TAG_VEICULOS)
     return {"message": f"Quilometragem atualizada para {novo_km} km"}
 
 
@@ -290,6 +393,7 @@ def reativar_veiculo(veiculo_id: int, db: Session = Depends(get_db)):
 
     veiculo.ativo = True
     db.commit()
+    invalidar_cache(TAG_VEICULOS)
     db.refresh(veiculo)
     return {"message": "Veículo reativado com sucesso", "id": veiculo.id, "ativo": veiculo.ativo}
 
@@ -331,49 +435,15 @@ def obter_sugestoes_manutencao(veiculo_id: int, db: Session = Depends(get_db)):
     if not veiculo:
         raise HTTPException(status_code=404, detail="Veículo não encontrado")
     
-    # Buscar manutenções com km_proxima definida
-    manutencoes = db.query(ManutencaoHistorico).filter(
-        and_(
-            ManutencaoHistorico.veiculo_id == veiculo_id,
-            ManutencaoHistorico.km_proxima.isnot(None)
-        )
-    ).order_by(ManutencaoHistorico.data_realizada.desc()).all()
-    
-    sugestoes = []
     km_atual = veiculo.km_atual or 0
-    
-    for manutencao in manutencoes:
-        # Verificar se já passou da km prevista ou está próximo (dentro de 1000 km)
-        if manutencao.km_proxima:
-            km_restantes = manutencao.km_proxima - km_atual
-            
-            # Se já passou ou falta menos de 1000 km
-            if km_restantes <= 1000:
-                # Verificar se já não foi feita uma manutenção do mesmo tipo depois desta
-                manutencao_posterior = db.query(ManutencaoHistorico).filter(
-                    and_(
-                        ManutencaoHistorico.veiculo_id == veiculo_id,
-                        ManutencaoHistorico.tipo == manutencao.tipo,
-                        ManutencaoHistorico.data_realizada > manutencao.data_realizada,
-                        ManutencaoHistorico.km_realizada >= manutencao.km_proxima
-                    )
-                ).first()
-                
-                if not manutencao_posterior:
-                    urgencia = "urgente" if km_restantes <= 0 else "proxima"
-                    sugestoes.append({
-                        "tipo": manutencao.tipo,
-                        "ultima_realizacao": {
-                            "km": manutencao.km_realizada,
-                            "data": manutencao.data_realizada.isoformat()
-                        },
-                        "proxima_prevista": {
-                            "km": manutencao.km_proxima,
-                            "km_restantes": km_restantes,
-                            "urgencia": urgencia
-                        },
-                        "mensagem": f"{'⚠️ Atrasada!' if km_restantes <= 0 else '🔔 Próxima'} {manutencao.tipo} - Última em {manutencao.km_realizada} km, prevista para {manutencao.km_proxima} km"
-                    })
+
+    # Última previsão de cada tipo (DISTINCT ON), já filtrada pela margem, numa única consulta
+    manutencao = ultimas_manutencoes(ManutencaoHistorico.veiculo_id == veiculo_id)
+    manutencoes = db.query(manutencao).filter(
+        manutencao.km_proxima - km_atual <= MARGEM_KM_SUGESTAO
+    ).order_by(manutencao.km_proxima - km_atual, manutencao.tipo).all()
+
+    sugestoes = [descrever_sugestao(m, km_atual) for m in manutencoes]
     
     return {
         "veiculo_id": veiculo_id,
@@ -410,6 +480,7 @@ def transferir_proprietario_veiculo(
     
     try:
         db.commit()
+        invalidar_cache(TAG_VEICULOS)
         db.refresh(veiculo)
         
         return {
@@ -436,21 +507,11 @@ def buscar_veiculo_por_placa(placa: str, db: Session = Depends(get_db)):
         }
     
     # Remove caracteres especiais da placa para busca mais flexível
-    placa_limpa = ''.join(filter(str.isalnum, placa)).upper()
+    placa_limpa = normalizar_placa(placa)
     logger.info(f"🔍 Placa original: '{placa}', Placa limpa: '{placa_limpa}'")
     
-    # Buscar veículo por placa (ativo ou inativo) - comparar ambos sem formatação
-    from sqlalchemy import func
-    veiculo = db.query(Veiculo).filter(
-        or_(
-            # Busca exata
-            Veiculo.placa.ilike(placa),
-            # Busca exata case insensitive
-            func.upper(Veiculo.placa) == placa.upper(),
-            # Remover caracteres especiais de ambos os lados para comparação
-            func.regexp_replace(func.upper(Veiculo.placa), '[^A-Z0-9]', '', 'g') == placa_limpa
-        )
-    ).first()
+    # Buscar veículo por placa (ativo ou inativo) pelo índice da placa canônica
+    veiculo = db.query(Veiculo).filter(filtro_placa_exata(placa_limpa)).first()
     
     if not veiculo:
         logger.info(f"❌ Veículo não encontrado para placa: '{placa}'")
@@ -484,6 +545,39 @@ def buscar_veiculo_por_placa(placa: str, db: Session = Depends(get_db)):
         }
     }
 
+@router.get("/buscar-placa-prefixo/{prefixo}")
+def buscar_veiculos_por_prefixo_placa(
+    prefixo: str,
+    limit: int = 10,
+    apenas_ativos: bool = True,
+    db: Session = Depends(get_db)
+):
+    """Sugestões de veículos cuja placa começa com o prefixo (digitação da placa no balcão)"""
+    if not normalizar_placa(prefixo):
+        return []
+
+    query = db.query(Veiculo).options(joinedload(Veiculo.cliente)).filter(filtro_placa_prefixo(prefixo))
+    if apenas_ativos:
+        query = query.filter(Veiculo.ativo == True)
+
+    limite = max(1, min(limit, LIMITE_SUGESTOES_PLACA))
+    veiculos = query.order_by(Veiculo.placa_normalizada).limit(limite).all()
+
+    return [
+        {
+            "id": veiculo.id,
+            "placa": veiculo.placa,
+            "marca": veiculo.marca,
+            "modelo": veiculo.modelo,
+            "ano": veiculo.ano,
+            "cor": veiculo.cor,
+            "cliente_id": veiculo.cliente_id,
+            "cliente_nome": veiculo.cliente.nome if veiculo.cliente else None,
+            "ativo": veiculo.ativo
+        }
+        for veiculo in veiculos
+    ]
+
 @router.get("/buscar-renavam/{renavam}")
 def buscar_veiculo_por_renavam(renavam: str, db: Session = Depends(get_db)):
     """Buscar veículo por RENAVAM para verificação antes do cadastro"""
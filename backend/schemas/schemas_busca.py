@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+
+class BuscaResultado(BaseModel):
+    tipo: str  # ordens, clientes, veiculos ou produtos
+    id: int
+    titulo: Optional[str] = None
+    detalhe: Optional[str] = None
+    data: Optional[datetime] = None
+    relevancia: float
+
+class BuscaGlobalResponse(BaseModel):
+    termo: str
+    resultados: List[BuscaResultado]
@@ -112,6 +112,7 @@ class ClienteList(BaseModel):
     total_gasto: Optional[float] = 0
     total_servicos: Optional[int] = 0
     veiculos_count: Optional[int] = 0
+    ultima_visita: Optional[datetime] = None
     
     class Config:
         from_attributes = True
\ No newline at end of file
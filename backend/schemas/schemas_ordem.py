@@ -237,9 +237,11 @@ class OrdemServicoNovaList(BaseModel):
 class OrdemServicoNovaPaginadaResponse(BaseModel):
     items: List[OrdemServicoNovaList]
     total: int
+    total_exato: bool = True
     page: int
     page_size: int
     total_pages: int
+    next_cursor: Optional[str] = None
 
 # Schema para autocomplete de produtos
 class ProdutoAutocomplete(BaseModel):
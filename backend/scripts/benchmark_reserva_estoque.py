@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Benchmark de concorrência da baixa de estoque (services.custo_fifo_service.reservar_estoque).
+
+Cria um produto de teste com alguns lotes, dispara várias threads reservando o
+mesmo produto ao mesmo tempo e verifica ao final:
+
+- nenhuma atualização perdida: quantidade do produto e saldo dos lotes batem
+  exatamente com o número de reservas confirmadas;
+- nenhum saldo negativo (sem venda acima do estoque);
+- latência p99 abaixo do limite informado.
+
+Requer um PostgreSQL local (DATABASE_URL). Os dados de teste são removidos ao final.
+
+Uso:
+python scripts/benchmark_reserva_estoque.py
+python scripts/benchmark_reserva_estoque.py --threads 32 --operacoes 100 --estoque 2000 --p99-max-ms 250
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import sessionmaker
+
+from config import DATABASE_URL
+from models.autocare_models import LoteEstoque, MovimentoEstoque, Produto
+from services.custo_fifo_service import EstoqueInsuficienteError, reservar_estoque
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark de reservas concorrentes de estoque")
+    parser.add_argument("--threads", type=int, default=16, help="Threads simultâneas (padrão: 16)")
+    parser.add_argument("--operacoes", type=int, default=50, help="Reservas por thread (padrão: 50)")
+    parser.add_argument("--quantidade", type=int, default=1, help="Unidades por reserva (padrão: 1)")
+    parser.add_argument("--estoque", type=int, default=600, help="Estoque inicial do produto de teste (padrão: 600)")
+    parser.add_argument("--lotes", type=int, default=6, help="Quantidade de lotes do estoque inicial (padrão: 6)")
+    parser.add_argument("--p99-max-ms", type=float, default=500.0, help="Latência p99 máxima aceita (padrão: 500ms)")
+    parser.add_argument("--manter", action="store_true", help="Não remove o produto de teste ao final")
+    return parser.parse_args()
+
+
+def percentil(valores, p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[indice]
+
+
+def preparar_produto(SessionBench, estoque: int, lotes: int) -> int:
+    db = SessionBench()
+    try:
+        agora = datetime.now(timezone.utc)
+        produto = Produto(
+            codigo=f"BENCH-{int(time.time() * 1000)}",
+            nome="Produto benchmark reserva de estoque",
+            preco_custo=Decimal('10.00'),
+            preco_venda=Decimal('20.00'),
+            quantidade_atual=estoque,
+            quantidade_minima=0,
+            unidade="UN",
+        )
+        db.add(produto)
+        db.flush()
+
+        movimento = MovimentoEstoque(
+            item_id=produto.id,
+            tipo="ENTRADA",
+            quantidade=estoque,
+            preco_custo=Decimal('10.00'),
+            motivo="Benchmark",
+            data_movimentacao=agora,
+        )
+        db.add(movimento)
+        db.flush()
+
+        restante = estoque
+        for indice in range(lotes):
+            quantidade_lote = restante if indice == lotes - 1 else estoque // lotes
+            restante -= quantidade_lote
+            db.add(LoteEstoque(
+                produto_id=produto.id,
+                movimento_entrada_id=movimento.id,
+                quantidade_inicial=quantidade_lote,
+                saldo_atual=quantidade_lote,
+                preco_custo_unitario=Decimal('10.00') + indice,
+                data_entrada=agora - timedelta(days=lotes - indice),
+                numero_lote=f"BENCH-{indice + 1}",
+                ativo=True,
+            ))
+        db.commit()
+        return produto.id
+    finally:
+        db.close()
+
+
+def remover_produto(SessionBench, produto_id: int) -> None:
+    db = SessionBench()
+    try:
+        db.query(LoteEstoque).filter(LoteEstoque.produto_id == produto_id).delete(synchronize_session=False)
+        db.query(MovimentoEstoque).filter(MovimentoEstoque.item_id == produto_id).delete(synchronize_session=False)
+        db.query(Produto).filter(Produto.id == produto_id).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def main() -> int:
+    args = parse_args()
+
+    engine = create_engine(DATABASE_URL, pool_size=args.threads, max_overflow=0)
+    SessionBench = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    produto_id = preparar_produto(SessionBench, args.estoque, args.lotes)
+    logger.info("Produto de teste %s criado com estoque %s em %s lotes", produto_id, args.estoque, args.lotes)
+
+    latencias = []
+    contadores = {"confirmadas": 0, "insuficiente": 0, "erros": 0}
+    trava = threading.Lock()
+    largada = threading.Barrier(args.threads)
+
+    def trabalhador(_indice: int) -> None:
+        largada.wait()
+        for _ in range(args.operacoes):
+            db = SessionBench()
+            inicio = time.perf_counter()
+            resultado = "confirmadas"
+            try:
+                reservar_estoque(db, [(produto_id, args.quantidade)], exigir_lotes=True)
+                db.commit()
+            except EstoqueInsuficienteError:
+                db.rollback()
+                resultado = "insuficiente"
+            except DBAPIError as exc:
+                db.rollback()
+                resultado = "erros"
+                logger.error("Erro de banco durante a reserva: %s", exc)
+            finally:
+                db.close()
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            with trava:
+                latencias.append(duracao_ms)
+                contadores[resultado] += 1
+
+    inicio_total = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(trabalhador, range(args.threads)))
+    duracao_total = time.perf_counter() - inicio_total
+
+    db = SessionBench()
+    try:
+        quantidade_final = db.query(Produto.quantidade_atual).filter(Produto.id == produto_id).scalar()
+        saldo_lotes = db.query(func.coalesce(func.sum(LoteEstoque.saldo_atual), 0)).filter(
+            LoteEstoque.produto_id == produto_id
+        ).scalar()
+        lotes_negativos = db.query(func.count(LoteEstoque.id)).filter(
+            LoteEstoque.produto_id == produto_id,
+            LoteEstoque.saldo_atual < 0,
+        ).scalar()
+    finally:
+        db.close()
+
+    esperado = args.estoque - contadores["confirmadas"] * args.quantidade
+    maximo_reservas = args.estoque // args.quantidade
+    total_tentativas = args.threads * args.operacoes
+    p50, p95, p99 = (percentil(latencias, p) for p in (50, 95, 99))
+
+    logger.info("Tentativas: %s em %.2fs (%.0f reservas/s)", total_tentativas, duracao_total, total_tentativas / duracao_total)
+    logger.info("Confirmadas: %s | estoque insuficiente: %s | erros: %s",
+                contadores["confirmadas"], contadores["insuficiente"], contadores["erros"])
+    logger.info("Latência (ms): p50=%.1f p95=%.1f p99=%.1f máx=%.1f", p50, p95, p99, max(latencias or [0]))
+    logger.info("Produto: quantidade_atual=%s (esperado %s) | soma dos lotes=%s", quantidade_final, esperado, saldo_lotes)
+
+    falhas = []
+    if quantidade_final != esperado:
+        falhas.append(f"quantidade_atual {quantidade_final} diferente do esperado {esperado} (atualização perdida)")
+    if int(saldo_lotes) != esperado:
+        falhas.append(f"soma dos lotes {saldo_lotes} diferente do esperado {esperado} (atualização perdida)")
+    if quantidade_final < 0 or lotes_negativos:
+        falhas.append("saldo negativo (venda acima do estoque)")
+    if contadores["confirmadas"] != min(total_tentativas, maximo_reservas):
+        falhas.append(f"{contadores['confirmadas']} reservas confirmadas, esperado {min(total_tentativas, maximo_reservas)}")
+    if contadores["erros"]:
+        falhas.append(f"{contadores['erros']} erros de banco (deadlock/serialização)")
+    if p99 > args.p99_max_ms:
+        falhas.append(f"p99 {p99:.1f}ms acima do limite {args.p99_max_ms:.1f}ms")
+
+    if not args.manter:
+        remover_produto(SessionBench, produto_id)
+    engine.dispose()
+
+    if falhas:
+        for falha in falhas:
+            logger.error("FALHA: %s", falha)
+        return 1
+
+    logger.info("OK: nenhuma atualização perdida, nenhum saldo negativo, p99 dentro do limite")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Grava o valor faturado oficial (snapshot financeiro) das OS ainda sem a versão
+atual do cálculo.
+
+As telas de OS e o dashboard leem valor_faturado direto da coluna quando
+versao_calculo_financeiro é a versão atual; as demais ordens são recalculadas
+a cada leitura. Este script carimba essas ordens de uma vez.
+
+Uso:
+python scripts/recalcular_valor_faturado_snapshot.py --dry-run
+python scripts/recalcular_valor_faturado_snapshot.py --aplicar
+python scripts/recalcular_valor_faturado_snapshot.py --aplicar --todas
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sys
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import or_
+
+from db import SessionLocal
+from models.autocare_models import OrdemServico
+from routes.autocare_ordens import (
+    VERSAO_CALCULO_FINANCEIRO,
+    ResolvedorTaxaPagamento,
+    gravar_snapshot_financeiro,
+)
+
+
+TAMANHO_LOTE = 500
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Grava o snapshot de valor_faturado das OS")
+    modo = parser.add_mutually_exclusive_group()
+    modo.add_argument("--dry-run", action="store_true", help="Apenas mostra as diferenças (padrão)")
+    modo.add_argument("--aplicar", action="store_true", help="Grava os valores no banco")
+    parser.add_argument("--todas", action="store_true", help="Recalcula também as OS já na versão atual")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    aplicar = bool(args.aplicar)
+
+    db = SessionLocal()
+    try:
+        resolvedor = ResolvedorTaxaPagamento(db)
+        query = db.query(OrdemServico)
+        if not args.todas:
+            query = query.filter(or_(
+                OrdemServico.versao_calculo_financeiro.is_(None),
+                OrdemServico.versao_calculo_financeiro != VERSAO_CALCULO_FINANCEIRO,
+            ))
+
+        total = 0
+        alteradas = 0
+        for ordem in query.order_by(OrdemServico.id).yield_per(TAMANHO_LOTE):
+            valor_anterior = Decimal(str(ordem.valor_faturado or 0))
+            valor_novo = gravar_snapshot_financeiro(ordem, db, resolvedor)
+            total += 1
+            if valor_novo != valor_anterior:
+                alteradas += 1
+                logger.info(
+                    "OS %s: valor_faturado %s -> %s (taxa %s)",
+                    ordem.numero, valor_anterior, valor_novo, ordem.taxa_pagamento_aplicada,
+                )
+
+        if aplicar:
+            db.commit()
+            logger.info("Snapshot gravado em %s OS (%s com valor alterado)", total, alteradas)
+        else:
+            db.rollback()
+            logger.info("[DRY-RUN] %s OS seriam carimbadas (%s com valor alterado)", total, alteradas)
+    except Exception:
+        db.rollback()
+        logger.exception("Erro ao gravar snapshot financeiro")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Reclassifica o histórico de manutenções gerado pelas OS concluídas.
+
+Refaz os registros de manutencoes_historico de cada OS com o classificador
+atual (sugestões de manutenção cadastradas): um registro por tipo de
+manutenção reconhecido nos itens de serviço. Registros lançados manualmente
+(sem OS) não são alterados.
+
+Uso:
+python scripts/reclassificar_manutencoes.py --dry-run
+python scripts/reclassificar_manutencoes.py --aplicar
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from db import SessionLocal
+from services.classificador_manutencao_service import (
+    TAMANHO_LOTE_RECLASSIFICACAO,
+    reclassificar_historico,
+)
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Reclassifica o histórico de manutenções das OS concluídas")
+    modo = parser.add_mutually_exclusive_group()
+    modo.add_argument("--dry-run", action="store_true", help="Apenas mostra o resultado, sem gravar (padrão)")
+    modo.add_argument("--aplicar", action="store_true", help="Grava o novo histórico")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE_RECLASSIFICACAO, help="OS por lote")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+
+    db = SessionLocal()
+    try:
+        total_ordens, total_registros = reclassificar_historico(db, args.lote)
+        if args.aplicar:
+            db.commit()
+            logger.info("Histórico refeito: %s OS, %s registros", total_ordens, total_registros)
+        else:
+            db.rollback()
+            logger.info("Dry-run: %s OS gerariam %s registros (use --aplicar para gravar)", total_ordens, total_registros)
+    except Exception:
+        db.rollback()
+        logger.exception("Erro ao reclassificar o histórico de manutenções")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
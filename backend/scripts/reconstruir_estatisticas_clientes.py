@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Reconstrói a projeção cliente_estatisticas (ficha do cliente) a partir das OS.
+
+A projeção é mantida a cada OS concluída, editada ou cancelada; este script
+faz o backfill inicial e corrige eventuais lacunas.
+
+Uso:
+python scripts/reconstruir_estatisticas_clientes.py
+python scripts/reconstruir_estatisticas_clientes.py --cliente-id 42
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from db import SessionLocal
+from services.estatisticas_cliente_service import (
+    TAMANHO_LOTE_RECONSTRUCAO,
+    atualizar_estatisticas_cliente,
+    reconstruir_estatisticas_clientes,
+)
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Reconstrói a tabela cliente_estatisticas")
+    parser.add_argument("--cliente-id", type=int, action="append", help="Reconstruir apenas este cliente (repetível)")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE_RECONSTRUCAO, help="Clientes por commit")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.cliente_id:
+            for cliente_id in args.cliente_id:
+                atualizar_estatisticas_cliente(db, cliente_id)
+            db.commit()
+            total = len(args.cliente_id)
+        else:
+            total = reconstruir_estatisticas_clientes(db, args.lote)
+        logger.info("Estatísticas reconstruídas para %s clientes", total)
+    except Exception:
+        db.rollback()
+        logger.exception("Erro ao reconstruir estatísticas dos clientes")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
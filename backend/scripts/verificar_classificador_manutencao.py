@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Verifica o classificador de manutenções contra as sugestões iniciais.
+
+Compila o classificador com as linhas semeadas pela migração
+260ed4139252_add_sugestoes_manutencao_table (sem acessar o banco) e confere
+que descrições comuns de serviço resultam em um único tipo de manutenção com
+o intervalo esperado. Sai com código 1 se algum caso divergir.
+
+Uso:
+python scripts/verificar_classificador_manutencao.py
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services.classificador_manutencao_service import ClassificadorManutencao, compilar_regras
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# (nome_peca, km_media_troca, intervalo_km_min, intervalo_km_max, tipo_servico), como na migração
+SUGESTOES_SEMEADAS = (
+    ('Óleo de motor (sintético)', '10.000 km ou 12 meses', 10000, 10000, 'óleo'),
+    ('Óleo de motor (semissintético)', '7.000 km ou 6 meses', 7000, 7000, 'óleo'),
+    ('Filtro de óleo', 'A cada troca de óleo', 7000, 10000, 'filtro'),
+    ('Filtro de ar do motor', '10.000 a 15.000 km', 10000, 15000, 'filtro'),
+    ('Filtro de combustível', '20.000 a 30.000 km', 20000, 30000, 'filtro'),
+    ('Filtro de ar-condicionado (cabin filter)', '10.000 a 15.000 km', 10000, 15000, 'filtro'),
+    ('Velas de ignição (comuns)', '20.000 a 30.000 km', 20000, 30000, 'vela'),
+    ('Velas de iridium / platina', '60.000 a 100.000 km', 60000, 100000, 'vela'),
+    ('Correia dentada', '50.000 a 70.000 km', 50000, 70000, 'correia'),
+    ('Correia auxiliar (poly-v)', '40.000 a 60.000 km', 40000, 60000, 'correia'),
+    ('Amortecedores', '50.000 a 80.000 km', 50000, 80000, 'suspensão'),
+    ('Pastilhas de freio', '20.000 a 40.000 km', 20000, 40000, 'freio'),
+    ('Discos de freio', '40.000 a 60.000 km', 40000, 60000, 'freio'),
+    ('Fluido de freio (DOT 3/4/5.1)', '20.000 km ou 2 anos', 20000, 20000, 'freio'),
+    ('Fluido de arrefecimento (radiador)', '30.000 a 50.000 km ou 2 anos', 30000, 50000, 'fluido'),
+    ('Óleo da transmissão manual', '40.000 a 60.000 km', 40000, 60000, 'transmissão'),
+    ('Óleo da transmissão automática / CVT', '40.000 a 80.000 km', 40000, 80000, 'transmissão'),
+    ('Fluido de direção hidráulica', '40.000 a 60.000 km', 40000, 60000, 'direção'),
+    ('Pneus', '40.000 a 60.000 km', 40000, 60000, 'pneu'),
+    ('Bateria', '2 a 4 anos', None, None, 'elétrica'),
+    ('Palhetas do para-brisa', '6 a 12 meses', None, None, 'acessório'),
+    ('Líquido do limpador de para-brisa', 'Sempre que necessário', None, None, 'fluido'),
+)
+
+# descrição do item de serviço -> (tipo, intervalo em km) esperado
+CASOS_ESPERADOS = (
+    ('Troca de óleo', ('Troca de óleo', 5000)),
+    ('Troca de óleo do motor', ('Troca de óleo', 5000)),
+    ('Troca do óleo da transmissão', ('Transmissão', 40000)),
+    ('Troca de filtro de óleo', ('Filtro de óleo', 7000)),
+    ('Filtro de ar', ('Filtros', 10000)),
+    ('Troca dos filtros', ('Filtros', 10000)),
+    ('Alinhamento e balanceamento', ('Pneus / alinhamento', 10000)),
+    ('Balanceamento', ('Pneus / alinhamento', 10000)),
+    ('Troca de pneus', ('Pneus', 40000)),
+    ('Troca de pneu dianteiro', ('Pneus', 40000)),
+    ('Troca de pastilhas de freio', ('Pastilhas de freio', 20000)),
+    ('Sangria do freio', ('Freios', 30000)),
+    ('Troca de fluido de freio', ('Fluido de freio', 20000)),
+    ('Substituição da correia dentada', ('Correia dentada', 50000)),
+    ('Troca de correia', ('Correia', 50000)),
+    ('Troca das velas', ('Velas de ignição', 20000)),
+    ('Troca de amortecedores', ('Amortecedores', 50000)),
+    ('Troca de bateria', ('Bateria', 50000)),
+    ('Higienização do ar condicionado', ('Ar condicionado', 15000)),
+    ('Revisão completa', ('Revisão', 10000)),
+)
+
+
+def main() -> None:
+    sugestoes = [
+        SimpleNamespace(
+            nome_peca=nome_peca,
+            km_media_troca=km_media_troca,
+            intervalo_km_min=intervalo_km_min,
+            intervalo_km_max=intervalo_km_max,
+            tipo_servico=tipo_servico,
+        )
+        for nome_peca, km_media_troca, intervalo_km_min, intervalo_km_max, tipo_servico in SUGESTOES_SEMEADAS
+    ]
+    classificador = ClassificadorManutencao(compilar_regras(sugestoes))
+
+    falhas = 0
+    for descricao, (tipo, intervalo_km) in CASOS_ESPERADOS:
+        obtido = [(regra.tipo, regra.intervalo_km) for regra in classificador.classificar(descricao)]
+        if obtido != [(tipo, intervalo_km)]:
+            falhas += 1
+            logger.error("%r: esperado %s (%s km), obtido %s", descricao, tipo, intervalo_km, obtido)
+
+    if falhas:
+        logger.error("%s de %s casos divergentes", falhas, len(CASOS_ESPERADOS))
+        sys.exit(1)
+    logger.info("Classificador confere com as sugestões iniciais (%s casos)", len(CASOS_ESPERADOS))
+
+
+if __name__ == "__main__":
+    main()
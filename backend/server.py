@@ -17,8 +17,10 @@ from config import DEBUG, ALLOWED_ORIGINS, UPLOAD_FOLDER
 from routes import autocare_auth, autocare_usuarios, autocare_perfis, autocare_clientes, autocare_veiculos
 from routes import autocare_estoque, autocare_ordens, autocare_fornecedores
 from routes import autocare_relatorios, autocare_dashboard, autocare_configuracoes
-from routes import autocare_sugestoes_manutencao, autocare_compras_fornecedor
+from routes import autocare_sugestoes_manutencao, autocare_compras_fornecedor, autocare_busca
 from models.autocare_models import Perfil, Usuario
+from services.busca_texto_service import garantir_funcoes_busca
+from services.paginacao_service import CABECALHO_PROXIMO_CURSOR
 import json
 
 def _configure_logging():
@@ -61,6 +63,16 @@ async def lifespan(app: FastAPI):
     print("🚀 Iniciando AutoCenter API...")
     _configure_logging()
     create_tables()
+
+    # Extensões e f_unaccent usadas pelas buscas textuais (também criadas pela migração)
+    db = SessionLocal()
+    try:
+        garantir_funcoes_busca(db)
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️  Aviso: falha ao preparar funções de busca textual: {e}")
+    finally:
+        db.close()
     
     # Inicializa RBAC (perfis e vínculos) caso ainda não exista
     try:
@@ -69,6 +81,54 @@ async def lifespan(app: FastAPI):
         db.execute(text("ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS enviar_email_os BOOLEAN DEFAULT TRUE"))
         db.execute(text("UPDATE usuarios SET enviar_email_os = TRUE WHERE enviar_email_os IS NULL"))
         db.execute(text("ALTER TABLE ordens_servico ADD COLUMN IF NOT EXISTS formas_pagamento TEXT"))
+        db.execute(text("ALTER TABLE ordens_servico ADD COLUMN IF NOT EXISTS versao_calculo_financeiro INTEGER"))
+        for coluna in ("cpf_cnpj", "telefone", "telefone2", "whatsapp"):
+            db.execute(text(f"""
+                ALTER TABLE clientes ADD COLUMN IF NOT EXISTS {coluna}_digitos VARCHAR(20)
+                GENERATED ALWAYS AS (regexp_replace({coluna}, '[^0-9]', '', 'g')) STORED
+            """))
+        db.execute(text("""
+            ALTER TABLE veiculos ADD COLUMN IF NOT EXISTS placa_normalizada VARCHAR(10)
+            GENERATED ALWAYS AS (NULLIF(regexp_replace(upper(placa), '[^A-Z0-9]', '', 'g'), '')) STORED
+        """))
+        # Consolidação diária do dashboard (migração 20261018_dashboard_stats)
+        for coluna in ("valor_total_vendas", "vendas_servicos", "vendas_pecas", "descontos", "custo_pecas", "mao_obra_avulsa", "receita_liquida"):
+            db.execute(text(f"ALTER TABLE dashboard_stats ADD COLUMN IF NOT EXISTS {coluna} NUMERIC(12, 2) DEFAULT 0"))
+        db.execute(text("""
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'dashboard_stats' AND column_name = 'pecas_vendidas' AND data_type = 'integer'
+                ) THEN
+                    ALTER TABLE dashboard_stats ALTER COLUMN pecas_vendidas TYPE NUMERIC(12, 3);
+                END IF;
+            END
+            $$
+        """))
+        db.execute(text("""
+            DELETE FROM dashboard_stats a
+            USING dashboard_stats b
+            WHERE a.data_referencia = b.data_referencia
+              AND a.id < b.id
+        """))
+        db.execute(text("""
+            CREATE UNIQUE INDEX IF NOT EXISTS dashboard_stats_data_referencia_key
+            ON dashboard_stats (data_referencia)
+        """))
+        # Numeração das OS: create_all cria a sequence começando em 1 em bancos sem a
+        # migração 20261018_seq_numero_ordem; avançar até o maior número já emitido
+        # (somente quando atrasada, para não recuar uma sequence em uso)
+        db.execute(text("CREATE SEQUENCE IF NOT EXISTS ordens_servico_numero_seq"))
+        db.execute(text("""
+            SELECT setval('ordens_servico_numero_seq', emitidos.maior + 1, false)
+            FROM (
+                SELECT COALESCE(MAX(numero::BIGINT), 0) AS maior
+                FROM ordens_servico
+                WHERE numero ~ '^[0-9]+$'
+            ) emitidos, ordens_servico_numero_seq seq
+            WHERE emitidos.maior >= seq.last_value + CASE WHEN seq.is_called THEN 1 ELSE 0 END
+        """))
         db.execute(text("""
             INSERT INTO configuracoes (chave, valor, descricao, tipo)
             VALUES ('email_envio_habilitado', 'true', 'Habilita/desabilita o envio de e-mail em toda a aplicação', 'boolean')
@@ -175,6 +235,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cursor da próxima página nas listagens (paginação keyset)
+    expose_headers=[CABECALHO_PROXIMO_CURSOR],
 )
 
 # Servir arquivos estáticos
@@ -201,6 +263,7 @@ app.include_router(autocare_dashboard.router, prefix="/api/dashboard", tags=["Da
 app.include_router(autocare_configuracoes.router, prefix="/api/configuracoes", tags=["Configurações"])
 app.include_router(autocare_sugestoes_manutencao.router, prefix="/api/sugestoes-manutencao", tags=["Sugestões de Manutenção"])
 app.include_router(autocare_compras_fornecedor.router, prefix="/api/compras-fornecedor", tags=["Compras de Fornecedor"])
+app.include_router(autocare_busca.router, prefix="/api/busca", tags=["Busca"])
 # Compatibilidade com frontend servido em /autocare: expor mesmos endpoints em /autocare-api
 app.include_router(autocare_auth.router, prefix="/autocare-api/auth", tags=["Autenticação"])
 app.include_router(autocare_usuarios.router, prefix="/autocare-api/usuarios", tags=["Usuários"])
@@ -215,6 +278,7 @@ app.include_router(autocare_dashboard.router, prefix="/autocare-api/dashboard",
 app.include_router(autocare_configuracoes.router, prefix="/autocare-api/configuracoes", tags=["Configurações"])
 app.include_router(autocare_sugestoes_manutencao.router, prefix="/autocare-api/sugestoes-manutencao", tags=["Sugestões de Manutenção"])
 app.include_router(autocare_compras_fornecedor.router, prefix="/autocare-api/compras-fornecedor", tags=["Compras de Fornecedor"])
+app.include_router(autocare_busca.router, prefix="/autocare-api/busca", tags=["Busca"])
 
 # Middleware de modo manutenção: quando arquivo sentinela existir, bloquear requisições
 @app.middleware("http")
@@ -0,0 +1,209 @@
+"""
+Filtros de busca textual ("contém") das listagens e autocompletes.
+
+Cada expressão aqui corresponde a um índice GIN de trigramas (pg_trgm) criado
+pela migração 20261018_busca_trigram: o planner só usa o índice quando a
+expressão da consulta é idêntica à do índice, então as rotas devem montar seus
+filtros de busca por estas funções em vez de usar ilike diretamente.
+
+Nomes e descrições são comparados sem acento via f_unaccent(), um wrapper
+IMMUTABLE de unaccent() (que é apenas STABLE e não pode ser indexado).
+
+A busca global (/api/busca) usa full-text: colunas geradas busca_tsv
+(configuração portugues_sem_acento, migração 20261018_busca_full_text) com
+índice GIN em ordens, itens de OS, clientes, veículos e produtos. Os pesos são
+A para identificação (número, nome, placa, código), B para descrições e C para
+observações. As colunas não são mapeadas nos modelos para não trafegarem nas
+consultas do ORM; aqui são referenciadas por nome.
+"""
+import unicodedata
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import DateTime, String, cast, false, func, literal, literal_column, or_, select, text, union, union_all
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+from models.autocare_models import Cliente, Fornecedor, ItemOrdem, OrdemServico, Produto, Veiculo
+from services.placa_service import normalizar_placa
+
+DDL_FUNCOES_BUSCA = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    """
+    CREATE OR REPLACE FUNCTION f_unaccent(text)
+    RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+    """,
+)
+
+
+def remover_acentos(texto: str) -> str:
+    decomposto = unicodedata.normalize("NFKD", texto)
+    return "".join(caractere for caractere in decomposto if not unicodedata.combining(caractere))
+
+
+def contem(coluna, termo: str):
+    """coluna ILIKE '%termo%' (índice gin_trgm_ops na própria coluna)."""
+    return coluna.ilike(f"%{termo}%")
+
+
+def contem_sem_acento(coluna, termo: str):
+    """f_unaccent(coluna) ILIKE '%termo%' sem acento (índice gin_trgm_ops em f_unaccent(coluna))."""
+    return func.f_unaccent(coluna).ilike(f"%{remover_acentos(termo)}%")
+
+
+def contem_placa(termo: str):
+    placa = normalizar_placa(termo)
+    if not placa:
+        return false()
+    return Veiculo.placa_normalizada.like(f"%{placa}%")
+
+
+def filtro_busca_clientes(termo: str):
+    return or_(
+        contem_sem_acento(Cliente.nome, termo),
+        contem_sem_acento(Cliente.nome_fantasia, termo),
+        contem(Cliente.cpf_cnpj, termo),
+        contem(Cliente.email, termo),
+        contem(Cliente.telefone, termo),
+        contem(Cliente.telefone2, termo),
+        contem(Cliente.whatsapp, termo),
+    )
+
+
+def filtro_busca_veiculos(termo: str):
+    return or_(
+        contem_sem_acento(Veiculo.marca, termo),
+        contem_sem_acento(Veiculo.modelo, termo),
+        contem_placa(termo),
+    )
+
+
+def filtro_busca_produtos(termo: str):
+    return or_(
+        contem(Produto.codigo, termo),
+        contem_sem_acento(Produto.nome, termo),
+        contem_sem_acento(Produto.descricao, termo),
+    )
+
+
+def filtro_busca_fornecedores(termo: str):
+    return or_(
+        contem_sem_acento(Fornecedor.nome, termo),
+        contem(Fornecedor.cnpj, termo),
+        contem(Fornecedor.email, termo),
+    )
+
+
+def filtro_busca_ordens(termo: str):
+    """Ordens cujo número, nome do cliente ou placa contêm o termo.
+
+    Cada critério é um SELECT de ids com join explícito, resolvido pelo índice
+    de trigramas da respectiva tabela; o OR entre subconsultas correlacionadas
+    (has()) obrigava a varrer ordens_servico inteira.
+    """
+    termo_numero = termo.lstrip("#").strip() or termo
+
+    ids_por_numero = select(OrdemServico.id).where(contem(OrdemServico.numero, termo_numero))
+    ids_por_cliente = (
+        select(OrdemServico.id)
+        .join(Cliente, Cliente.id == OrdemServico.cliente_id)
+        .where(contem_sem_acento(Cliente.nome, termo))
+    )
+    ids_por_placa = (
+        select(OrdemServico.id)
+        .join(Veiculo, Veiculo.id == OrdemServico.veiculo_id)
+        .where(contem_placa(termo))
+    )
+    return OrdemServico.id.in_(union(ids_por_numero, ids_por_cliente, ids_por_placa))
+
+
+CONFIGURACAO_FULL_TEXT = "portugues_sem_acento"
+TIPOS_BUSCA_GLOBAL = ("ordens", "clientes", "veiculos", "produtos")
+LIMITE_BUSCA_GLOBAL = 50
+
+
+def _busca_tsv(modelo):
+    return literal_column(f"{modelo.__tablename__}.busca_tsv", type_=TSVECTOR)
+
+
+def _consulta_ordens(consulta):
+    # Ordens encontradas pelo próprio texto ou pela descrição de algum item,
+    # cada lado resolvido pelo seu índice GIN e agrupado pela melhor nota
+    acertos = union_all(
+        select(
+            OrdemServico.id.label("ordem_id"),
+            func.ts_rank_cd(_busca_tsv(OrdemServico), consulta).label("relevancia"),
+        ).where(_busca_tsv(OrdemServico).op("@@")(consulta)),
+        select(
+            ItemOrdem.ordem_id.label("ordem_id"),
+            func.ts_rank_cd(_busca_tsv(ItemOrdem), consulta).label("relevancia"),
+        ).where(_busca_tsv(ItemOrdem).op("@@")(consulta)),
+    ).subquery()
+    melhores = (
+        select(acertos.c.ordem_id, func.max(acertos.c.relevancia).label("relevancia"))
+        .group_by(acertos.c.ordem_id)
+        .subquery()
+    )
+    return (
+        select(
+            literal("ordens").label("tipo"),
+            OrdemServico.id.label("id"),
+            cast(OrdemServico.numero, String).label("titulo"),
+            cast(func.coalesce(OrdemServico.descricao_servico, OrdemServico.descricao_problema), String).label("detalhe"),
+            func.coalesce(OrdemServico.data_ordem, cast(OrdemServico.data_abertura, DateTime(timezone=True))).label("data"),
+            melhores.c.relevancia.label("relevancia"),
+        )
+        .join(melhores, melhores.c.ordem_id == OrdemServico.id)
+    )
+
+
+def _consulta_entidade(tipo: str, modelo, titulo, detalhe, consulta):
+    tsv = _busca_tsv(modelo)
+    return select(
+        literal(tipo).label("tipo"),
+        modelo.id.label("id"),
+        cast(titulo, String).label("titulo"),
+        cast(detalhe, String).label("detalhe"),
+        modelo.created_at.label("data"),
+        func.ts_rank_cd(tsv, consulta).label("relevancia"),
+    ).where(tsv.op("@@")(consulta))
+
+
+def buscar_global(db, termo: str, tipos: Iterable[str], limite: int) -> List[Dict[str, Any]]:
+    """Resultados de todos os tipos pedidos numa única consulta (UNION ALL), ordenados por relevância."""
+    consulta = func.websearch_to_tsquery(literal_column(f"'{CONFIGURACAO_FULL_TEXT}'::regconfig"), termo)
+    tipos = set(tipos)
+
+    partes = []
+    if "ordens" in tipos:
+        partes.append(_consulta_ordens(consulta))
+    if "clientes" in tipos:
+        partes.append(_consulta_entidade(
+            "clientes", Cliente, Cliente.nome, func.coalesce(Cliente.cpf_cnpj, Cliente.telefone), consulta
+        ))
+    if "veiculos" in tipos:
+        partes.append(_consulta_entidade(
+            "veiculos", Veiculo, Veiculo.placa, func.concat_ws(" ", Veiculo.marca, Veiculo.modelo, Veiculo.ano), consulta
+        ))
+    if "produtos" in tipos:
+        partes.append(_consulta_entidade(
+            "produtos", Produto, Produto.nome, Produto.codigo, consulta
+        ))
+    if not partes:
+        return []
+
+    resultados = union_all(*partes).subquery()
+    linhas = db.execute(
+        select(resultados)
+        .order_by(resultados.c.relevancia.desc(), resultados.c.data.desc().nullslast())
+        .limit(limite)
+    ).mappings().all()
+    return [dict(linha) for linha in linhas]
+
+
+def garantir_funcoes_busca(db) -> None:
+    """Extensões e f_unaccent para bancos que ainda não rodaram a migração (chamado na inicialização)."""
+    for comando in DDL_FUNCOES_BUSCA:
+        db.execute(text(comando))
+    db.commit()
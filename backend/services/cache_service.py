@@ -0,0 +1,133 @@
+"""
+Cache de respostas em Redis para endpoints de leitura pesada (dashboard,
+estatísticas e totais das listagens paginadas).
+
+A chave combina o nome do endpoint, os parâmetros normalizados da requisição,
+a data corrente e a versão de cada tag associada. Invalidar uma tag apenas
+incrementa sua versão: todas as entradas que dependem dela deixam de ser
+encontradas e expiram sozinhas pelo TTL. Assim vários workers e navegadores
+compartilham um único cálculo por alteração.
+
+Falhas de Redis nunca derrubam a requisição: o endpoint é executado
+normalmente sem cache.
+"""
+import hashlib
+import json
+import logging
+from datetime import date
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+from db import redis_client
+
+logger = logging.getLogger(__name__)
+
+PREFIXO_CACHE = "autocare:cache"
+TTL_PADRAO_SEGUNDOS = 60
+# Totais das listagens só mudam com escritas, que já invalidam as tags
+TTL_TOTAL_LISTAGEM_SEGUNDOS = 300
+
+# Tags usadas pelas rotas de escrita
+TAG_ORDENS = "ordens"
+TAG_ESTOQUE = "estoque"
+TAG_CLIENTES = "clientes"
+TAG_VEICULOS = "veiculos"
+TAG_FORNECEDORES = "fornecedores"
+
+_TIPOS_PARAMETRO = (str, int, float, bool, date)
+
+
+def _chave_versao_tag(tag: str) -> str:
+    return f"{PREFIXO_CACHE}:tag:{tag}"
+
+
+def normalizar_parametros(parametros: Dict[str, Any]) -> Dict[str, Any]:
+    """Mantém apenas parâmetros simples (descarta sessão, usuário etc.) e ignora vazios."""
+    normalizados = {}
+    for nome, valor in parametros.items():
+        if valor is None or not isinstance(valor, _TIPOS_PARAMETRO):
+            continue
+        if isinstance(valor, str):
+            valor = valor.strip()
+            if not valor:
+                continue
+        normalizados[nome] = valor.isoformat() if isinstance(valor, date) else valor
+    return normalizados
+
+
+def montar_chave_cache(endpoint: str, parametros: Dict[str, Any], tags: Iterable[str]) -> Optional[str]:
+    """Monta a chave da entrada; retorna None se o Redis estiver indisponível."""
+    tags = sorted(tags)
+    try:
+        versoes = redis_client.mget([_chave_versao_tag(tag) for tag in tags]) if tags else []
+    except Exception as exc:
+        logger.warning("Cache indisponível ao ler versões de %s: %s", tags, exc)
+        return None
+
+    conteudo = json.dumps(
+        {
+            "parametros": normalizar_parametros(parametros),
+            "hoje": date.today().isoformat(),
+            "versoes": dict(zip(tags, [versao or "0" for versao in versoes])),
+        },
+        sort_keys=True,
+        default=str,
+    )
+    resumo = hashlib.sha1(conteudo.encode("utf-8")).hexdigest()
+    return f"{PREFIXO_CACHE}:{endpoint}:{resumo}"
+
+
+def invalidar_cache(*tags: str) -> None:
+    """Invalida todas as entradas associadas às tags informadas."""
+    try:
+        pipe = redis_client.pipeline()
+        for tag in tags:
+            pipe.incr(_chave_versao_tag(tag))
+        pipe.execute()
+    except Exception as exc:
+        logger.warning("Falha ao invalidar cache das tags %s: %s", tags, exc)
+
+
+def obter_ou_calcular(
+    endpoint: str,
+    parametros: Dict[str, Any],
+    tags: Iterable[str],
+    calcular: Callable[[], Any],
+    ttl: int = TTL_PADRAO_SEGUNDOS,
+) -> Any:
+    """Lê a entrada do cache ou executa `calcular` e grava o resultado (serializável em JSON)."""
+    chave = montar_chave_cache(endpoint, parametros, tags)
+    if chave:
+        try:
+            conteudo = redis_client.get(chave)
+            if conteudo is not None:
+                return json.loads(conteudo)
+        except Exception as exc:
+            logger.warning("Falha ao ler cache %s: %s", chave, exc)
+
+    resposta = calcular()
+
+    if chave:
+        try:
+            resposta_json = jsonable_encoder(resposta)
+            redis_client.setex(chave, ttl, json.dumps(resposta_json))
+            return resposta_json
+        except Exception as exc:
+            logger.warning("Falha ao gravar cache %s: %s", chave, exc)
+    return resposta
+
+
+def cache_resposta(endpoint: str, tags: Iterable[str], ttl: int = TTL_PADRAO_SEGUNDOS) -> Callable:
+    """Decorator para endpoints síncronos de leitura cujo retorno é serializável em JSON."""
+    tags = tuple(tags)
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return obter_ou_calcular(endpoint, kwargs, tags, lambda: func(*args, **kwargs), ttl)
+
+        return wrapper
+
+    return decorator
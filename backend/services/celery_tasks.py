@@ -41,6 +41,11 @@ celery_app.conf.update(
             'task': 'services.celery_tasks.verificar_estoque_baixo',
             'schedule': 21600.0,  # 6 horas
         },
+        'consolidar-dashboard-stats': {
+            'task': 'services.celery_tasks.consolidar_dashboard_stats_task',
+            # Logo após a virada do dia: fecha o dia anterior e revisa a última semana
+            'schedule': crontab(hour=0, minute=15),
+        },
         'backup-mensal': {
             'task': 'services.celery_tasks.backup_mensal_task',
             # Cron: dia 31 às 22:00 (ou último dia do mês se não houver dia 31)
@@ -339,6 +344,23 @@ def backup_mensal_task():
         db.close()
 
 
+@celery_app.task
+def consolidar_dashboard_stats_task(dias: int = None):
+    """Reconsolidar a tabela dashboard_stats (e preencher dias fechados ainda sem linha)"""
+    from services.dashboard_stats_service import DIAS_RECONSOLIDACAO, consolidar_dashboard_stats
+
+    db = SessionLocal()
+    try:
+        total = consolidar_dashboard_stats(db, dias or DIAS_RECONSOLIDACAO)
+        return f"Consolidação do dashboard concluída. {total} dias atualizados."
+    except Exception:
+        db.rollback()
+        logger.exception("Erro na consolidação diária do dashboard")
+        raise
+    finally:
+        db.close()
+
+
 @celery_app.task
 def processar_backup_dados():
     """Fazer backup dos dados importantes - DESCONTINUADO, use backup_diario_task"""
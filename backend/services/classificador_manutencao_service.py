@@ -0,0 +1,370 @@
+"""
+Classificação dos serviços de uma OS em tipos de manutenção (histórico do veículo).
+
+As regras vêm da tabela sugestoes_manutencao, mantida pela equipe em
+/sugestoes-manutencao:
+
+- nome_peca (sem o trecho entre parênteses) é um padrão específico, com o
+  intervalo da própria sugestão ("Pastilhas de freio" -> 20.000 km);
+- tipo_servico que não é palavra das regras fixas é um padrão da categoria,
+  com o menor intervalo entre as sugestões dela ("transmissão" -> 40.000 km).
+
+As palavras genéricas das regras fixas anteriores (REGRAS_PADRAO) mantêm o
+intervalo padrão, salvo quando uma única peça da tabela começa por elas
+("pneu" -> "Pneus"; "filtro" cobre várias peças e continua "Filtros").
+
+Todos os padrões são compilados num único autômato Aho-Corasick sobre o texto
+sem acento e em minúsculas. Cada item de serviço é dividido em serviços
+(vírgula, "+", "/", "e", "com"...) e cada trecho é classificado pelo casamento
+mais longo à esquerda (padrões só começam no início de uma palavra), então
+"filtro de óleo" vence "filtro" e "óleo". Num trecho com padrão específico as
+palavras genéricas são descartadas: em "óleo da transmissão" o óleo apenas
+qualifica a transmissão.
+
+O classificador é mantido por processo e recompilado quando a assinatura da
+tabela (quantidade, maior id e maior updated_at) muda.
+"""
+import logging
+import re
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import ROUND_DOWN, Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func, insert
+
+from models.autocare_models import ItemOrdem, ManutencaoHistorico, OrdemServico, SugestaoManutencao, Veiculo
+from services.busca_texto_service import remover_acentos
+
+logger = logging.getLogger(__name__)
+
+# Serviço sem tipo reconhecido: revisão padrão
+INTERVALO_KM_PADRAO = 10000
+# Estimativa para a data prevista: 1000 km por mês
+KM_POR_MES = 1000
+TAMANHO_LOTE_RECLASSIFICACAO = 500
+
+# (palavras, tipo, intervalo em km) das regras anteriores à tabela de sugestões
+REGRAS_PADRAO = (
+    (("óleo", "lubrificante"), "Troca de óleo", 5000),
+    (("filtro",), "Filtros", 10000),
+    (("correia",), "Correia", 50000),
+    (("vela",), "Velas de ignição", 20000),
+    (("freio", "pastilha", "disco"), "Freios", 30000),
+    (("amortecedor", "suspensão"), "Suspensão", 40000),
+    (("pneu", "balanceamento", "alinhamento"), "Pneus / alinhamento", 10000),
+    (("bateria",), "Bateria", 50000),
+    (("ar condicionado", "climatizador"), "Ar condicionado", 15000),
+    (("revisão", "inspeção"), "Revisão", 10000),
+)
+
+_RE_NAO_ALFANUMERICO = re.compile(r"[^a-z0-9]+")
+_RE_PARENTESES = re.compile(r"\([^)]*\)")
+_RE_NUMERO = re.compile(r"\d[\d.]*")
+# Separadores de serviços numa mesma descrição ("óleo e filtro", "óleo + filtro")
+_RE_SEPARADORES = re.compile(r"[,;+/&]")
+_RE_CONECTIVOS = re.compile(r"\b(?:e|com|mais)\b")
+
+
+def normalizar(texto: Optional[str]) -> str:
+    """Sem acento, minúsculas, palavras separadas por um único espaço."""
+    return _RE_NAO_ALFANUMERICO.sub(" ", remover_acentos(texto or "").lower()).strip()
+
+
+@dataclass(frozen=True)
+class RegraManutencao:
+    tipo: str
+    intervalo_km: int
+    # Vem da tabela de sugestões (peça ou categoria), e não das palavras genéricas
+    especifica: bool = False
+
+
+class AutomatoAhoCorasick:
+    """Casamento simultâneo de vários padrões numa única passada pelo texto."""
+
+    def __init__(self, padroes: Iterable[str]):
+        self._transicoes: List[Dict[str, int]] = [{}]
+        self._falha: List[int] = [0]
+        self._saidas: List[List[str]] = [[]]
+        for padrao in padroes:
+            self._inserir(padrao)
+        self._ligar_falhas()
+
+    def _inserir(self, padrao: str) -> None:
+        estado = 0
+        for caractere in padrao:
+            proximo = self._transicoes[estado].get(caractere)
+            if proximo is None:
+                proximo = len(self._transicoes)
+                self._transicoes[estado][caractere] = proximo
+                self._transicoes.append({})
+                self._falha.append(0)
+                self._saidas.append([])
+            estado = proximo
+        self._saidas[estado].append(padrao)
+
+    def _ligar_falhas(self) -> None:
+        fila = deque(self._transicoes[0].values())
+        while fila:
+            estado = fila.popleft()
+            for caractere, proximo in self._transicoes[estado].items():
+                fila.append(proximo)
+                falha = self._falha[estado]
+                while falha and caractere not in self._transicoes[falha]:
+                    falha = self._falha[falha]
+                self._falha[proximo] = self._transicoes[falha].get(caractere, 0)
+                self._saidas[proximo].extend(self._saidas[self._falha[proximo]])
+
+    def buscar(self, texto: str) -> List[Tuple[int, str]]:
+        """(posição inicial, padrão) de todas as ocorrências."""
+        ocorrencias = []
+        estado = 0
+        for posicao, caractere in enumerate(texto):
+            while estado and caractere not in self._transicoes[estado]:
+                estado = self._falha[estado]
+            estado = self._transicoes[estado].get(caractere, 0)
+            for padrao in self._saidas[estado]:
+                ocorrencias.append((posicao - len(padrao) + 1, padrao))
+        return ocorrencias
+
+
+class ClassificadorManutencao:
+    def __init__(self, regras: Dict[str, RegraManutencao]):
+        self._regras = regras
+        self._automato = AutomatoAhoCorasick(regras)
+
+    def _classificar_trecho(self, texto: str) -> List[RegraManutencao]:
+        ocorrencias = [
+            (inicio, padrao)
+            for inicio, padrao in self._automato.buscar(texto)
+            if inicio == 0 or texto[inicio - 1] == " "
+        ]
+        # Mais longo à esquerda, sem sobreposição
+        ocorrencias.sort(key=lambda ocorrencia: (ocorrencia[0], -len(ocorrencia[1])))
+        regras: List[RegraManutencao] = []
+        fim_anterior = 0
+        for inicio, padrao in ocorrencias:
+            if inicio < fim_anterior:
+                continue
+            fim_anterior = inicio + len(padrao)
+            regras.append(self._regras[padrao])
+        if any(regra.especifica for regra in regras):
+            regras = [regra for regra in regras if regra.especifica]
+        return regras
+
+    def classificar(self, descricao: Optional[str]) -> List[RegraManutencao]:
+        """Tipos de manutenção citados na descrição, na ordem em que aparecem."""
+        regras: List[RegraManutencao] = []
+        for parte in _RE_SEPARADORES.split(descricao or ""):
+            for trecho in _RE_CONECTIVOS.split(normalizar(parte)):
+                for regra in self._classificar_trecho(trecho.strip()):
+                    if regra not in regras:
+                        regras.append(regra)
+        return regras
+
+
+def _intervalo_sugestao(sugestao: SugestaoManutencao) -> Optional[int]:
+    if sugestao.intervalo_km_min:
+        return sugestao.intervalo_km_min
+    if sugestao.intervalo_km_max:
+        return sugestao.intervalo_km_max
+    # Texto livre como "10.000 a 15.000 km"; "2 a 4 anos" não tem km
+    if "km" in (sugestao.km_media_troca or "").lower():
+        numero = _RE_NUMERO.search(sugestao.km_media_troca)
+        if numero:
+            return int(numero.group().replace(".", "")) or None
+    return None
+
+
+def _cobre(padrao_peca: str, palavra: str) -> bool:
+    """A peça começa pela palavra, no singular ou plural ("pneus" cobre "pneu")."""
+    return re.match(rf"{re.escape(palavra)}(?:e?s)?(?: |$)", padrao_peca) is not None
+
+
+def compilar_regras(sugestoes: Sequence[SugestaoManutencao]) -> Dict[str, RegraManutencao]:
+    """padrão normalizado -> regra; a tabela sobrepõe as regras padrão onde é específica."""
+    regras_padrao: Dict[str, RegraManutencao] = {}
+    for palavras, tipo, intervalo_km in REGRAS_PADRAO:
+        for palavra in palavras:
+            regras_padrao[normalizar(palavra)] = RegraManutencao(tipo, intervalo_km)
+
+    pecas: Dict[str, RegraManutencao] = {}
+    categorias: Dict[str, List[SugestaoManutencao]] = {}
+    for sugestao in sugestoes:
+        if sugestao.tipo_servico and normalizar(sugestao.tipo_servico):
+            categorias.setdefault(sugestao.tipo_servico.strip(), []).append(sugestao)
+
+        nome = _RE_PARENTESES.sub(" ", sugestao.nome_peca or "").strip()
+        padrao = normalizar(nome)
+        if not padrao:
+            continue
+        intervalo = _intervalo_sugestao(sugestao)
+        anterior = pecas.get(padrao) or regras_padrao.get(padrao)
+        if intervalo is None:
+            intervalo = anterior.intervalo_km if anterior else INTERVALO_KM_PADRAO
+        elif padrao in pecas:
+            # Variantes do mesmo nome (sintético/semissintético): vale o menor intervalo
+            intervalo = min(intervalo, pecas[padrao].intervalo_km)
+        pecas[padrao] = RegraManutencao(nome, intervalo, especifica=True)
+
+    regras = dict(regras_padrao)
+    for palavra in regras_padrao:
+        cobertura = {regra.tipo: regra for padrao, regra in pecas.items() if _cobre(padrao, palavra)}
+        if len(cobertura) == 1:
+            regras[palavra] = next(iter(cobertura.values()))
+
+    for categoria, sugestoes_categoria in categorias.items():
+        padrao = normalizar(categoria)
+        # Categorias genéricas ("filtro", "pneu") já são palavras padrão
+        if padrao in regras_padrao:
+            continue
+        intervalos = [intervalo for intervalo in map(_intervalo_sugestao, sugestoes_categoria) if intervalo]
+        regras[padrao] = RegraManutencao(
+            categoria[:1].upper() + categoria[1:], min(intervalos, default=INTERVALO_KM_PADRAO), especifica=True
+        )
+
+    regras.update(pecas)
+    return regras
+
+
+_trava = threading.Lock()
+_classificador: Optional[ClassificadorManutencao] = None
+_assinatura: Optional[Tuple[Any, ...]] = None
+
+
+def obter_classificador(db) -> ClassificadorManutencao:
+    """Classificador do processo, recompilado quando sugestoes_manutencao muda."""
+    global _classificador, _assinatura
+    assinatura = tuple(db.query(
+        func.count(SugestaoManutencao.id),
+        func.max(SugestaoManutencao.id),
+        func.max(SugestaoManutencao.updated_at),
+    ).filter(SugestaoManutencao.ativo == True).one())
+
+    with _trava:
+        if _classificador is None or assinatura != _assinatura:
+            sugestoes = db.query(SugestaoManutencao).filter(
+                SugestaoManutencao.ativo == True
+            ).order_by(SugestaoManutencao.ordem_exibicao, SugestaoManutencao.id).all()
+            _classificador = ClassificadorManutencao(compilar_regras(sugestoes))
+            _assinatura = assinatura
+            logger.info("Classificador de manutenções compilado com %s sugestões", len(sugestoes))
+        return _classificador
+
+
+@dataclass
+class _GrupoManutencao:
+    regra: RegraManutencao
+    descricoes: List[str] = field(default_factory=list)
+    valor: Decimal = Decimal("0.00")
+
+
+def montar_historicos(
+    ordem: OrdemServico,
+    itens_servico: Sequence[ItemOrdem],
+    km_veiculo: Optional[int],
+    classificador: ClassificadorManutencao,
+) -> List[Dict[str, Any]]:
+    """Valores das linhas de manutencoes_historico de uma OS concluída: uma por tipo reconhecido."""
+    km_atual = ordem.km_veiculo or km_veiculo or 0
+    data_realizada = ordem.data_conclusao.date() if ordem.data_conclusao else date.today()
+    descricoes = [item.descricao for item in itens_servico if item.descricao]
+
+    grupos: Dict[str, _GrupoManutencao] = {}
+    for item in itens_servico:
+        regras = classificador.classificar(item.descricao)
+        if not regras:
+            continue
+        # Valor do item dividido entre os tipos citados (o resto dos centavos fica no primeiro)
+        valor_item = Decimal(str(item.valor_total or 0))
+        parte = (valor_item / len(regras)).quantize(Decimal("0.01"), rounding=ROUND_DOWN)
+        resto = valor_item - parte * len(regras)
+        for posicao, regra in enumerate(regras):
+            grupo = grupos.setdefault(regra.tipo, _GrupoManutencao(regra))
+            if item.descricao:
+                grupo.descricoes.append(item.descricao)
+            grupo.valor += parte + (resto if posicao == 0 else 0)
+
+    if not grupos:
+        # Nenhum tipo reconhecido: um registro genérico, como antes
+        if itens_servico:
+            tipo = descricoes[0] if descricoes else "Manutenção"
+            descricao = ", ".join(descricoes) if descricoes else "Serviços realizados"
+        else:
+            tipo = "Manutenção"
+            descricao = ordem.descricao_servico or ordem.descricao_problema or "Serviço realizado"
+        grupo = _GrupoManutencao(RegraManutencao(tipo, INTERVALO_KM_PADRAO), [descricao], ordem.valor_total)
+        grupos = {tipo: grupo}
+
+    historicos = []
+    for grupo in grupos.values():
+        km_proxima = km_atual + grupo.regra.intervalo_km if km_atual else None
+        data_proxima = None
+        if km_proxima:
+            data_proxima = data_realizada + relativedelta(months=int(grupo.regra.intervalo_km / KM_POR_MES))
+        historicos.append({
+            "veiculo_id": ordem.veiculo_id,
+            "tipo": grupo.regra.tipo[:100],  # Limitar a 100 caracteres
+            "descricao": ", ".join(grupo.descricoes),
+            "km_realizada": km_atual,
+            "data_realizada": data_realizada,
+            "km_proxima": km_proxima,
+            "data_proxima": data_proxima,
+            "valor": grupo.valor,
+            "observacoes": ordem.observacoes,
+            "ordem_servico_id": ordem.id,
+        })
+    return historicos
+
+
+def reclassificar_historico(db, tamanho_lote: int = TAMANHO_LOTE_RECLASSIFICACAO) -> Tuple[int, int]:
+    """Refaz o histórico gerado de todas as OS concluídas com veículo. Não faz commit.
+
+    Registros manuais (sem ordem_servico_id) não são tocados. Cada lote custa
+    três consultas: as ordens, os itens de serviço (IN) e a regravação.
+    Retorna (ordens processadas, registros gravados).
+    """
+    classificador = obter_classificador(db)
+    ordens_query = db.query(OrdemServico, Veiculo.km_atual).join(
+        Veiculo, Veiculo.id == OrdemServico.veiculo_id
+    ).filter(
+        OrdemServico.status == "CONCLUIDA",
+        OrdemServico.tipo_ordem.in_(["SERVICO", "VENDA_SERVICO"]),
+    ).order_by(OrdemServico.id)
+
+    total_ordens = 0
+    total_registros = 0
+    ultimo_id = 0
+    while True:
+        lote = ordens_query.filter(OrdemServico.id > ultimo_id).limit(tamanho_lote).all()
+        if not lote:
+            break
+        ordem_ids = [ordem.id for ordem, _km in lote]
+        ultimo_id = ordem_ids[-1]
+
+        itens_por_ordem: Dict[int, List[ItemOrdem]] = {}
+        for item in db.query(ItemOrdem).filter(
+            ItemOrdem.ordem_id.in_(ordem_ids),
+            ItemOrdem.tipo == "SERVICO",
+        ).order_by(ItemOrdem.ordem_id, ItemOrdem.id):
+            itens_por_ordem.setdefault(item.ordem_id, []).append(item)
+
+        linhas = []
+        for ordem, km_veiculo in lote:
+            linhas.extend(montar_historicos(ordem, itens_por_ordem.get(ordem.id, []), km_veiculo, classificador))
+
+        db.query(ManutencaoHistorico).filter(
+            ManutencaoHistorico.ordem_servico_id.in_(ordem_ids)
+        ).delete(synchronize_session=False)
+        if linhas:
+            db.execute(insert(ManutencaoHistorico), linhas)
+
+        total_ordens += len(lote)
+        total_registros += len(linhas)
+        db.expunge_all()
+        logger.info("Reclassificadas %s OS (%s registros de histórico)", total_ordens, total_registros)
+
+    return total_ordens, total_registros
@@ -0,0 +1,317 @@
+"""
+Custeio FIFO de estoque (lotes_estoque).
+
+Recebe uma cesta de (produto_id, quantidade), carrega todos os lotes com saldo
+desses produtos em uma única consulta ordenada e distribui as quantidades
+entre os lotes mais antigos em memória, com aritmética Decimal.
+
+Modos:
+- MODO_COTACAO: apenas calcula o custo, sem alterar os lotes;
+- MODO_CONSUMO: além de calcular, baixa o saldo dos lotes alocados.
+
+Produtos cujo saldo em lotes não cobre a quantidade pedida ficam marcados como
+insuficientes e, no modo consumo, seus lotes não são alterados; cabe ao
+chamador decidir entre recusar a operação ou usar o preco_custo do produto.
+
+Baixas concorrentes (vários caixas fechando OS ao mesmo tempo) devem passar
+por reservar_estoque: as linhas dos produtos são travadas com SELECT ... FOR
+UPDATE (o que serializa as reservas do mesmo produto) e, dos lotes, apenas os
+efetivamente consumidos. Produtos e lotes são sempre travados em ordem
+crescente de id, evitando deadlocks. Totais e saldos são gravados com um único
+UPDATE ... FROM (VALUES ...) por tabela, qualquer que seja o tamanho da cesta.
+"""
+import logging
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Integer, Numeric, and_, column, update, values
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from models.autocare_models import LoteEstoque, Produto
+from services.produtos_autocomplete_service import marcar_produtos_alterados
+
+logger = logging.getLogger(__name__)
+
+MODO_COTACAO = "COTACAO"
+MODO_CONSUMO = "CONSUMO"
+
+
+def _decimal(value: Any) -> Decimal:
+    try:
+        return Decimal(str(value or 0))
+    except Exception:
+        return Decimal('0')
+
+
+class EstoqueInsuficienteError(Exception):
+    """Quantidade do produto não cobre a baixa solicitada."""
+
+    def __init__(self, produto_id: int, disponivel: Any, solicitado: Any, nome: Optional[str] = None):
+        self.produto_id = produto_id
+        self.disponivel = disponivel
+        self.solicitado = solicitado
+        self.nome = nome or f"#{produto_id}"
+        super().__init__(
+            f"Estoque insuficiente para o produto {self.nome}. Disponível: {disponivel}, Solicitado: {solicitado}"
+        )
+
+
+@dataclass
+class AlocacaoLote:
+    lote_id: int
+    quantidade: Decimal
+    preco_custo_unitario: Decimal
+
+    @property
+    def custo_total(self) -> Decimal:
+        return self.quantidade * self.preco_custo_unitario
+
+
+@dataclass
+class CustoFifoProduto:
+    produto_id: int
+    quantidade: Decimal
+    disponivel: Decimal = Decimal('0')
+    custo_total: Decimal = Decimal('0.00')
+    alocacoes: List[AlocacaoLote] = field(default_factory=list)
+
+    @property
+    def suficiente(self) -> bool:
+        return self.disponivel >= self.quantidade
+
+    @property
+    def custo_medio(self) -> Decimal:
+        if self.quantidade <= 0:
+            return Decimal('0.00')
+        return self.custo_total / self.quantidade
+
+
+def carregar_lotes_abertos(db: Session, produto_ids: Iterable[int], recarregar: bool = False) -> Dict[int, List[LoteEstoque]]:
+    """Lotes ativos com saldo dos produtos, agrupados por produto na ordem FIFO (uma consulta)."""
+    lotes_por_produto: Dict[int, List[LoteEstoque]] = {produto_id: [] for produto_id in produto_ids if produto_id}
+    if not lotes_por_produto:
+        return lotes_por_produto
+
+    query = db.query(LoteEstoque).filter(
+        and_(
+            LoteEstoque.produto_id.in_(list(lotes_por_produto)),
+            LoteEstoque.saldo_atual > 0,
+            LoteEstoque.ativo == True
+        )
+    ).order_by(LoteEstoque.produto_id, LoteEstoque.data_entrada.asc(), LoteEstoque.id.asc())
+    if recarregar:
+        # Descarta valores em cache na sessão: o saldo pode ter mudado em outra transação
+        query = query.populate_existing()
+
+    for lote in query.all():
+        lotes_por_produto[lote.produto_id].append(lote)
+    return lotes_por_produto
+
+
+def agrupar_cesta(cesta: Iterable[Tuple[int, Any]]) -> Dict[int, Decimal]:
+    """Soma as quantidades por produto, preservando a ordem de primeira aparição."""
+    quantidades: Dict[int, Decimal] = {}
+    for produto_id, quantidade in cesta:
+        if not produto_id:
+            continue
+        quantidades[produto_id] = quantidades.get(produto_id, Decimal('0')) + _decimal(quantidade)
+    return quantidades
+
+
+def alocar_lotes(produto_id: int, quantidade: Decimal, lotes: List[LoteEstoque], consumir: bool = False) -> CustoFifoProduto:
+    """Distribui a quantidade entre os lotes (já em ordem FIFO) de um produto."""
+    resultado = CustoFifoProduto(
+        produto_id=produto_id,
+        quantidade=quantidade,
+        disponivel=sum((_decimal(lote.saldo_atual) for lote in lotes), Decimal('0')),
+    )
+    if quantidade <= 0 or resultado.disponivel < quantidade:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "FIFO produto %s: saldo em lotes %s insuficiente para %s",
+                produto_id, resultado.disponivel, quantidade,
+            )
+        return resultado
+
+    restante = quantidade
+    for lote in lotes:
+        if restante <= 0:
+            break
+        saldo_lote = _decimal(lote.saldo_atual)
+        consumo = min(saldo_lote, restante)
+        alocacao = AlocacaoLote(
+            lote_id=lote.id,
+            quantidade=consumo,
+            preco_custo_unitario=_decimal(lote.preco_custo_unitario),
+        )
+        resultado.alocacoes.append(alocacao)
+        resultado.custo_total += alocacao.custo_total
+        restante -= consumo
+        if consumir:
+            lote.saldo_atual = saldo_lote - consumo
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "FIFO produto %s lote %s: %s x R$%s = R$%s",
+                produto_id, lote.id, consumo, alocacao.preco_custo_unitario, alocacao.custo_total,
+            )
+
+    return resultado
+
+
+def calcular_custos_fifo(
+    db: Session,
+    cesta: Iterable[Tuple[int, Any]],
+    modo: str = MODO_COTACAO,
+    lotes_por_produto: Optional[Dict[int, List[LoteEstoque]]] = None,
+) -> Dict[int, CustoFifoProduto]:
+    """
+    Custo FIFO de uma cesta de produtos.
+
+    Args:
+        db: Sessão do banco
+        cesta: Pares (produto_id, quantidade); produtos repetidos são somados
+        modo: MODO_COTACAO (somente leitura) ou MODO_CONSUMO (baixa os lotes)
+        lotes_por_produto: Lotes já carregados (evita nova consulta)
+
+    Returns:
+        Custo e alocações por produto_id
+    """
+    if modo not in (MODO_COTACAO, MODO_CONSUMO):
+        raise ValueError(f"Modo de custeio FIFO inválido: {modo}")
+
+    quantidades = agrupar_cesta(cesta)
+    if lotes_por_produto is None:
+        lotes_por_produto = carregar_lotes_abertos(db, quantidades.keys())
+
+    return {
+        produto_id: alocar_lotes(
+            produto_id,
+            quantidade,
+            lotes_por_produto.get(produto_id, []),
+            consumir=modo == MODO_CONSUMO,
+        )
+        for produto_id, quantidade in quantidades.items()
+    }
+
+
+def _somar_em_lote(db: Session, modelo, coluna: str, deltas: Dict[int, Any]) -> Dict[int, Any]:
+    """Soma os deltas à coluna com um único UPDATE ... FROM (VALUES ...) e sincroniza os objetos da sessão."""
+    if not deltas:
+        return {}
+
+    tabela_deltas = values(
+        column("id", Integer),
+        column("delta", Numeric),
+        name="deltas",
+    ).data(sorted(deltas.items()))
+    atributo = getattr(modelo, coluna)
+    stmt = (
+        update(modelo)
+        .where(modelo.id == tabela_deltas.c.id)
+        .values({coluna: atributo + tabela_deltas.c.delta})
+        .returning(modelo.id, atributo)
+        .execution_options(synchronize_session=False)
+    )
+
+    novos_valores = {registro_id: valor for registro_id, valor in db.execute(stmt)}
+    for registro_id, valor in novos_valores.items():
+        objeto = db.identity_map.get(identity_key(modelo, registro_id))
+        if objeto is not None:
+            set_committed_value(objeto, coluna, valor)
+    if modelo is Produto:
+        # UPDATE fora do unit of work: avisa o índice de autocomplete explicitamente
+        marcar_produtos_alterados(db, novos_valores)
+    return novos_valores
+
+
+def movimentar_quantidade_produto(db: Session, produto_id: int, delta: Any) -> Optional[int]:
+    """Soma delta a Produto.quantidade_atual com um único UPDATE atômico; retorna a nova quantidade."""
+    return _somar_em_lote(db, Produto, "quantidade_atual", {produto_id: delta}).get(produto_id)
+
+
+def movimentar_quantidades_produtos(db: Session, deltas: Dict[int, Any]) -> Dict[int, Any]:
+    """
+    Soma os deltas (produto_id -> quantidade) aos totais dos produtos.
+
+    As linhas são travadas antes em ordem de id, como em reservar_estoque, e a
+    atualização sai em uma única instrução.
+    """
+    deltas = {produto_id: delta for produto_id, delta in deltas.items() if produto_id and delta}
+    if not deltas:
+        return {}
+    db.query(Produto.id).filter(Produto.id.in_(list(deltas))).order_by(Produto.id).with_for_update().all()
+    return _somar_em_lote(db, Produto, "quantidade_atual", deltas)
+
+
+def reservar_estoque(db: Session, cesta: Iterable[Tuple[int, Any]], exigir_lotes: bool = False) -> Dict[int, CustoFifoProduto]:
+    """
+    Baixa de estoque segura sob concorrência: decrementa o total dos produtos e consome os lotes via FIFO.
+
+    Args:
+        db: Sessão do banco (as travas valem até o commit/rollback do chamador)
+        cesta: Pares (produto_id, quantidade); produtos repetidos são somados
+        exigir_lotes: Recusa a baixa quando os lotes não cobrem a quantidade
+
+    Returns:
+        Custo e alocações por produto_id. Produtos sem lotes suficientes (cadastros
+        antigos) têm apenas o total decrementado e vêm com suficiente=False.
+
+    Raises:
+        EstoqueInsuficienteError: quando algum produto não tem quantidade suficiente
+    """
+    quantidades = agrupar_cesta(cesta)
+    produto_ids = sorted(produto_id for produto_id, quantidade in quantidades.items() if quantidade > 0)
+    if not produto_ids:
+        return {}
+
+    # 1) Travar os produtos em ordem de id e conferir os totais atualizados
+    produtos = {
+        produto.id: produto
+        for produto in db.query(Produto).filter(Produto.id.in_(produto_ids))
+        .order_by(Produto.id).with_for_update().populate_existing().all()
+    }
+    for produto_id in produto_ids:
+        produto = produtos.get(produto_id)
+        if produto is None or _decimal(produto.quantidade_atual) < quantidades[produto_id]:
+            raise EstoqueInsuficienteError(
+                produto_id,
+                produto.quantidade_atual if produto else 0,
+                quantidades[produto_id],
+                produto.nome if produto else None,
+            )
+
+    # 2) Com os produtos travados, nenhuma outra reserva altera seus lotes: planejar a alocação
+    lotes_por_produto = carregar_lotes_abertos(db, produto_ids, recarregar=True)
+    planos = {
+        produto_id: alocar_lotes(produto_id, quantidades[produto_id], lotes_por_produto.get(produto_id, []))
+        for produto_id in produto_ids
+    }
+
+    # 3) Travar somente os lotes que serão consumidos, em ordem de id, e relê-los
+    lote_ids = sorted({alocacao.lote_id for plano in planos.values() for alocacao in plano.alocacoes})
+    if lote_ids:
+        db.query(LoteEstoque).filter(LoteEstoque.id.in_(lote_ids)).order_by(LoteEstoque.id).with_for_update().populate_existing().all()
+
+    resultados = {}
+    consumo_lotes: Dict[int, Decimal] = {}
+    for produto_id in produto_ids:
+        ids_alocados = {alocacao.lote_id for alocacao in planos[produto_id].alocacoes}
+        lotes_alocados = [lote for lote in lotes_por_produto.get(produto_id, []) if lote.id in ids_alocados]
+        resultado = alocar_lotes(produto_id, quantidades[produto_id], lotes_alocados)
+        if not resultado.suficiente:
+            # Lote alterado fora do fluxo de reserva entre o planejamento e a trava
+            resultado.disponivel = planos[produto_id].disponivel
+            if exigir_lotes or planos[produto_id].suficiente:
+                raise EstoqueInsuficienteError(produto_id, resultado.disponivel, quantidades[produto_id], produtos[produto_id].nome)
+        for alocacao in resultado.alocacoes:
+            consumo_lotes[alocacao.lote_id] = -alocacao.quantidade
+        resultados[produto_id] = resultado
+
+    # 4) Gravar saldos dos lotes e totais dos produtos em lote
+    _somar_em_lote(db, LoteEstoque, "saldo_atual", consumo_lotes)
+    _somar_em_lote(db, Produto, "quantidade_atual", {produto_id: -quantidades[produto_id] for produto_id in produto_ids})
+
+    return resultados
@@ -0,0 +1,398 @@
+"""
+Consolidação diária do dashboard (tabela dashboard_stats).
+
+Cada linha guarda os totais das OS concluídas no dia (pela data de conclusão)
+e um retrato dos contadores gerais no momento da consolidação. O dashboard lê
+os dias já fechados desta tabela e calcula ao vivo apenas o dia corrente.
+
+As linhas são regravadas (upsert) quando uma OS é concluída, editada ou
+cancelada, quando há movimentação de estoque e pela task diária do Celery.
+"""
+import logging
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from models.autocare_models import Cliente, DashboardStats, ItemOrdem, OrdemServico, Produto, Veiculo
+
+logger = logging.getLogger(__name__)
+
+# Campo do agregado de OS concluídas -> coluna da tabela dashboard_stats
+CAMPOS_ROLLUP = {
+    "ordens_concluidas": "ordens_hoje",
+    "servicos_realizados": "servicos_realizados",
+    "faturamento": "receita_diaria",
+    "valor_total_vendas": "valor_total_vendas",
+    "vendas_servicos": "vendas_servicos",
+    "vendas_pecas": "vendas_pecas",
+    "descontos": "descontos",
+    "custo_pecas": "custo_pecas",
+    "mao_obra_avulsa": "mao_obra_avulsa",
+    "receita_liquida": "receita_liquida",
+    "pecas_vendidas": "pecas_vendidas",
+}
+
+CAMPOS_CONTAGEM = {"ordens_concluidas", "servicos_realizados"}
+
+# Dias recalculados pela task diária (cobre edições tardias de OS concluídas)
+DIAS_RECONSOLIDACAO = 7
+# Dias gravados por commit no preenchimento de dias sem linha
+TAMANHO_LOTE_BACKFILL = 31
+
+
+def filtro_os_concluida():
+    return OrdemServico.status == "CONCLUIDA"
+
+
+def expr_desconto_total():
+    """Desconto da OS (valor_desconto se existir, senão desconto legado)."""
+    return func.coalesce(OrdemServico.valor_desconto, func.coalesce(OrdemServico.desconto, 0))
+
+
+def expr_valor_cliente():
+    """Valor Cliente da tela de OS: serviço + peças - desconto."""
+    return (
+        func.coalesce(OrdemServico.valor_servico, 0)
+        + func.coalesce(OrdemServico.valor_pecas, 0)
+        - expr_desconto_total()
+    )
+
+
+def _expr_parte_liquida(coluna):
+    # Desconto alocado proporcionalmente entre serviço e peças de cada OS
+    total_bruto_expr = func.coalesce(OrdemServico.valor_servico, 0) + func.coalesce(OrdemServico.valor_pecas, 0)
+    desconto_parte_expr = func.coalesce(
+        (func.coalesce(coluna, 0) / func.nullif(total_bruto_expr, 0)) * expr_desconto_total(),
+        0
+    )
+    return func.coalesce(coluna, 0) - desconto_parte_expr
+
+
+def expr_servico_liquido():
+    return _expr_parte_liquida(OrdemServico.valor_servico)
+
+
+def expr_pecas_liquido():
+    return _expr_parte_liquida(OrdemServico.valor_pecas)
+
+
+def _zerar_agregados() -> Dict[str, Any]:
+    return {
+        campo: (0 if campo in CAMPOS_CONTAGEM else Decimal('0.00'))
+        for campo in CAMPOS_ROLLUP
+    }
+
+
+def agregar_ordens_concluidas(db: Session, coluna_data, inicio: date, fim: date) -> Dict[str, Any]:
+    """Totais das OS concluídas com coluna_data em [inicio, fim), calculados no banco."""
+    from routes.autocare_ordens import VERSAO_CALCULO_FINANCEIRO, ResolvedorTaxaPagamento, obter_valores_financeiros
+
+    filtro_periodo = and_(filtro_os_concluida(), coluna_data >= inicio, coluna_data < fim)
+    filtro_sem_snapshot = or_(
+        OrdemServico.versao_calculo_financeiro.is_(None),
+        OrdemServico.versao_calculo_financeiro != VERSAO_CALCULO_FINANCEIRO,
+    )
+
+    linha = db.query(
+        func.count(OrdemServico.id).label("ordens_concluidas"),
+        func.count(OrdemServico.id).filter(
+            OrdemServico.tipo_ordem.in_(["SERVICO", "VENDA_SERVICO"])
+        ).label("servicos_realizados"),
+        func.sum(expr_valor_cliente()).label("faturamento"),
+        func.sum(OrdemServico.valor_total).label("valor_total_vendas"),
+        func.sum(expr_servico_liquido()).filter(
+            OrdemServico.tipo_ordem.in_(["SERVICO", "VENDA_SERVICO"])
+        ).label("vendas_servicos"),
+        func.sum(expr_pecas_liquido()).filter(
+            OrdemServico.tipo_ordem.in_(["VENDA", "VENDA_SERVICO"])
+        ).label("vendas_pecas"),
+        func.sum(expr_desconto_total()).label("descontos"),
+        func.sum(func.coalesce(OrdemServico.valor_custo_pecas, 0)).label("custo_pecas"),
+        func.sum(func.coalesce(OrdemServico.valor_mao_obra_avulso, 0)).label("mao_obra_avulsa"),
+        func.sum(func.coalesce(OrdemServico.valor_faturado, 0)).filter(
+            OrdemServico.versao_calculo_financeiro == VERSAO_CALCULO_FINANCEIRO
+        ).label("receita_liquida"),
+        func.count(OrdemServico.id).filter(filtro_sem_snapshot).label("sem_snapshot"),
+    ).filter(filtro_periodo).one()
+
+    pecas_vendidas = db.query(func.sum(ItemOrdem.quantidade)).join(
+        OrdemServico, ItemOrdem.ordem_id == OrdemServico.id
+    ).filter(
+        and_(
+            filtro_periodo,
+            or_(ItemOrdem.tipo == "PRODUTO", ItemOrdem.tipo == "produto")
+        )
+    ).scalar()
+
+    agregados = _zerar_agregados()
+    for campo in CAMPOS_ROLLUP:
+        if campo == "pecas_vendidas":
+            continue
+        valor = getattr(linha, campo)
+        if valor is not None:
+            agregados[campo] = valor
+    agregados["pecas_vendidas"] = pecas_vendidas or Decimal('0.00')
+
+    # OS sem snapshot financeiro atual (legado ainda não recalculado)
+    if linha.sem_snapshot:
+        resolvedor_taxa = ResolvedorTaxaPagamento(db)
+        for ordem in db.query(OrdemServico).filter(and_(filtro_periodo, filtro_sem_snapshot)).all():
+            _, valor_faturado = obter_valores_financeiros(ordem, db, resolvedor_taxa)
+            agregados["receita_liquida"] += valor_faturado
+
+    return agregados
+
+
+def _somar_agregados(destino: Dict[str, Any], origem: Dict[str, Any]) -> None:
+    for campo in CAMPOS_ROLLUP:
+        destino[campo] += origem[campo]
+
+
+def _agregados_da_linha(linha: DashboardStats) -> Dict[str, Any]:
+    agregados = _zerar_agregados()
+    for campo, coluna in CAMPOS_ROLLUP.items():
+        valor = getattr(linha, coluna)
+        if valor is not None:
+            agregados[campo] = valor
+    return agregados
+
+
+def primeiro_dia_consolidado(db: Session) -> Optional[date]:
+    """Dia da primeira conclusão de OS: antes dele todos os totais são zero e não há linhas."""
+    primeira_conclusao = db.query(func.min(OrdemServico.data_conclusao)).scalar()
+    return primeira_conclusao.date() if primeira_conclusao else None
+
+
+def carregar_dias_fechados(db: Session, inicio: date, fim: date) -> Optional[List[DashboardStats]]:
+    """Linhas consolidadas dos dias já fechados em [inicio, fim).
+
+    Dias anteriores à primeira conclusão contam como zerados. Retorna None
+    quando falta algum dia a partir dela, para que o chamador calcule ao vivo.
+    """
+    fim_fechado = min(fim, date.today())
+    primeiro_dia = primeiro_dia_consolidado(db)
+    if primeiro_dia is None:
+        return []
+    inicio = max(inicio, primeiro_dia)
+    if inicio >= fim_fechado:
+        return []
+
+    linhas = db.query(DashboardStats).filter(
+        and_(
+            DashboardStats.data_referencia >= inicio,
+            DashboardStats.data_referencia < fim_fechado,
+        )
+    ).all()
+    if len(linhas) != (fim_fechado - inicio).days:
+        return None
+    return linhas
+
+
+def obter_agregados_periodo(
+    db: Session,
+    tipo_data: str,
+    coluna_data,
+    inicio: date,
+    fim: date,
+) -> Dict[str, Any]:
+    """Totais das OS concluídas no período: dias fechados da consolidação + hoje ao vivo.
+
+    A consolidação é por data de conclusão; no filtro por abertura (ou com
+    dias ainda não consolidados) o período inteiro é calculado ao vivo.
+    """
+    if tipo_data != "conclusao":
+        return agregar_ordens_concluidas(db, coluna_data, inicio, fim)
+
+    linhas = carregar_dias_fechados(db, inicio, fim)
+    if linhas is None:
+        return agregar_ordens_concluidas(db, coluna_data, inicio, fim)
+
+    agregados = _zerar_agregados()
+    for linha in linhas:
+        _somar_agregados(agregados, _agregados_da_linha(linha))
+
+    hoje = date.today()
+    if inicio <= hoje < fim:
+        _somar_agregados(agregados, agregar_ordens_concluidas(db, coluna_data, hoje, hoje + timedelta(days=1)))
+
+    return agregados
+
+
+def obter_agregados_mensais(
+    db: Session,
+    coluna_data,
+    inicio: date,
+    fim: date,
+) -> Optional[Dict[Tuple[int, int], Dict[str, Any]]]:
+    """Totais por (ano, mês) a partir da consolidação (filtro por conclusão).
+
+    Retorna None quando falta algum dia fechado no intervalo.
+    """
+    linhas = carregar_dias_fechados(db, inicio, fim)
+    if linhas is None:
+        return None
+
+    por_mes: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    for linha in linhas:
+        chave = (linha.data_referencia.year, linha.data_referencia.month)
+        _somar_agregados(por_mes.setdefault(chave, _zerar_agregados()), _agregados_da_linha(linha))
+
+    hoje = date.today()
+    if inicio <= hoje < fim:
+        chave = (hoje.year, hoje.month)
+        _somar_agregados(
+            por_mes.setdefault(chave, _zerar_agregados()),
+            agregar_ordens_concluidas(db, coluna_data, hoje, hoje + timedelta(days=1)),
+        )
+
+    return por_mes
+
+
+def _receita_acumulada(db: Session, inicio: date, fim: date) -> Decimal:
+    valor = db.query(func.sum(DashboardStats.receita_diaria)).filter(
+        and_(
+            DashboardStats.data_referencia >= inicio,
+            DashboardStats.data_referencia < fim,
+        )
+    ).scalar()
+    return Decimal(str(valor or 0))
+
+
+def montar_rollup_dia(db: Session, dia: date) -> Dict[str, Any]:
+    """Valores da linha consolidada de um dia."""
+    agregados = agregar_ordens_concluidas(db, OrdemServico.data_conclusao, dia, dia + timedelta(days=1))
+
+    contadores = db.query(
+        db.query(func.count(Cliente.id)).filter(Cliente.ativo == True).scalar_subquery().label("total_clientes"),
+        db.query(func.count(Veiculo.id)).filter(Veiculo.ativo == True).scalar_subquery().label("total_veiculos"),
+        db.query(func.sum(Produto.quantidade_atual)).filter(Produto.ativo == True).scalar_subquery().label("total_pecas_estoque"),
+        db.query(func.count(OrdemServico.id)).filter(
+            OrdemServico.status == "PENDENTE"
+        ).scalar_subquery().label("ordens_abertas"),
+        db.query(func.count(Produto.id)).filter(
+            and_(
+                Produto.quantidade_atual <= Produto.quantidade_minima,
+                Produto.ativo == True
+            )
+        ).scalar_subquery().label("alertas_estoque"),
+    ).one()
+
+    valores = {"data_referencia": dia}
+    for campo, coluna in CAMPOS_ROLLUP.items():
+        valores[coluna] = agregados[campo]
+
+    valores.update(
+        total_clientes=contadores.total_clientes or 0,
+        total_veiculos=contadores.total_veiculos or 0,
+        total_pecas_estoque=int(contadores.total_pecas_estoque or 0),
+        ordens_abertas=contadores.ordens_abertas or 0,
+        alertas_estoque=contadores.alertas_estoque or 0,
+    )
+
+    # Receita do mês até o dia e crescimento sobre o mesmo período do mês anterior
+    inicio_mes = dia.replace(day=1)
+    receita_mensal = _receita_acumulada(db, inicio_mes, dia) + Decimal(str(agregados["faturamento"]))
+    inicio_mes_anterior = (inicio_mes - timedelta(days=1)).replace(day=1)
+    fim_mes_anterior = min(inicio_mes_anterior + timedelta(days=dia.day), inicio_mes)
+    receita_mes_anterior = _receita_acumulada(db, inicio_mes_anterior, fim_mes_anterior)
+
+    crescimento_mensal = Decimal('0.00')
+    if receita_mes_anterior > 0:
+        crescimento_mensal = (receita_mensal / receita_mes_anterior - 1) * 100
+        # Limite da coluna Numeric(5, 2)
+        crescimento_mensal = max(min(crescimento_mensal, Decimal('999.99')), Decimal('-999.99'))
+
+    valores["receita_mensal"] = receita_mensal
+    valores["crescimento_mensal"] = crescimento_mensal.quantize(Decimal('0.01'))
+    return valores
+
+
+def atualizar_dashboard_stats_dia(db: Session, dia: date) -> None:
+    """Recalcula e grava (upsert) a linha consolidada do dia. Não faz commit."""
+    valores = montar_rollup_dia(db, dia)
+    stmt = insert(DashboardStats).values(**valores)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DashboardStats.data_referencia],
+        set_={
+            **{coluna: stmt.excluded[coluna] for coluna in valores if coluna != "data_referencia"},
+            "updated_at": func.now(),
+        },
+    )
+    db.execute(stmt)
+
+
+def atualizar_dashboard_stats_periodo(db: Session, inicio: date, fim: date) -> int:
+    """Reconsolida os dias em [inicio, fim) em ordem crescente. Não faz commit."""
+    dia = inicio
+    total = 0
+    while dia < fim:
+        atualizar_dashboard_stats_dia(db, dia)
+        dia += timedelta(days=1)
+        total += 1
+    return total
+
+
+def registrar_alteracao_dashboard(db: Session, dias: Iterable[Optional[Any]] = ()) -> None:
+    """Reconsolida hoje e os dias informados após uma escrita já confirmada.
+
+    Falhas são apenas registradas em log: a consolidação nunca deve derrubar
+    a operação principal, e a task diária corrige eventuais lacunas.
+    """
+    dias_afetados = {date.today()}
+    for dia in dias:
+        if isinstance(dia, datetime):
+            dias_afetados.add(dia.date())
+        elif isinstance(dia, date):
+            dias_afetados.add(dia)
+
+    try:
+        for dia in sorted(dias_afetados):
+            atualizar_dashboard_stats_dia(db, dia)
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Erro ao atualizar consolidação do dashboard para %s", sorted(dias_afetados))
+
+
+def consolidar_dashboard_stats(db: Session, dias: int = DIAS_RECONSOLIDACAO) -> int:
+    """Reconsolida os últimos dias e preenche os dias fechados que ainda não têm linha.
+
+    O preenchimento cobre desde a primeira conclusão de OS (backfill após a
+    implantação ou lacunas de dias sem escrita) e grava em lotes de
+    TAMANHO_LOTE_BACKFILL dias.
+    """
+    hoje = date.today()
+    inicio = hoje - timedelta(days=dias)
+    total = 0
+
+    primeiro_dia = primeiro_dia_consolidado(db)
+    if primeiro_dia is not None and primeiro_dia < inicio:
+        existentes = {
+            dia for (dia,) in db.query(DashboardStats.data_referencia).filter(
+                and_(
+                    DashboardStats.data_referencia >= primeiro_dia,
+                    DashboardStats.data_referencia < inicio,
+                )
+            )
+        }
+        faltantes = [
+            primeiro_dia + timedelta(days=deslocamento)
+            for deslocamento in range((inicio - primeiro_dia).days)
+            if primeiro_dia + timedelta(days=deslocamento) not in existentes
+        ]
+        for posicao, dia in enumerate(faltantes, start=1):
+            atualizar_dashboard_stats_dia(db, dia)
+            if posicao % TAMANHO_LOTE_BACKFILL == 0:
+                db.commit()
+        db.commit()
+        total += len(faltantes)
+        if faltantes:
+            logger.info("Consolidação do dashboard: %s dias preenchidos desde %s", len(faltantes), primeiro_dia)
+
+    total += atualizar_dashboard_stats_periodo(db, inicio, hoje + timedelta(days=1))
+    db.commit()
+    return total
@@ -7,8 +7,6 @@ from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from typing import Any, Dict, Optional
-import re
-import unicodedata
 
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
@@ -20,15 +18,6 @@ from config import SMTP_PASS, SMTP_PORT, SMTP_SERVER, SMTP_USER
 from models.autocare_models import Configuracao, EmailEnvioLog, ItemOrdem, OrdemServico
 
 
-def _normalizar_status_ordem(status_value: Any) -> str:
-    if status_value is None:
-        return ""
-    status_ascii = unicodedata.normalize("NFKD", str(status_value))
-    status_ascii = status_ascii.encode("ascii", "ignore").decode("ascii")
-    status_ascii = re.sub(r"[^A-Z]+", "_", status_ascii.upper()).strip("_")
-    return status_ascii
-
-
 def _config_value(db: Session, chave: str, default: str = "") -> str:
     config = db.query(Configuracao).filter(Configuracao.chave == chave).first()
     if not config or config.valor is None:
@@ -161,7 +150,7 @@ def gerar_pdf_fechamento_os(db: Session, ordem_id: int) -> bytes:
         veiculo = f"{ordem.veiculo.marca} {ordem.veiculo.modelo} - {ordem.veiculo.placa}"
 
     dados_gerais = [
-        ["OS", str(ordem.numero or "-"), "Status", str(_normalizar_status_ordem(ordem.status) or ordem.status or "-")],
+        ["OS", str(ordem.numero or "-"), "Status", str(ordem.status or "-")],
         ["Cliente", cliente_nome, "E-mail", cliente_email or "-"],
         ["Veículo", veiculo, "Data abertura", _data_br(ordem.data_abertura)],
         ["Data conclusão", _data_br(ordem.data_conclusao), "Responsável", str(ordem.funcionario_responsavel or "-")],
@@ -366,7 +355,7 @@ def enviar_email_fechamento_os(
             "message": "Envio de e-mail desabilitado globalmente na aplicação",
         }
 
-    if _normalizar_status_ordem(ordem.status) != "CONCLUIDA":
+    if ordem.status != "CONCLUIDA":
         _registrar_log_email(db, ordem, destinatario_override, origem_envio, "bloqueado", "Ordem ainda não está concluída")
         return {"success": False, "retryable": False, "message": "Ordem ainda não está concluída"}
 
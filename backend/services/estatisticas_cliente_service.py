@@ -0,0 +1,297 @@
+"""
+Estatísticas de clientes (total gasto, serviços, veículos, última visita).
+
+Regras de negócio:
+- Serviços: considerar apenas ordens CONCLUIDA dos tipos 'SERVICO' e 'VENDA_SERVICO'.
+- Total gasto: somar SOMENTE o valor do serviço de cada OS (em 'VENDA_SERVICO'
+  desconsiderar produtos/peças), usando nesta ordem: valor_servico >
+  valor_mao_obra > (valor_total - valor_pecas) > soma dos itens de tipo 'SERVICO'.
+
+A regra é avaliada no banco (valor_servico_ordem) e agregada por cliente numa
+única consulta agrupada para a página inteira, em vez de carregar todas as
+ordens de cada cliente.
+
+A ficha do cliente lê a projeção cliente_estatisticas (uma linha por cliente,
+histórico completo). A linha é regravada (upsert) quando uma OS do cliente é
+criada concluída, editada ou cancelada; o backfill é feito por
+scripts/reconstruir_estatisticas_clientes.py.
+"""
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from models.autocare_models import Cliente, ClienteEstatistica, ItemOrdem, OrdemServico, Veiculo
+
+logger = logging.getLogger(__name__)
+
+TIPOS_ORDEM_SERVICO = ("SERVICO", "VENDA_SERVICO")
+TOP_ITENS = 5
+TAMANHO_LOTE_RECONSTRUCAO = 500
+
+
+@dataclass
+class EstatisticasCliente:
+    total_gasto: float = 0.0
+    total_servicos: int = 0
+    veiculos_count: int = 0
+    ultima_visita: Optional[datetime] = None
+
+
+def data_inicio_periodo(periodo: Optional[str]) -> Optional[datetime]:
+    """Início do período T=Total (None), A=Anual, M=Mensal."""
+    now = datetime.now()
+    if periodo == "M":
+        return now.replace(day=1)
+    if periodo == "A":
+        return now.replace(month=1, day=1)
+    return None
+
+
+def valor_servico_ordem():
+    """Valor de serviço de uma OS (expressão SQL sobre ordens_servico)."""
+    servicos_itens = (
+        select(func.coalesce(func.sum(ItemOrdem.valor_total), 0))
+        .where(ItemOrdem.ordem_id == OrdemServico.id, ItemOrdem.tipo == "SERVICO")
+        .correlate(OrdemServico)
+        .scalar_subquery()
+    )
+    total_menos_pecas = OrdemServico.valor_total - OrdemServico.valor_pecas
+    return case(
+        (OrdemServico.tipo_ordem.notin_(TIPOS_ORDEM_SERVICO), 0),
+        (OrdemServico.valor_servico > 0, OrdemServico.valor_servico),
+        (OrdemServico.valor_mao_obra > 0, OrdemServico.valor_mao_obra),
+        (total_menos_pecas > 0, total_menos_pecas),
+        else_=servicos_itens,
+    )
+
+
+def estatisticas_por_cliente(db, cliente_ids: Iterable[int], periodo: Optional[str]) -> Dict[int, EstatisticasCliente]:
+    """Estatísticas dos clientes informados (uma página) numa única consulta.
+
+    Total gasto e serviços respeitam o período; a última visita considera todo o histórico.
+    """
+    cliente_ids = list(cliente_ids)
+    if not cliente_ids:
+        return {}
+
+    data_inicio = data_inicio_periodo(periodo)
+    no_periodo = OrdemServico.data_conclusao >= data_inicio if data_inicio else None
+
+    def agregar(agregado, *condicoes):
+        condicoes = [condicao for condicao in condicoes if condicao is not None]
+        return agregado.filter(and_(*condicoes)) if condicoes else agregado
+
+    ordens = (
+        select(
+            OrdemServico.cliente_id.label("cliente_id"),
+            agregar(func.sum(valor_servico_ordem()), no_periodo).label("total_gasto"),
+            agregar(func.count(OrdemServico.id), no_periodo, OrdemServico.tipo_ordem.in_(TIPOS_ORDEM_SERVICO)).label("total_servicos"),
+            func.max(OrdemServico.data_conclusao).label("ultima_visita"),
+        )
+        .where(OrdemServico.cliente_id.in_(cliente_ids), OrdemServico.status == "CONCLUIDA")
+        .group_by(OrdemServico.cliente_id)
+        .subquery()
+    )
+    veiculos = (
+        select(Veiculo.cliente_id.label("cliente_id"), func.count(Veiculo.id).label("veiculos_count"))
+        .where(Veiculo.cliente_id.in_(cliente_ids), Veiculo.ativo == True)
+        .group_by(Veiculo.cliente_id)
+        .subquery()
+    )
+    linhas = db.execute(
+        select(
+            Cliente.id.label("cliente_id"),
+            ordens.c.total_gasto,
+            ordens.c.total_servicos,
+            ordens.c.ultima_visita,
+            veiculos.c.veiculos_count,
+        )
+        .outerjoin(ordens, ordens.c.cliente_id == Cliente.id)
+        .outerjoin(veiculos, veiculos.c.cliente_id == Cliente.id)
+        .where(Cliente.id.in_(cliente_ids))
+    ).all()
+
+    return {
+        linha.cliente_id: EstatisticasCliente(
+            total_gasto=float(linha.total_gasto or 0),
+            total_servicos=linha.total_servicos or 0,
+            veiculos_count=linha.veiculos_count or 0,
+            ultima_visita=linha.ultima_visita,
+        )
+        for linha in linhas
+    }
+
+
+def _top_itens(db: Session, cliente_id: int) -> Dict[str, List[Dict[str, Any]]]:
+    """Serviços e peças mais frequentes nas OS concluídas do cliente (TOP_ITENS de cada)."""
+    tipo = func.upper(ItemOrdem.tipo)
+    vezes = func.count(ItemOrdem.id)
+    valor_total = func.coalesce(func.sum(ItemOrdem.valor_total), 0)
+    agrupados = (
+        select(
+            tipo.label("tipo"),
+            ItemOrdem.descricao.label("descricao"),
+            vezes.label("vezes"),
+            func.coalesce(func.sum(ItemOrdem.quantidade), 0).label("quantidade"),
+            valor_total.label("valor_total"),
+            func.row_number().over(
+                partition_by=tipo,
+                order_by=(vezes.desc(), valor_total.desc(), ItemOrdem.descricao),
+            ).label("posicao"),
+        )
+        .join(OrdemServico, OrdemServico.id == ItemOrdem.ordem_id)
+        .where(
+            OrdemServico.cliente_id == cliente_id,
+            OrdemServico.status == "CONCLUIDA",
+            tipo.in_(("SERVICO", "PRODUTO")),
+        )
+        .group_by(tipo, ItemOrdem.descricao)
+        .subquery()
+    )
+    linhas = db.execute(
+        select(agrupados)
+        .where(agrupados.c.posicao <= TOP_ITENS)
+        .order_by(agrupados.c.tipo, agrupados.c.posicao)
+    ).all()
+
+    top: Dict[str, List[Dict[str, Any]]] = {"SERVICO": [], "PRODUTO": []}
+    for linha in linhas:
+        top[linha.tipo].append({
+            "descricao": linha.descricao,
+            "vezes": linha.vezes,
+            "quantidade": float(linha.quantidade),
+            "valor_total": float(linha.valor_total),
+        })
+    return top
+
+
+def montar_estatisticas_cliente(db: Session, cliente_id: int) -> Dict[str, Any]:
+    """Valores da linha de cliente_estatisticas, calculados no banco sobre as OS concluídas."""
+    filtro = and_(OrdemServico.cliente_id == cliente_id, OrdemServico.status == "CONCLUIDA")
+
+    resumo = db.execute(
+        select(
+            func.coalesce(func.sum(valor_servico_ordem()), 0).label("total_gasto"),
+            func.count(OrdemServico.id).filter(OrdemServico.tipo_ordem.in_(TIPOS_ORDEM_SERVICO)).label("total_servicos"),
+            func.count(OrdemServico.id).label("total_visitas"),
+            func.min(OrdemServico.data_conclusao).label("primeira_visita"),
+            func.max(OrdemServico.data_conclusao).label("ultima_visita"),
+        ).where(filtro)
+    ).one()
+    ultima_ordem = db.execute(
+        select(OrdemServico.id, OrdemServico.numero)
+        .where(filtro)
+        .order_by(OrdemServico.data_conclusao.desc().nullslast(), OrdemServico.id.desc())
+        .limit(1)
+    ).first()
+    top = _top_itens(db, cliente_id)
+
+    total_gasto = Decimal(str(resumo.total_gasto)).quantize(Decimal("0.01"))
+    ticket_medio = Decimal("0.00")
+    if resumo.total_servicos:
+        ticket_medio = (total_gasto / resumo.total_servicos).quantize(Decimal("0.01"))
+
+    frequencia_dias = None
+    if resumo.total_visitas > 1 and resumo.primeira_visita and resumo.ultima_visita:
+        intervalo = resumo.ultima_visita - resumo.primeira_visita
+        frequencia_dias = round(intervalo.total_seconds() / 86400 / (resumo.total_visitas - 1), 1)
+
+    return {
+        "cliente_id": cliente_id,
+        "total_gasto": total_gasto,
+        "total_servicos": resumo.total_servicos,
+        "total_visitas": resumo.total_visitas,
+        "ticket_medio": ticket_medio,
+        "frequencia_dias": frequencia_dias,
+        "primeira_visita": resumo.primeira_visita,
+        "ultima_visita": resumo.ultima_visita,
+        "ultima_ordem_id": ultima_ordem.id if ultima_ordem else None,
+        "ultima_ordem_numero": ultima_ordem.numero if ultima_ordem else None,
+        "top_servicos": json.dumps(top["SERVICO"], ensure_ascii=False),
+        "top_pecas": json.dumps(top["PRODUTO"], ensure_ascii=False),
+    }
+
+
+def atualizar_estatisticas_cliente(db: Session, cliente_id: int) -> Dict[str, Any]:
+    """Recalcula e grava (upsert) a linha do cliente. Não faz commit."""
+    valores = montar_estatisticas_cliente(db, cliente_id)
+    stmt = insert(ClienteEstatistica).values(**valores)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ClienteEstatistica.cliente_id],
+        set_={
+            **{coluna: stmt.excluded[coluna] for coluna in valores if coluna != "cliente_id"},
+            "updated_at": func.now(),
+        },
+    )
+    db.execute(stmt)
+    return valores
+
+
+def registrar_alteracao_estatisticas_cliente(db: Session, cliente_ids: Iterable[Optional[int]]) -> None:
+    """Regrava a projeção dos clientes informados após uma escrita já confirmada.
+
+    Falhas são apenas registradas em log: a projeção nunca deve derrubar a
+    operação principal, e a reconstrução corrige eventuais lacunas.
+    """
+    cliente_ids = sorted({cliente_id for cliente_id in cliente_ids if cliente_id})
+    try:
+        for cliente_id in cliente_ids:
+            atualizar_estatisticas_cliente(db, cliente_id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Erro ao atualizar estatísticas dos clientes %s", cliente_ids)
+
+
+def reconstruir_estatisticas_clientes(db: Session, tamanho_lote: int = TAMANHO_LOTE_RECONSTRUCAO) -> int:
+    """Recalcula a projeção de todos os clientes, com commit a cada lote."""
+    cliente_ids = [cliente_id for (cliente_id,) in db.query(Cliente.id).order_by(Cliente.id).all()]
+    for posicao, cliente_id in enumerate(cliente_ids, start=1):
+        atualizar_estatisticas_cliente(db, cliente_id)
+        if posicao % tamanho_lote == 0:
+            db.commit()
+            logger.info("Estatísticas reconstruídas para %s de %s clientes", posicao, len(cliente_ids))
+    db.commit()
+    return len(cliente_ids)
+
+
+def carregar_estatisticas_cliente(db: Session, cliente_id: int) -> Dict[str, Any]:
+    """Linha da projeção do cliente e a contagem de veículos ativos numa única consulta.
+
+    Sem linha (cliente ainda não reconstruído), calcula e grava na hora.
+    """
+    veiculos_count = (
+        select(func.count(Veiculo.id))
+        .where(Veiculo.cliente_id == cliente_id, Veiculo.ativo == True)
+        .scalar_subquery()
+    )
+    linha = db.execute(
+        select(ClienteEstatistica, veiculos_count.label("veiculos_count"))
+        .where(ClienteEstatistica.cliente_id == cliente_id)
+    ).first()
+
+    if linha is not None:
+        estatistica = linha.ClienteEstatistica
+        valores = {coluna.name: getattr(estatistica, coluna.name) for coluna in ClienteEstatistica.__table__.columns}
+        valores["veiculos_count"] = linha.veiculos_count
+    else:
+        try:
+            valores = atualizar_estatisticas_cliente(db, cliente_id)
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Erro ao gravar estatísticas do cliente %s", cliente_id)
+            valores = montar_estatisticas_cliente(db, cliente_id)
+        valores["updated_at"] = datetime.now()
+        valores["veiculos_count"] = db.execute(select(veiculos_count)).scalar()
+
+    valores["top_servicos"] = json.loads(valores["top_servicos"] or "[]")
+    valores["top_pecas"] = json.loads(valores["top_pecas"] or "[]")
+    return valores
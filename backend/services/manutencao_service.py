@@ -0,0 +1,75 @@
+"""
+Manutenções previstas a partir do histórico (manutencoes_historico).
+
+A previsão vigente de cada tipo de manutenção de um veículo é o registro mais
+recente daquele tipo (DISTINCT ON (veiculo_id, tipo), índice
+ix_manutencoes_historico_veiculo_tipo_data): registros anteriores do mesmo
+tipo já foram substituídos pela manutenção seguinte.
+
+A mesma subconsulta atende a um veículo (sugestões da ficha) e à frota
+inteira (lista de pendências para campanhas de recall), sempre numa única
+consulta.
+"""
+from datetime import date, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import aliased
+
+from models.autocare_models import ManutencaoHistorico, Veiculo
+
+# Antecedência, em km, para sugerir uma manutenção ainda não vencida
+MARGEM_KM_SUGESTAO = 1000
+# Antecedência, em dias, pela data prevista (lista da frota)
+MARGEM_DIAS_SUGESTAO = 30
+
+
+def ultimas_manutencoes(*filtros):
+    """Último registro com km_proxima de cada (veículo, tipo), como entidade ManutencaoHistorico."""
+    ultimas = (
+        select(ManutencaoHistorico)
+        .where(ManutencaoHistorico.km_proxima.isnot(None), *filtros)
+        .distinct(ManutencaoHistorico.veiculo_id, ManutencaoHistorico.tipo)
+        .order_by(
+            ManutencaoHistorico.veiculo_id,
+            ManutencaoHistorico.tipo,
+            ManutencaoHistorico.data_realizada.desc(),
+            ManutencaoHistorico.km_realizada.desc(),
+            ManutencaoHistorico.id.desc(),
+        )
+        .subquery()
+    )
+    return aliased(ManutencaoHistorico, ultimas)
+
+
+def km_restantes(manutencao):
+    """km_proxima - km atual do veículo (negativo quando já passou)."""
+    return manutencao.km_proxima - func.coalesce(Veiculo.km_atual, 0)
+
+
+def filtro_manutencao_pendente(manutencao, margem_km: int, margem_dias: Optional[int] = None):
+    """Vencida ou a vencer em até margem_km (ou margem_dias pela data prevista, se informado)."""
+    pela_km = km_restantes(manutencao) <= margem_km
+    if margem_dias is None:
+        return pela_km
+    return or_(pela_km, manutencao.data_proxima <= date.today() + timedelta(days=margem_dias))
+
+
+def descrever_sugestao(manutencao: ManutencaoHistorico, km_atual: int) -> Dict[str, Any]:
+    restantes = manutencao.km_proxima - km_atual
+    urgencia = "urgente" if restantes <= 0 else "proxima"
+    return {
+        "tipo": manutencao.tipo,
+        "ultima_realizacao": {
+            "km": manutencao.km_realizada,
+            "data": manutencao.data_realizada.isoformat()
+        },
+        "proxima_prevista": {
+            "km": manutencao.km_proxima,
+            "km_restantes": restantes,
+            "data": manutencao.data_proxima.isoformat() if manutencao.data_proxima else None,
+            "vencida_por_data": manutencao.data_proxima is not None and manutencao.data_proxima < date.today(),
+            "urgencia": urgencia
+        },
+        "mensagem": f"{'⚠️ Atrasada!' if restantes <= 0 else '🔔 Próxima'} {manutencao.tipo} - Última em {manutencao.km_realizada} km, prevista para {manutencao.km_proxima} km"
+    }
@@ -0,0 +1,167 @@
+"""
+Paginação por cursor (keyset) das listagens.
+
+O cursor é opaco para o cliente: base64 url-safe de um JSON com a chave de
+ordenação e o id do último registro da página. A página seguinte filtra
+(chave, id) < (valor, id) — ou > em ordem crescente — e percorre o índice a
+partir desse ponto, então custa o mesmo na página 1 e na página 500.
+
+As listagens continuam aceitando skip/limit (ou page/page_size); o cursor da
+próxima página é devolvido no cabeçalho X-Next-Cursor (listas) ou no campo
+next_cursor (respostas /paginado) e deve ser reenviado em after=.
+
+O total das respostas /paginado não custa um segundo scan: com filtros ele vem
+na mesma consulta da página (count(*) OVER ()); sem filtros cada endpoint
+fornece um total em cache. total_exato informa qual foi o caso.
+"""
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import and_, func, or_, tuple_
+
+# Tamanho máximo de página no modo cursor
+LIMITE_PAGINA_CURSOR = 200
+CABECALHO_PROXIMO_CURSOR = "X-Next-Cursor"
+
+
+def _serializar_valor(valor: Any) -> Any:
+    if isinstance(valor, datetime):
+        return {"dt": valor.isoformat()}
+    if isinstance(valor, date):
+        return {"d": valor.isoformat()}
+    if isinstance(valor, Decimal):
+        return {"n": str(valor)}
+    return valor
+
+
+def _desserializar_valor(valor: Any) -> Any:
+    if isinstance(valor, dict):
+        if "dt" in valor:
+            return datetime.fromisoformat(valor["dt"])
+        if "d" in valor:
+            return date.fromisoformat(valor["d"])
+        if "n" in valor:
+            return Decimal(valor["n"])
+    return valor
+
+
+def codificar_cursor(valores: Sequence[Any]) -> str:
+    conteudo = json.dumps([_serializar_valor(valor) for valor in valores], separators=(",", ":"))
+    return base64.urlsafe_b64encode(conteudo.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(cursor: str, quantidade_campos: int) -> List[Any]:
+    """Decodifica o cursor recebido em after=; responde 400 se ele não for válido para a listagem."""
+    try:
+        preenchimento = "=" * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + preenchimento).decode("utf-8"))
+        if not isinstance(valores, list) or len(valores) != quantidade_campos:
+            raise ValueError("quantidade de campos")
+        return [_desserializar_valor(valor) for valor in valores]
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor de paginação inválido"
+        )
+
+
+def limitar_pagina(limite: int) -> int:
+    return max(1, min(limite, LIMITE_PAGINA_CURSOR))
+
+
+def ordenar_keyset(query, chave, coluna_id, descendente: bool = True):
+    """Ordena por (chave, id), a mesma ordem usada pelo cursor. Com chave None, apenas por id."""
+    if chave is None:
+        return query.order_by(coluna_id.desc() if descendente else coluna_id.asc())
+    if descendente:
+        return query.order_by(chave.desc(), coluna_id.desc())
+    return query.order_by(chave.asc(), coluna_id.asc())
+
+
+def filtrar_apos_cursor(query, chave, coluna_id, after: str, descendente: bool = True):
+    """Mantém apenas os registros posteriores ao cursor na ordem (chave, id)."""
+    if chave is None:
+        (ultimo_id,) = decodificar_cursor(after, 1)
+        return query.filter(coluna_id < ultimo_id if descendente else coluna_id > ultimo_id)
+
+    ultimo_valor, ultimo_id = decodificar_cursor(after, 2)
+    if ultimo_valor is None:
+        # PostgreSQL ordena nulos primeiro em DESC e por último em ASC
+        if descendente:
+            return query.filter(or_(and_(chave.is_(None), coluna_id < ultimo_id), chave.isnot(None)))
+        return query.filter(chave.is_(None), coluna_id > ultimo_id)
+    if descendente:
+        return query.filter(tuple_(chave, coluna_id) < tuple_(ultimo_valor, ultimo_id))
+    return query.filter(or_(tuple_(chave, coluna_id) > tuple_(ultimo_valor, ultimo_id), chave.is_(None)))
+
+
+def proximo_cursor(itens: Sequence[Any], limite: int, valores_cursor: Callable[[Any], Sequence[Any]]) -> Optional[str]:
+    """Cursor da página seguinte, ou None quando a página veio incompleta (fim da listagem)."""
+    if not itens or len(itens) < limite:
+        return None
+    return codificar_cursor(valores_cursor(itens[-1]))
+
+
+def definir_cabecalho_cursor(response: Response, cursor: Optional[str]) -> None:
+    if cursor:
+        response.headers[CABECALHO_PROXIMO_CURSOR] = cursor
+
+
+@dataclass
+class PaginaComTotal:
+    itens: List[Any]
+    total: int
+    total_exato: bool
+
+
+def buscar_pagina_com_total(query, limite: int, deslocamento: int = 0) -> Tuple[List[Any], Optional[int]]:
+    """Busca a página e o total de linhas filtradas na mesma consulta; total None se a página vier vazia."""
+    linhas = query.add_columns(func.count().over()).offset(deslocamento).limit(limite).all()
+    if not linhas:
+        return [], None
+    return [linha[0] for linha in linhas], int(linhas[0][-1])
+
+
+def paginar_com_total(
+    query,
+    pagina: int,
+    tamanho_pagina: int,
+    after: Optional[str],
+    chave,
+    coluna_id,
+    filtrado: bool,
+    total_sem_filtros: Callable[[], Tuple[int, bool]],
+) -> PaginaComTotal:
+    """Página ordenada por (chave, id) com o total calculado pela estratégia mais barata.
+
+    - sem filtros: total_sem_filtros() (total em cache do endpoint);
+    - com filtros: count(*) OVER () na própria consulta da página. Em modo cursor
+      a janela conta apenas o que resta após o cursor, então o total é
+      aproximado pelas páginas anteriores mais o restante.
+    """
+    deslocamento = (pagina - 1) * tamanho_pagina
+    query = ordenar_keyset(query, chave, coluna_id)
+    if after:
+        query = filtrar_apos_cursor(query, chave, coluna_id, after)
+
+    deslocamento_consulta = 0 if after else deslocamento
+
+    if not filtrado:
+        itens = query.offset(deslocamento_consulta).limit(tamanho_pagina).all()
+        total, exato = total_sem_filtros()
+        return PaginaComTotal(itens, total, exato)
+
+    itens, total_janela = buscar_pagina_com_total(query, tamanho_pagina, deslocamento_consulta)
+    if after:
+        return PaginaComTotal(itens, deslocamento + (total_janela or 0), False)
+    if total_janela is None:
+        # Página além do fim: só aqui é preciso contar à parte
+        total = query.order_by(None).count() if deslocamento else 0
+        return PaginaComTotal(itens, total, True)
+    return PaginaComTotal(itens, total_janela, True)
@@ -0,0 +1,55 @@
+"""
+Placa canônica de veículos.
+
+veiculos.placa_normalizada é uma coluna gerada pelo banco (maiúsculas, apenas
+letras e números) com índice único em text_pattern_ops: serve tanto à busca
+exata quanto à busca por prefixo (LIKE 'ABC1%') sem varrer a tabela.
+
+Placas no padrão antigo (ABC1234) e Mercosul (ABC1C34) do mesmo veículo diferem
+apenas no 5º caractere (dígito 0-9 <-> letra A-J), então as buscas consideram
+as duas grafias.
+"""
+import re
+from typing import List
+
+from sqlalchemy import or_
+
+from models.autocare_models import Veiculo
+
+LIMITE_SUGESTOES_PLACA = 20
+
+_POSICAO_MERCOSUL = 4
+
+
+def normalizar_placa(placa: str) -> str:
+    """Mesma regra da coluna gerada: maiúsculas, apenas letras e números."""
+    return re.sub(r"[^A-Z0-9]", "", (placa or "").upper())
+
+
+def variantes_placa(placa_normalizada: str) -> List[str]:
+    """Grafias equivalentes (antiga e Mercosul) de uma placa ou prefixo já normalizado."""
+    variantes = [placa_normalizada]
+    if len(placa_normalizada) <= _POSICAO_MERCOSUL or not placa_normalizada[:3].isalpha():
+        return variantes
+
+    caractere = placa_normalizada[_POSICAO_MERCOSUL]
+    if caractere.isdigit():
+        convertido = chr(ord("A") + int(caractere))
+    elif "A" <= caractere <= "J":
+        convertido = str(ord(caractere) - ord("A"))
+    else:
+        return variantes
+    variantes.append(placa_normalizada[:_POSICAO_MERCOSUL] + convertido + placa_normalizada[_POSICAO_MERCOSUL + 1:])
+    return variantes
+
+
+def filtro_placa_exata(placa: str):
+    return Veiculo.placa_normalizada.in_(variantes_placa(normalizar_placa(placa)))
+
+
+def filtro_placa_prefixo(prefixo: str):
+    # O prefixo normalizado só tem letras e números, então não há curingas a escapar
+    return or_(*[
+        Veiculo.placa_normalizada.like(f"{variante}%")
+        for variante in variantes_placa(normalizar_placa(prefixo))
+    ])
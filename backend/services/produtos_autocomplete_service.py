@@ -0,0 +1,315 @@
+"""
+Índice em memória para o autocomplete de produtos da OS.
+
+Cada worker mantém o catálogo ativo (codigo, nome, descricao, preço e estoque)
+num índice invertido de tokens sem acento: cada token da busca casa por prefixo
+com algum token do produto (busca por bisect numa lista ordenada de tokens) e os
+resultados são ranqueados por código exato, prefixo de código, prefixo de nome e
+nome em ordem alfabética.
+
+Consistência entre workers via Redis:
+
+- toda sessão que altera produtos (ORM ou UPDATE em lote da baixa de estoque)
+  publica, após o commit, os ids alterados num sorted set cujo score é uma
+  versão global incrementada atomicamente (script Lua);
+- antes de cada busca o worker lê os ids com score acima da última versão vista
+  e recarrega só esses produtos do banco.
+
+Sem Redis o worker recarrega o catálogo inteiro no máximo a cada
+INTERVALO_RECARGA_SEM_REDIS segundos.
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+from itertools import chain
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from db import redis_client
+from models.autocare_models import Produto
+from services.busca_texto_service import remover_acentos
+
+logger = logging.getLogger(__name__)
+
+CHAVE_VERSAO = "autocare:produtos_autocomplete:versao"
+CHAVE_ALTERADOS = "autocare:produtos_autocomplete:alterados"
+INTERVALO_RECARGA_SEM_REDIS = 30
+CHAVE_SESSAO_ALTERADOS = "produtos_alterados"
+
+# INCR da versão e ZADD dos ids na mesma operação: um leitor nunca vê a versão
+# nova sem os ids correspondentes
+_SCRIPT_PUBLICAR = """
+local versao = redis.call('INCR', KEYS[1])
+for _, produto_id in ipairs(ARGV) do
+    redis.call('ZADD', KEYS[2], versao, produto_id)
+end
+return versao
+"""
+_publicar_script = redis_client.register_script(_SCRIPT_PUBLICAR)
+
+_RE_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def normalizar_texto(texto: Optional[str]) -> str:
+    return remover_acentos(texto or "").lower()
+
+
+def tokenizar(texto: Optional[str]) -> List[str]:
+    return _RE_TOKEN.findall(normalizar_texto(texto))
+
+
+@dataclass
+class ProdutoIndexado:
+    id: int
+    codigo: str
+    nome: str
+    descricao: Optional[str]
+    preco_venda: Decimal
+    quantidade_atual: int
+    unidade: str
+    codigo_compacto: str
+    nome_normalizado: str
+    tokens_nome: FrozenSet[str]
+    tokens: FrozenSet[str]
+
+    @classmethod
+    def de_linha(cls, linha) -> "ProdutoIndexado":
+        tokens_codigo = tokenizar(linha.codigo)
+        tokens_nome = tokenizar(linha.nome)
+        codigo_compacto = "".join(tokens_codigo)
+        return cls(
+            id=linha.id,
+            codigo=linha.codigo,
+            nome=linha.nome,
+            descricao=linha.descricao,
+            preco_venda=linha.preco_venda,
+            quantidade_atual=linha.quantidade_atual or 0,
+            unidade=linha.unidade or "UN",
+            codigo_compacto=codigo_compacto,
+            nome_normalizado=" ".join(tokens_nome),
+            tokens_nome=frozenset(tokens_nome),
+            tokens=frozenset(chain(tokens_codigo, [codigo_compacto] if codigo_compacto else [], tokens_nome, tokenizar(linha.descricao))),
+        )
+
+    def relevancia(self, tokens_busca: List[str]) -> int:
+        """Menor é melhor: código exato, prefixo do código, prefixo do nome, todos os termos no nome, demais."""
+        compacto = "".join(tokens_busca)
+        if self.codigo_compacto == compacto:
+            return 0
+        if self.codigo_compacto.startswith(compacto):
+            return 1
+        if self.nome_normalizado.startswith(" ".join(tokens_busca)):
+            return 2
+        if all(any(token_nome.startswith(token) for token_nome in self.tokens_nome) for token in tokens_busca):
+            return 3
+        return 4
+
+    def resposta(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "codigo": self.codigo,
+            "nome": self.nome,
+            "descricao": self.descricao,
+            "preco_venda": self.preco_venda,
+            "quantidade_atual": self.quantidade_atual,
+            "unidade": self.unidade,
+        }
+
+
+def _consultar_produtos(db: Session, produto_ids: Optional[Iterable[int]] = None):
+    query = db.query(
+        Produto.id,
+        Produto.codigo,
+        Produto.nome,
+        Produto.descricao,
+        Produto.preco_venda,
+        Produto.quantidade_atual,
+        Produto.unidade,
+    ).filter(Produto.ativo == True)
+    if produto_ids is not None:
+        query = query.filter(Produto.id.in_(list(produto_ids)))
+    return query.all()
+
+
+class IndiceProdutos:
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._produtos: Dict[int, ProdutoIndexado] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._tokens_ordenados: List[str] = []
+        self._tokens_desatualizados = False
+        self._versao: Optional[int] = None
+        self._carregado_em = 0.0
+        self._pendentes: Set[int] = set()
+
+    # ------------------------------------------------------------------
+    # Manutenção
+    # ------------------------------------------------------------------
+    def _adicionar(self, produto: ProdutoIndexado) -> None:
+        self._remover(produto.id)
+        self._produtos[produto.id] = produto
+        for token in produto.tokens:
+            ids = self._postings.get(token)
+            if ids is None:
+                self._postings[token] = ids = set()
+                self._tokens_desatualizados = True
+            ids.add(produto.id)
+
+    def _remover(self, produto_id: int) -> None:
+        produto = self._produtos.pop(produto_id, None)
+        if produto is None:
+            return
+        for token in produto.tokens:
+            ids = self._postings.get(token)
+            if ids is None:
+                continue
+            ids.discard(produto_id)
+            if not ids:
+                del self._postings[token]
+                self._tokens_desatualizados = True
+
+    def _carregar_tudo(self, db: Session, versao: Optional[int]) -> None:
+        linhas = _consultar_produtos(db)
+        self._produtos.clear()
+        self._postings.clear()
+        for linha in linhas:
+            self._adicionar(ProdutoIndexado.de_linha(linha))
+        self._tokens_desatualizados = True
+        self._pendentes.clear()
+        self._versao = versao
+        self._carregado_em = time.monotonic()
+        logger.info("Índice de autocomplete carregado com %s produtos (versão %s)", len(self._produtos), versao)
+
+    def _recarregar(self, db: Session, produto_ids: Set[int]) -> None:
+        encontrados = set()
+        for linha in _consultar_produtos(db, produto_ids):
+            self._adicionar(ProdutoIndexado.de_linha(linha))
+            encontrados.add(linha.id)
+        # Inativados ou removidos saem do índice
+        for produto_id in produto_ids - encontrados:
+            self._remover(produto_id)
+
+    def marcar_pendentes(self, produto_ids: Iterable[int]) -> None:
+        """Alterações feitas neste worker: aplicadas na próxima busca mesmo sem Redis."""
+        with self._trava:
+            self._pendentes.update(produto_ids)
+
+    def sincronizar(self, db: Session) -> None:
+        with self._trava:
+            try:
+                pipe = redis_client.pipeline(transaction=False)
+                pipe.get(CHAVE_VERSAO)
+                pipe.zrangebyscore(CHAVE_ALTERADOS, f"({self._versao or 0}", "+inf", withscores=True)
+                versao_atual, alterados = pipe.execute()
+                versao_atual = int(versao_atual or 0)
+            except Exception as exc:
+                logger.warning("Redis indisponível para o índice de autocomplete: %s", exc)
+                if time.monotonic() - self._carregado_em > INTERVALO_RECARGA_SEM_REDIS:
+                    self._carregar_tudo(db, self._versao)
+                elif self._pendentes:
+                    self._recarregar(db, set(self._pendentes))
+                    self._pendentes.clear()
+                return
+
+            # Primeira carga, ou versão que voltou atrás (Redis reiniciado/limpo)
+            if self._versao is None or versao_atual < self._versao:
+                self._carregar_tudo(db, versao_atual)
+                return
+
+            produto_ids = {int(produto_id) for produto_id, _versao in alterados} | self._pendentes
+            if produto_ids:
+                self._recarregar(db, produto_ids)
+                self._pendentes.clear()
+            if alterados:
+                self._versao = max(int(versao) for _produto_id, versao in alterados)
+
+    # ------------------------------------------------------------------
+    # Busca
+    # ------------------------------------------------------------------
+    def _ids_com_prefixo(self, prefixo: str) -> Set[int]:
+        if self._tokens_desatualizados:
+            self._tokens_ordenados = sorted(self._postings)
+            self._tokens_desatualizados = False
+        ids: Set[int] = set()
+        inicio = bisect.bisect_left(self._tokens_ordenados, prefixo)
+        for token in self._tokens_ordenados[inicio:]:
+            if not token.startswith(prefixo):
+                break
+            ids |= self._postings[token]
+        return ids
+
+    def buscar(self, termo: str, limite: int) -> List[Dict[str, Any]]:
+        tokens_busca = tokenizar(termo)
+        with self._trava:
+            if tokens_busca:
+                candidatos: Optional[Set[int]] = None
+                for token in tokens_busca:
+                    ids = self._ids_com_prefixo(token)
+                    candidatos = ids if candidatos is None else candidatos & ids
+                    if not candidatos:
+                        return []
+                produtos = [self._produtos[produto_id] for produto_id in candidatos]
+            else:
+                produtos = list(self._produtos.values())
+
+        # Autocomplete da OS só oferece produtos com estoque
+        produtos = [produto for produto in produtos if produto.quantidade_atual > 0]
+        if tokens_busca:
+            produtos.sort(key=lambda produto: (produto.relevancia(tokens_busca), produto.nome_normalizado, produto.id))
+        else:
+            produtos.sort(key=lambda produto: (produto.nome_normalizado, produto.id))
+        return [produto.resposta() for produto in produtos[:max(limite, 0)]]
+
+
+indice_produtos = IndiceProdutos()
+
+
+def autocompletar_produtos(db: Session, termo: str, limite: int) -> List[Dict[str, Any]]:
+    indice_produtos.sincronizar(db)
+    return indice_produtos.buscar(termo, limite)
+
+
+# ----------------------------------------------------------------------
+# Publicação das alterações
+# ----------------------------------------------------------------------
+def marcar_produtos_alterados(db: Session, produto_ids: Iterable[int]) -> None:
+    """Registra produtos alterados fora do ORM (UPDATE em lote); publicados no commit da sessão."""
+    db.info.setdefault(CHAVE_SESSAO_ALTERADOS, set()).update(produto_ids)
+
+
+def publicar_produtos_alterados(produto_ids: Iterable[int]) -> None:
+    produto_ids = sorted(set(produto_ids))
+    if not produto_ids:
+        return
+    indice_produtos.marcar_pendentes(produto_ids)
+    try:
+        _publicar_script(keys=[CHAVE_VERSAO, CHAVE_ALTERADOS], args=produto_ids)
+    except Exception as exc:
+        logger.warning("Falha ao publicar alteração de produtos %s: %s", produto_ids, exc)
+
+
+@event.listens_for(Session, "after_flush")
+def _coletar_produtos_alterados(session: Session, _flush_context) -> None:
+    produto_ids = [
+        objeto.id
+        for objeto in chain(session.new, session.dirty, session.deleted)
+        if isinstance(objeto, Produto) and objeto.id is not None
+    ]
+    if produto_ids:
+        marcar_produtos_alterados(session, produto_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _publicar_apos_commit(session: Session) -> None:
+    publicar_produtos_alterados(session.info.pop(CHAVE_SESSAO_ALTERADOS, ()))
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_apos_rollback(session: Session) -> None:
+    session.info.pop(CHAVE_SESSAO_ALTERADOS, None)